@@ -1,18 +1,32 @@
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO
-import asyncio
+from flask import Flask, Response, g, render_template, jsonify, request, stream_with_context
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import importlib
 import json
-import websockets
-from datetime import datetime, timedelta
-import pandas as pd
-from threading import Thread
-from hyperliquid.info import Info
-import psycopg2
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 import time
-import requests
-from collections import defaultdict
 import os
 from dotenv import load_dotenv
+from fill_store import FillStore
+from subscription_manager import WS_URL, SubscriptionManager
+from trade_history import TradeHistoryBook
+from cache import TTLCache
+from hl_client import InfoClient
+from price_feed import MidPriceService, unrealized_pnl_from_mids
+from live_pnl import LivePnlEngine
+from funding_ledger import FundingLedger
+from db import Database
+from price_history import PriceHistoryService
+from coin_index import CoinIndex, price_multiplier
+from streaming import FORMATS, stream_response
+from metrics import SamplingProfiler, registry
+from ingest import FillIngest
+from co_entry import DAY_MS, REPLAY_DAYS, CoEntryDetector, replay, stored_history
+from warmup import Lazy, WarmUp
+
+# pandas / numpy / pyarrow 只在用到的路由或預熱階段才載入，import 本模組保持輕量
+ANALYTICS_MODULES = ('pnl_analytics', 'trade_merge', 'pnl_aggregates', 'leaderboard', 'fill_archive')
 
 # 加載環境變量
 load_dotenv()
@@ -22,95 +36,326 @@ socketio = SocketIO(app)
 
 # 從環境變量讀取配置
 COINGECKO_API_KEY = os.getenv('COINGECKO_API_KEY')
-DB_NAME = os.getenv('DB_NAME', 'wallet_tracker')
-DB_USER = os.getenv('DB_USER', 'postgres')
-DB_PASSWORD = os.getenv('DB_PASSWORD', '')
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_PORT = os.getenv('DB_PORT', '5432')
-
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT
-    )
-
-# Hyperliquid WebSocket endpoint
-WS_URL = "wss://api.hyperliquid.xyz/ws"
-
-class TradeHistory:
-    def __init__(self):
-        self.trades = []
-        self.known_trades = set()
-
-    def add_trade(self, trade):
-        trade_id = trade.get("id")
-        if trade_id not in self.known_trades:
-            self.known_trades.add(trade_id)
-            self.trades.append(trade)
-            # Sort trades by timestamp
-            self.trades.sort(key=lambda x: x.get("time", 0), reverse=True)
-            # Keep only last 1000 trades
-            self.trades = self.trades[:1000]
-            return True
-        return False
-
-trade_history = TradeHistory()
-
-async def fetch_trade_history(wallet_address):
-    async with websockets.connect(WS_URL) as websocket:
-        # Subscribe to user events
-        subscribe_message = {
-            "method": "subscribe",
-            "params": {
-                "type": "user_events",
-                "user": wallet_address
-            }
-        }
-        
-        await websocket.send(json.dumps(subscribe_message))
-        print(f"Tracking wallet: {wallet_address}")
-        
-        while True:
+APP_HOST = os.getenv('APP_HOST', '127.0.0.1')
+APP_PORT = int(os.getenv('APP_PORT', '8080'))
+# 設 FLASK_DEBUG=1 才開 debug 和 reloader（會多起一個進程）
+APP_DEBUG = os.getenv('FLASK_DEBUG') == '1'
+DEFAULT_WALLET = "0xd5f7974e1be5b336094a18c230f39607934e367d"
+# 預熱時最多預先同步這麼多個收藏錢包
+WARMUP_WALLETS = int(os.getenv('WARMUP_WALLETS', '50'))
+
+# 共用的 Postgres 連線池（DB_* 環境變量見 db.py）
+db = Database()
+
+# 本地優先的 CoinGecko 歷史價格，只向上游補缺口
+price_history = PriceHistoryService(api_key=COINGECKO_API_KEY)
+
+# 幣種符號到 CoinGecko id 的索引，從 token_list.csv 預先建好
+coin_index = Lazy(CoinIndex.load)
+MAX_COIN_LOOKUP = 500
+
+# 全局共用的 Hyperliquid info 客戶端（連線池、請求合併、短期緩存）
+info = InfoClient()
+
+# 本地成交緩存，只向上游拉取高水位之後的新成交
+fill_store = FillStore()
+
+def load_fill_archive():
+    from fill_archive import FillArchive, archive_available
+    return FillArchive() if archive_available() else None
+
+# 有 pyarrow 時按月存成 Parquet，分析只讀需要的月份和欄位
+fill_archive = Lazy(load_fill_archive)
+
+def wallet_fills(address, start_time=None, end_time=None, columns=None):
+    fill_store.refresh(info, address, start_time)
+    return stored_fills(address, start_time, end_time, columns)
+
+def stored_fills(address, start_time=None, end_time=None, columns=None):
+    # 只讀本地，不向上游同步
+    archive = fill_archive()
+    if archive is None:
+        return fill_store.query(address, start_time, end_time)
+    archive.sync(fill_store, address)
+    return archive.frame(address, start_time, end_time, columns)
+
+# 本地資金費賬本，每個結算整點最多向上游補一次，窗口合計由累計和得出
+funding_ledger = FundingLedger()
+
+def load_pnl_aggregates():
+    from pnl_aggregates import PnlAggregates
+    return PnlAggregates(info, fill_store, funding_ledger)
+
+# 每個錢包按日彙總的盈虧，窗口合計由前綴和直接得出
+pnl_aggregates = Lazy(load_pnl_aggregates)
+SUMMARY_WINDOWS = [('7d', 7), ('30d', 30), ('90d', 90)]
+
+# 按小時合併後的成交表，供翻頁重用
+merged_trades_cache = TTLCache(maxsize=256, ttl=int(os.getenv('MERGED_TRADES_TTL', '60')))
+
+# 每個錢包一個有界的成交窗口
+trade_history = TradeHistoryBook()
+
+def format_trade(trade, epoch_ms=False):
+    return {
+        'timestamp': trade.time if epoch_ms else datetime.fromtimestamp(trade.time / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+        'coin': trade.coin,
+        'side': trade.side,
+        'size': trade.sz,
+        'price': trade.px
+    }
+
+# WebSocket 循環只把成交放進有界隊列，每 50ms 批量推送一次 new_trades
+# 多個追蹤錢包在短時間內同向開倉同一幣種時推送 co_entry 事件
+co_entries = CoEntryDetector()
+ingest = FillIngest(socketio, trade_history, format_trade, detector=co_entries)
+
+def handle_fills(address, fills):
+    ingest.put(address, fills)
+
+# 所有錢包共用少量 WebSocket 連線
+subscriptions = SubscriptionManager(WS_URL)
+
+# 由 allMids 推送維護的中間價表
+prices = MidPriceService(info)
+prices.attach(subscriptions)
+
+# 有訂閱者的錢包由推送增量更新盈虧，按地址分房間推送
+live_pnl = LivePnlEngine(info, fill_store, funding_ledger, prices, subscriptions, socketio)
+
+@socketio.on('track_pnl')
+def on_track_pnl(data):
+    address = (data or {}).get('address')
+    if not address:
+        return
+    join_room(address.lower())
+    try:
+        emit('pnl_update', live_pnl.track(address, request.sid))
+    except Exception as e:
+        emit('pnl_update', {'address': address.lower(), 'error': str(e)})
+
+@socketio.on('untrack_pnl')
+def on_untrack_pnl(data):
+    address = (data or {}).get('address')
+    if not address:
+        return
+    leave_room(address.lower())
+    live_pnl.untrack(address, request.sid)
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    live_pnl.untrack_sid(request.sid)
+
+# 路由延遲、分析耗時和各組件狀態，以 Prometheus 文本格式輸出到 /metrics
+ROUTE_SECONDS = registry.histogram('http_request_seconds', 'Route latency until the response is returned',
+                                   ('route', 'method', 'status'))
+STAGE_SECONDS = registry.histogram('analytics_stage_seconds', 'Time spent loading fills and in pandas/numpy analytics',
+                                   ('stage',))
+# 設定 ENABLE_PROFILER=1 後，請求加上 ?profile=1 會返回採樣到的調用棧
+ENABLE_PROFILER = os.getenv('ENABLE_PROFILER') == '1'
+
+registry.collected('cache_hits_total', 'Cache hits', lambda: {
+    ('hl_info',): info.cache.hits, ('merged_trades',): merged_trades_cache.hits}, 'counter', ('cache',))
+registry.collected('cache_misses_total', 'Cache misses', lambda: {
+    ('hl_info',): info.cache.misses, ('merged_trades',): merged_trades_cache.misses}, 'counter', ('cache',))
+registry.collected('ws_messages_total', 'WebSocket messages received', lambda: {
+    (str(channel),): count for channel, count in subscriptions.messages_by_channel.items()}, 'counter', ('channel',))
+registry.collected('ws_fills_total', 'Fills received over WebSocket', lambda: subscriptions.fills, 'counter')
+registry.collected('ws_reconnects_total', 'WebSocket reconnects', lambda: subscriptions.stats()['reconnects'], 'counter')
+registry.collected('ws_connections', 'WebSocket connections by state', lambda: {
+    ('open',): subscriptions.stats()['connections'], ('connected',): subscriptions.stats()['connected']},
+    labelnames=('state',))
+registry.collected('ws_subscriptions', 'Wallet subscriptions', lambda: subscriptions.stats()['subscriptions'])
+registry.collected('ws_pending_handlers', 'Fill handlers scheduled but not finished',
+                   lambda: subscriptions.pending_handlers)
+registry.collected('ingest_queue_depth', 'Fills waiting to be emitted', lambda: len(ingest))
+registry.collected('ingest_queue_max_depth', 'Highest queue depth seen', lambda: ingest.max_depth)
+registry.collected('ingest_enqueued_total', 'Fills accepted into the ingest queue', lambda: ingest.enqueued, 'counter')
+registry.collected('ingest_dropped_total', 'Fills dropped by the ingest queue', lambda: {
+    (reason,): count for reason, count in ingest.dropped.items()}, 'counter', ('reason',))
+registry.collected('ingest_duplicates_total', 'Fills already in the trade history', lambda: ingest.duplicates, 'counter')
+registry.collected('ingest_emitted_trades_total', 'Trades emitted to clients', lambda: ingest.emitted_trades, 'counter')
+registry.collected('ingest_batches_total', 'new_trades events emitted', lambda: ingest.emitted_batches, 'counter')
+registry.collected('mid_price_age_seconds', 'Seconds since the last allMids update', lambda: prices.table.age())
+registry.collected('mid_price_rest_fallbacks_total', 'REST allMids calls made because the stream was stale',
+                   lambda: prices.rest_fallbacks, 'counter')
+registry.collected('co_entry_signals_total', 'Co-entry signals emitted', lambda: co_entries.signals, 'counter')
+registry.collected('co_entry_windows', '(coin, dir) pairs with entries inside the window',
+                   lambda: len(co_entries.windows))
+registry.collected('live_pnl_wallets', 'Wallets with live PnL subscribers', lambda: len(live_pnl.wallets))
+registry.collected('pnl_aggregate_wallets', 'Wallets with daily PnL buckets in memory',
+                   lambda: len(pnl_aggregates.peek(())))
+registry.collected('pnl_aggregate_seeds_total', 'Wallets built from their full fill history',
+                   lambda: getattr(pnl_aggregates.peek(), 'seeds', 0), 'counter')
+registry.collected('funding_ledger_wallets', 'Wallets with funding sums in memory', lambda: len(funding_ledger))
+registry.collected('funding_ledger_upstream_calls_total', 'userFunding pages fetched by the funding ledger',
+                   lambda: funding_ledger.upstream_calls, 'counter')
+registry.collected('funding_ledger_batches_total', 'Hourly watchlist funding refreshes',
+                   lambda: funding_ledger.batches, 'counter')
+registry.collected('price_history_upstream_calls_total', 'CoinGecko calls made by the price history cache',
+                   lambda: price_history.upstream_calls, 'counter')
+registry.collected('db_pool_connections', 'Postgres pool connections by state', lambda: {
+    (state,): db.stats()[key] for state, key in (('in_use', 'in_use'), ('open', 'open'), ('max', 'max_connections'))},
+    labelnames=('state',))
+registry.collected('db_pool_waits_total', 'Times a caller waited for a free pooled connection',
+                   lambda: db.waits, 'counter')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if ENABLE_PROFILER and request.args.get('profile'):
+        g.profiler = SamplingProfiler().start()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        ROUTE_SECONDS.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        # 以 folded stacks 格式返回，可直接餵給 flamegraph 工具
+        profiler.stop()
+        return Response(profiler.folded(), mimetype='text/plain', headers={'X-Profile-Samples': str(profiler.samples)})
+    return response
+
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def load_analytics():
+    for name in ANALYTICS_MODULES:
+        importlib.import_module(name)
+    pnl_aggregates()
+    fill_archive()
+
+def prime_wallets(addresses):
+    # 先同步成交，再建好按日彙總和資金費賬本，第一個請求不用等上游
+    def prime(address):
+        fill_store.refresh(info, address)
+        pnl_aggregates().windows(address, SUMMARY_WINDOWS, refresh=False)
+
+    # 單個錢包失敗只記錄，不影響其他錢包；返回失敗的錢包
+    from leaderboard import LEADERBOARD_WORKERS
+    errors = []
+    with ThreadPoolExecutor(max_workers=LEADERBOARD_WORKERS) as pool:
+        futures = {pool.submit(prime, address): address for address in addresses}
+        for future in as_completed(futures):
             try:
-                response = await websocket.recv()
-                data = json.loads(response)
-                
-                if "data" in data and "fills" in data["data"]:
-                    for fill in data["data"]["fills"]:
-                        if trade_history.add_trade(fill):
-                            # Emit new trade to connected clients
-                            socketio.emit('new_trade', {
-                                'timestamp': datetime.fromtimestamp(fill.get("time", 0) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
-                                'coin': fill.get("coin", "Unknown"),
-                                'side': fill.get("side", "Unknown"),
-                                'size': fill.get("size", 0),
-                                'price': fill.get("price", 0)
-                            })
+                future.result()
             except Exception as e:
-                print(f"Error: {e}")
-                break
+                print(f"Error priming {futures[future]}: {e}")
+                errors.append({'address': futures[future], 'error': str(e)})
+    if errors:
+        print(f"Primed {len(addresses) - len(errors)} of {len(addresses)} wallets")
+    return errors
+
+def warm_wallets(handler):
+    # 建表並打開連線池，訂閱收藏的錢包，預先同步默認錢包和前 WARMUP_WALLETS 個收藏
+    try:
+        db.ensure_schema()
+        addresses = db.favorite_address_list()
+    except Exception:
+        prime_wallets([DEFAULT_WALLET])
+        raise
+    for address in addresses:
+        subscriptions.add_wallet(address, handler)
+    prime_wallets(list(dict.fromkeys([DEFAULT_WALLET] + [a.lower() for a in addresses]))[:WARMUP_WALLETS + 1])
+
+def create_warmup(handler):
+    """Boot steps run before /readyz reports ready; `handler` receives the favorites' fills."""
+    warmup = WarmUp()
+    warmup.add('analytics', load_analytics)
+    warmup.add('hl_meta', info.meta)
+    warmup.add('mids', prices.mids)
+    warmup.add('coin_index', coin_index)
+    warmup.add('wallets', warm_wallets, handler)
+    return warmup
 
-def run_websocket(wallet_address):
-    asyncio.run(fetch_trade_history(wallet_address))
+warmup = create_warmup(handle_fills)
+
+registry.collected('warmup_step_seconds', 'Time each boot warm-up step took', lambda: {
+    (name,): result['seconds'] for name, result in warmup.results.items()}, labelnames=('step',))
+registry.collected('app_ready', '1 once the boot warm-up has finished', lambda: int(warmup.ready.is_set()))
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background():
+    """Start subscriptions, fill ingest, the hourly funding refresh and the warm-up, once.
+
+    `python app.py` calls this before serving; anything else that serves
+    `app` (a WSGI server, `flask run`, the benchmarks) gets it from the first
+    request, or can call it itself.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    # Track the default wallet over shared connections; favorites are added by the warm-up
+    subscriptions.add_wallet(DEFAULT_WALLET, handle_fills)
+    subscriptions.start()
+    ingest.start()
+    # 每個整點結算後一次併發刷新所有追蹤錢包的資金費
+    funding_ledger.start(info, lambda: subscriptions.addresses)
+    # 先開始監聽，預熱在背景完成後 /readyz 才返回 200
+    warmup.start()
+
+@app.before_request
+def ensure_background():
+    # 非 __main__ 啟動時由第一個請求（通常是 /readyz 探針）帶起背景任務
+    if not _background_started:
+        start_background()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def response_format():
+    # None 表示原本的輸出；json/ndjson 為串流輸出，時間戳為 epoch 毫秒
+    fmt = request.args.get('format')
+    if fmt is not None and fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    return fmt
+
+def parse_int(name, value, default=None):
+    # 兩個服務共用：格式錯誤返回 400，不悄悄退回默認值
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer') from None
+
+def int_arg(name, default=None):
+    return parse_int(name, request.args.get(name), default)
+
+def requested_windows():
+    # ?window=1d,7d,30d；沒帶參數時為 None
+    from pnl_aggregates import parse_windows
+    value = request.args.get('window')
+    return None if value is None else parse_windows(value)
+
 @app.route('/api/trades')
 def get_trades():
-    trades = []
-    for trade in trade_history.trades:
-        trades.append({
-            'timestamp': datetime.fromtimestamp(trade.get("time", 0) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
-            'coin': trade.get("coin", "Unknown"),
-            'side': trade.get("side", "Unknown"),
-            'size': trade.get("size", 0),
-            'price': trade.get("price", 0)
-        })
+    address = request.args.get('address')
+    try:
+        fmt = response_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if fmt is not None:
+        return stream_response(fmt, (format_trade(trade, epoch_ms=True) for trade in trade_history.trades(address)))
+    trades = [format_trade(trade) for trade in trade_history.trades(address)]
     return jsonify(trades)
 
 @app.route('/api/user_state')
@@ -119,7 +364,6 @@ def get_user_state():
     if not address:
         return jsonify({'error': 'No address provided'}), 400
     try:
-        info = Info()
         user_data = info.user_state(address)
         return jsonify(user_data)
     except Exception as e:
@@ -128,59 +372,36 @@ def get_user_state():
 @app.route('/api/trades_by_address')
 def get_trades_by_address():
     address = request.args.get('address')
-    page = int(request.args.get('page', 1))
-    limit = 20
-    start_time = request.args.get('start_time', type=int)
-    end_time = request.args.get('end_time', type=int)
     if not address:
         return jsonify({'error': 'No address provided'}), 400
     try:
-        info = Info()
-        if start_time:
-            fills = info.user_fills_by_time(address, start_time, end_time)
-        else:
-            fills = info.user_fills(address)
-        # 合併：coin, dir, 小時
-        merged = defaultdict(lambda: {'sz': 0, 'closedPnl': 0, 'px_sum': 0, 'px_weight': 0, 'count': 0, 'first_time': None, 'last_time': None})
-        for fill in fills:
-            coin = fill.get('coin', 'Unknown')
-            dir_ = fill.get('dir', '')
-            t = fill.get('time', 0)
-            # 向下取整到小時
-            hour_ts = t - (t % (60*60*1000))
-            key = (coin, dir_, hour_ts)
-            sz = float(fill.get('sz', 0))
-            px = float(fill.get('px', 0))
-            closedPnl = float(fill.get('closedPnl', 0))
-            merged[key]['sz'] += sz
-            merged[key]['closedPnl'] += closedPnl
-            merged[key]['px_sum'] += px * abs(sz)
-            merged[key]['px_weight'] += abs(sz)
-            merged[key]['count'] += 1
-            if merged[key]['first_time'] is None or t < merged[key]['first_time']:
-                merged[key]['first_time'] = t
-            if merged[key]['last_time'] is None or t > merged[key]['last_time']:
-                merged[key]['last_time'] = t
-        # 轉成列表
-        merged_list = []
-        for (coin, dir_, hour_ts), v in merged.items():
-            px = v['px_sum'] / v['px_weight'] if v['px_weight'] else 0
-            merged_list.append({
-                'timestamp': datetime.fromtimestamp(hour_ts / 1000).strftime('%Y-%m-%d %H:00:00'),
-                'coin': coin,
-                'action': dir_,
-                'sz': v['sz'],
-                'px': px,
-                'closedPnl': v['closedPnl'],
-                'count': v['count'],
-                'last_time': v['last_time']
-            })
-        # 用 last_time 倒序排序
-        merged_list = sorted(merged_list, key=lambda x: x['last_time'], reverse=True)
-        total = len(merged_list)
-        start = (page - 1) * limit
-        end = start + limit
-        paged = merged_list[start:end]
+        page = int_arg('page', 1)
+        # limit=0 表示一次返回全部
+        limit = int_arg('limit', 20)
+        start_time = int_arg('start_time')
+        end_time = int_arg('end_time')
+        fmt = response_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    from trade_merge import FILL_COLUMNS as MERGE_COLUMNS, iter_merged, merge_fills_by_hour, page_of_merged
+    try:
+        # 同一地址和時間範圍的合併結果只計算一次，翻頁直接切片
+        key = (address.lower(), start_time, end_time)
+        merged = merged_trades_cache.get(key)
+        if merged is None:
+            with STAGE_SECONDS.time('load_fills'):
+                fills = wallet_fills(address, start_time, end_time, MERGE_COLUMNS)
+            with STAGE_SECONDS.time('merge_fills_by_hour'):
+                merged = merge_fills_by_hour(fills)
+            merged_trades_cache.set(key, merged)
+        total = len(merged)
+        if limit <= 0:
+            page, limit = 1, max(total, 1)
+        if fmt is not None:
+            meta = {'total': total, 'page': page, 'pages': (total + limit - 1) // limit}
+            rows = iter_merged(merged, (page - 1) * limit, page * limit, epoch_ms=True)
+            return stream_response(fmt, rows, meta, key='trades')
+        paged = page_of_merged(merged, page, limit)
         return jsonify({
             'trades': paged,
             'total': total,
@@ -190,142 +411,153 @@ def get_trades_by_address():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def summary_windows(windows, ranged):
+    # 需要從按日彙總取的窗口；限定時間範圍時累計窗口改從成交計算
+    return (windows or []) if ranged else SUMMARY_WINDOWS + (windows or [])
+
+def summarize_pnl(fills, unrealized_pnl, totals, windows, ranged, epoch_ms=False):
+    from pnl_analytics import pnl_summary
+    cum_windows = None if ranged else {label: totals[label]['net_pnl'] for label, _ in SUMMARY_WINDOWS}
+    with STAGE_SECONDS.time('pnl_summary'):
+        summary = pnl_summary(fills, unrealized_pnl, epoch_ms=epoch_ms, windows=cum_windows)
+    if windows:
+        summary['windows'] = {label: totals[label] for label, _ in windows}
+    return summary
+
 @app.route('/api/pnl_timeseries')
 def pnl_timeseries():
     address = request.args.get('address')
+    if not address:
+        return jsonify({'error': 'No address provided'}), 400
     try:
-        info = Info()
-        fills = info.user_fills(address)
-        if not fills:
-            return jsonify([])
-        now = datetime.now()
-        df = pd.DataFrame(fills)
-        df['date'] = df['time'].apply(lambda t: datetime.fromtimestamp(t / 1000).strftime('%Y-%m-%d'))
-        
-        # 添加新的列
-        df['fee_usd'] = df['fee'].astype(float)
-        df['px'] = df['px'].astype(float)
-        df['sz'] = df['sz'].astype(float)
-        df['closedPnl'] = df['closedPnl'].astype(float)
-        df['startPosition'] = df['startPosition'].astype(float)
-        
-        # 按訂單ID分組計算
-        order_groups = df.groupby('oid')
-        
-        # 計算每個訂單的總成交量和加權平均價格
-        order_summary = order_groups.agg({
-            'sz': 'sum',
-            'px': lambda x: (x * df.loc[x.index, 'sz']).sum() / df.loc[x.index, 'sz'].sum(),
-            'closedPnl': 'sum',
-            'fee_usd': 'sum',
-            'time': 'first',
-            'coin': 'first',
-            'dir': 'first',
-            'hash': 'first'
-        }).reset_index()
-        
-        # 計算淨盈虧
-        order_summary['netPnl'] = order_summary['closedPnl'] - order_summary['fee_usd']
-        print(order_summary[['oid','coin','closedPnl','fee_usd','netPnl']].head())
-        
-        # 計算 RRR (Risk-Reward Ratio)
-        # 假設每筆交易的止損點是進場價格的 2%
-        order_summary['entry_price'] = order_summary['px']
-        order_summary['stop_loss'] = order_summary['entry_price'] * 0.98  # 2% 止損
-        order_summary['take_profit'] = order_summary['entry_price'] * (1 + order_summary['netPnl'] / (order_summary['sz'] * order_summary['entry_price']))
-        order_summary['rrr'] = abs((order_summary['take_profit'] - order_summary['entry_price']) / (order_summary['entry_price'] - order_summary['stop_loss']))
-        
-        # 計算 P/L Ratio
-        avg_profit = order_summary[order_summary['netPnl'] > 0]['netPnl'].mean()
-        avg_loss = abs(order_summary[order_summary['netPnl'] < 0]['netPnl'].mean())
-        pl_ratio = avg_profit / avg_loss if avg_loss > 0 else None
-        
-        # 計算 Kelly 公式
-        winrate_decimal = len(order_summary[order_summary['netPnl'] > 0]) / len(order_summary) if len(order_summary) > 0 else 0
-        kelly = winrate_decimal - (1 - winrate_decimal) / pl_ratio if pl_ratio else None
+        start_time = int_arg('start_time')
+        end_time = int_arg('end_time')
+        fmt = response_format()
+        windows = requested_windows()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    from pnl_analytics import FILL_COLUMNS
+    try:
+        # 持倉與成交同步併發請求
+        user_state_future = info.submit(info.user_state, address)
+        with STAGE_SECONDS.time('load_fills'):
+            fills = wallet_fills(address, start_time, end_time, FILL_COLUMNS)
+        if len(fills) == 0:
+            return jsonify([]) if fmt is None else stream_response(fmt, [], key='daily_summary')
         
-        # 獲取當前市價並轉換為float
-        mark_prices = info.all_mids()
-        mark_prices = {k: float(v) for k, v in mark_prices.items()}
+        # 當前市價來自 allMids 推送，過期時才走 REST
+        mark_prices = prices.mids()
         
         # 計算未實現盈虧
         # 注意：這裡需要從 user_state 獲取當前持倉信息
-        user_state = info.user_state(address)
-        unrealized_pnl = 0.0
+        user_state = user_state_future.result()
+        unrealized_pnl = unrealized_pnl_from_mids(user_state, mark_prices)
         
-        for position in user_state.get('assetPositions', []):
-            coin = position.get('coin')
-            if coin in mark_prices:
-                position_data = position.get('position', {})
-                size = float(position_data.get('sz', 0))
-                entry_price = float(position_data.get('entryPx', 0))
-                leverage = float(position_data.get('leverage', 1))
-                
-                if size != 0 and entry_price != 0:
-                    mark_price = mark_prices[coin]
-                    unrealized_pnl += (mark_price - entry_price) * size * leverage
-        
-        # 更新DataFrame
-        df = order_summary.copy()
-        df['date'] = df['time'].apply(lambda t: datetime.utcfromtimestamp(t / 1000).strftime('%Y-%m-%d'))
-        df['dt'] = df['time'].apply(lambda t: datetime.utcfromtimestamp(t / 1000))
-        df['size_usd'] = df['sz'] * df['px']
-        
-        # 使用 netPnl 計算勝率
-        total_trades = len(df)
-        winning_trades = len(df[df['netPnl'] > 0])
-        overall_winrate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-        
-        # 計算累計淨盈虧（包括未實現盈虧）
-        total_pnl = df['netPnl'].sum() + unrealized_pnl
-        
-        # Calculate cumulative PnL for 7D, 30D, 90D
-        cutoff_7d = now - timedelta(days=7)
-        cutoff_30d = now - timedelta(days=30)
-        cutoff_90d = now - timedelta(days=90)
-        cum_pnl_7d = df[df['dt'] >= cutoff_7d]['netPnl'].sum()
-        cum_pnl_30d = df[df['dt'] >= cutoff_30d]['netPnl'].sum()
-        cum_pnl_90d = df[df['dt'] >= cutoff_90d]['netPnl'].sum()
-        
-        # Group by date
-        summary = []
-        for date, group in df.groupby('date'):
-            num_trades = len(group)
-            winrate = 100.0 * (group['netPnl'] > 0).sum() / num_trades if num_trades > 0 else 0.0
-            coins_traded = sorted(group['coin'].unique())
-            median_size_usd = float(group['size_usd'].median()) if num_trades > 0 else 0.0
-
-            # for debug purposes 
-            print(f"=== {date} trades netPnls: ===")
-            print(group['netPnl'].tolist())
-
-            summary.append({
-                'date': date,
-                'num_trades': num_trades,
-                'winrate': round(winrate, 2),
-                'coins_traded': coins_traded,
-                'median_size_usd': median_size_usd,
-                'sum_netPnl': round(group['netPnl'].sum(), 2),
-                'cum_pnl_7d': cum_pnl_7d,
-                'cum_pnl_30d': cum_pnl_30d,
-                'cum_pnl_90d': cum_pnl_90d
-            })
-            
-        return jsonify({
-            'daily_summary': summary,
-            'overall_stats': {
-                'total_pnl': total_pnl,
-                'overall_winrate': round(overall_winrate, 2),
-                'total_trades': total_trades,
-                'winning_trades': winning_trades,
-                'avg_rrr': round(order_summary['rrr'].mean(), 2),
-                'pl_ratio': round(pl_ratio, 2) if pl_ratio else None,
-                'kelly': round(kelly * 100, 2) if kelly else None
-            }
-        })
+        # 不限時間範圍時，7D/30D/90D 直接取自按日彙總；wallet_fills 已刷新過成交
+        ranged = start_time is not None or end_time is not None
+        wanted = summary_windows(windows, ranged)
+        totals = None
+        if wanted:
+            with STAGE_SECONDS.time('pnl_aggregates'):
+                # 只有明確要求 window 時才需要資金費列，7D/30D/90D 只用 net_pnl
+                totals = pnl_aggregates().windows(address, wanted, refresh=False, funding=bool(windows))
+        summary = summarize_pnl(fills, unrealized_pnl, totals, windows, ranged, epoch_ms=fmt is not None)
+        if fmt is not None:
+            meta = {key: value for key, value in summary.items() if key != 'daily_summary'}
+            return stream_response(fmt, summary['daily_summary'], meta, key='daily_summary')
+        return jsonify(summary)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/leaderboard', methods=['POST'])
+def leaderboard():
+    from leaderboard import MAX_ADDRESSES, rank, score_addresses
+    data = request.json or {}
+    # 去重並保留順序
+    addresses = list(dict.fromkeys(a.strip().lower() for a in data.get('addresses', []) if a.strip()))
+    if not addresses:
+        return jsonify({'error': 'No addresses provided'}), 400
+    if len(addresses) > MAX_ADDRESSES:
+        return jsonify({'error': f'At most {MAX_ADDRESSES} addresses per request'}), 400
+    results = score_addresses(info, fill_store, addresses)
+
+    # stream=true 時每完成一個錢包就輸出一行 NDJSON
+    if data.get('stream') or request.args.get('stream'):
+        def generate():
+            for address, score, error in results:
+                yield json.dumps(score if error is None else {'address': address, 'error': error}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    scores = []
+    errors = []
+    for address, score, error in results:
+        if error is None:
+            scores.append(score)
+        else:
+            errors.append({'address': address, 'error': error})
+    return jsonify({'leaderboard': rank(scores), 'errors': errors})
+
+@app.route('/api/co_entries')
+def get_co_entries():
+    # 即時偵測到的最近訊號，新的在前
+    return jsonify(list(reversed(co_entries.recent)))
+
+def replay_params(data):
+    # 返回 (addresses, start_time, end_time, window_ms, min_wallets)；格式錯誤時拋出 ValueError / TypeError
+    addresses = data.get('addresses')
+    if addresses is None:
+        # 默認重放正在追蹤的錢包
+        addresses = subscriptions.addresses
+    if not isinstance(addresses, list):
+        raise ValueError('addresses must be a list')
+    addresses = list(dict.fromkeys(str(a).strip().lower() for a in addresses if str(a).strip()))
+    if not addresses:
+        raise ValueError('No addresses provided')
+    end_time = data.get('end_time')
+    end_time = int(time.time() * 1000) if end_time is None else int(end_time)
+    start_time = data.get('start_time')
+    start_time = end_time - REPLAY_DAYS * DAY_MS if start_time is None else int(start_time)
+    window_ms = int(float(data.get('window_minutes', co_entries.window_ms / 60000)) * 60000)
+    min_wallets = int(data.get('min_wallets', co_entries.min_wallets))
+    return addresses, start_time, end_time, window_ms, min_wallets
+
+def sync_wallets(addresses, start_time):
+    # 先從上游補齊成交，返回失敗的錢包
+    from leaderboard import LEADERBOARD_WORKERS
+    errors = []
+    with ThreadPoolExecutor(max_workers=LEADERBOARD_WORKERS) as pool:
+        futures = {pool.submit(fill_store.refresh, info, address, start_time): address for address in addresses}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                errors.append({'address': futures[future], 'error': str(e)})
+    return errors
+
+@app.route('/api/co_entries/replay', methods=['POST'])
+def replay_co_entries():
+    data = request.get_json(silent=True) or {}
+    try:
+        fmt = response_format()
+        addresses, start_time, end_time, window_ms, min_wallets = replay_params(data)
+        histories = {address: stored_history(fill_store, address, start_time, end_time) for address in addresses}
+        signals = replay(histories, window_ms, min_wallets)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    errors = []
+    # sync=true 時先同步成交，否則只用本地已存的歷史
+    if data.get('sync'):
+        from leaderboard import MAX_ADDRESSES
+        if len(addresses) > MAX_ADDRESSES:
+            return jsonify({'error': f'At most {MAX_ADDRESSES} addresses per request with sync'}), 400
+        errors = sync_wallets(addresses, start_time)
+    meta = {'wallets': len(addresses), 'start_time': start_time, 'end_time': end_time,
+            'window_ms': window_ms, 'min_wallets': min_wallets, 'errors': errors}
+    if fmt is not None:
+        return stream_response(fmt, signals, meta, key='signals')
+    meta['signals'] = list(signals)
+    return jsonify(meta)
+
 @app.route('/api/favorite_address', methods=['POST'])
 def add_favorite_address():
     data = request.json
@@ -334,75 +566,38 @@ def add_favorite_address():
     tag = data['tag']
     top_coins = json.dumps(data['top_coins'])
     top_profits = json.dumps(data['top_profits'])
-    dbconn = get_db_connection()
-    c = dbconn.cursor()
-    c.execute('INSERT INTO favorite_addresses (address, winrate, tag, top_coins, top_profits) VALUES (%s, %s, %s, %s, %s)',
-              (address, winrate, tag, top_coins, top_profits))
-    dbconn.commit()
-    c.close()
-    dbconn.close()
+    db.add_favorite(address, winrate, tag, top_coins, top_profits)
+    subscriptions.add_wallet(address, handle_fills)
     return jsonify({'success': True})
 
 @app.route('/api/favorite_addresses')
 def get_favorite_addresses():
-    dbconn = get_db_connection()
-    c = dbconn.cursor()
-    c.execute('SELECT address, tag FROM favorite_addresses ORDER BY tag')
-    rows = c.fetchall()
-    c.close()
-    dbconn.close()
+    rows = db.favorite_addresses()
     # rows: [(address, tag), ...]
     result = [{'address': r[0], 'tag': r[1]} for r in rows]
     return jsonify(result)
 
-def get_realized_pnl_from_trades(info, address, start_time=None, end_time=None):
-    if start_time and end_time:
-        fills = info.user_fills_by_time(address, start_time, end_time)
-    else:
-        fills = info.user_fills(address)
-    
-    total_realized_pnl = 0.0
-    for fill in fills:
-        if "closedPnl" in fill:
-            total_realized_pnl += float(fill["closedPnl"])
-    
-    return total_realized_pnl
-
-def get_funding_pnl(info, address, start_time, end_time=None):
-    funding_history = info.user_funding_history(address, start_time, end_time)
-    
-    total_funding_pnl = 0.0
-    for record in funding_history:
-        if "delta" in record and "usdc" in record["delta"]:
-            total_funding_pnl += float(record["delta"]["usdc"])
-    
-    return total_funding_pnl
-
 def get_unrealized_pnl(info, address):
-    user_state = info.user_state(address)
-    
-    total_unrealized_pnl = 0.0
-    for position_data in user_state["assetPositions"]:
-        position = position_data["position"]
-        if "unrealizedPnl" in position:
-            total_unrealized_pnl += float(position["unrealizedPnl"])
-    
-    return total_unrealized_pnl
+    # 與即時推送相同，以中間價估算，/api/track_pnl 的結果不因是否有人訂閱而不同
+    return unrealized_pnl_from_mids(info.user_state(address), prices.mids())
 
-def get_total_cumulative_pnl(info, address, start_time=None, end_time=None):
-    realized_pnl = get_realized_pnl_from_trades(info, address, start_time, end_time)
-    
-    funding_pnl = 0.0
-    if start_time:
-        funding_pnl = get_funding_pnl(info, address, start_time, end_time)
+def get_total_cumulative_pnl(info, address, days=30):
+    # 已實現與資金費取自按日彙總，只有持倉需要請求上游
+    from pnl_aggregates import funding_start
+    unrealized_future = info.submit(get_unrealized_pnl, info, address)
+    totals = pnl_aggregates().windows(address, [(f'{days}d', days)])[f'{days}d']
     
-    unrealized_pnl = get_unrealized_pnl(info, address)
+    realized_pnl = totals['closed_pnl']
+    funding_pnl = totals['funding']
+    unrealized_pnl = unrealized_future.result()
     
     total_pnl = realized_pnl + funding_pnl + unrealized_pnl
     
     return {
+        "address": address.lower(),
         "realized_pnl": realized_pnl,
         "funding_pnl": funding_pnl,
+        "funding_by_coin": funding_ledger.by_coin(address, funding_start([('', days)])),
         "unrealized_pnl": unrealized_pnl,
         "total_cumulative_pnl": total_pnl
     }
@@ -412,17 +607,49 @@ def track_pnl():
     address = request.args.get('address')
     if not address:
         return jsonify({'error': 'No address provided'}), 400
+    try:
+        windows = requested_windows()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
-        info = Info()
-        end_time = int(time.time() * 1000)
-        start_time = end_time - (30 * 24 * 60 * 60 * 1000)  # 30 days ago
-        
-        pnl_data = get_total_cumulative_pnl(info, address, start_time, end_time)
+        # 已有即時訂閱的錢包直接返回推送引擎的狀態
+        pnl_data = live_pnl.snapshot(address)
+        if pnl_data is None:
+            pnl_data = get_total_cumulative_pnl(info, address, days=30)
+        if windows:
+            pnl_data['windows'] = pnl_aggregates().windows(address, windows)
         return jsonify(pnl_data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/coin_ids', methods=['GET', 'POST'])
+def coin_ids():
+    # GET ?coins=BTC,kPEPE 或 POST {"coins": [...]}
+    if request.method == 'POST':
+        coins = (request.get_json(silent=True) or {}).get('coins') or []
+    else:
+        coins = [c for c in request.args.get('coins', '').split(',') if c.strip()]
+    body, status = lookup_coin_ids(coins)
+    return jsonify(body), status
+
+def lookup_coin_ids(coins):
+    # 返回 (回應內容, 狀態碼)
+    if not isinstance(coins, list) or not coins:
+        return {'error': '缺少參數'}, 400
+    if len(coins) > MAX_COIN_LOOKUP:
+        return {'error': f'一次最多查詢 {MAX_COIN_LOOKUP} 個幣種'}, 400
+    result = {}
+    index = coin_index()
+    for coin in coins:
+        candidates = index.candidates(str(coin))
+        result[coin] = {
+            'id': candidates[0] if candidates else None,
+            'candidates': list(candidates),
+            'multiplier': price_multiplier(str(coin))
+        }
+    return result, 200
+
 @app.route('/api/coin_price_history')
 def coin_price_history():
     coin_id = request.args.get('coin_id')
@@ -431,25 +658,21 @@ def coin_price_history():
     if not coin_id or not from_ts or not to_ts:
         return jsonify({'error': '缺少參數'}), 400
 
-    url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart/range"
-    headers = {
-        "x-cg-demo-api-key": COINGECKO_API_KEY
-    }
-    params = {
-        "vs_currency": "usd",
-        "from": from_ts,
-        "to": to_ts
-    }
-    resp = requests.get(url, headers=headers, params=params)
-    return jsonify(resp.json())
+    try:
+        from_ts, to_ts = int(from_ts), int(to_ts)
+    except ValueError:
+        return jsonify({'error': '參數格式錯誤'}), 400
+
+    try:
+        prices = price_history.history(coin_id, from_ts, to_ts)
+    except Exception as e:
+        print(f"Error fetching price history for {coin_id}: {e}")
+        return jsonify({'error': str(e)}), 502
+    return jsonify({'prices': prices})
 
 if __name__ == '__main__':
-    wallet_address = "0xd5f7974e1be5b336094a18c230f39607934e367d"
-    
-    # Start WebSocket connection in a separate thread
-    websocket_thread = Thread(target=run_websocket, args=(wallet_address,))
-    websocket_thread.daemon = True
-    websocket_thread.start()
-    
+    start_background()
+
     # Run Flask app
-    socketio.run(app, debug=True, host='127.0.0.1', port=8080) 
\ No newline at end of file
+    socketio.run(app, debug=APP_DEBUG, use_reloader=APP_DEBUG, host=APP_HOST, port=APP_PORT,
+                 allow_unsafe_werkzeug=True)
@@ -0,0 +1,506 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import socketio
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# 共用 app.py 中的組件和輔助函數；Flask 應用本身不會啟動
+# pandas 相關模組與 app.py 一樣只在路由或預熱中載入
+from app import (DEFAULT_WALLET, ROUTE_SECONDS, STAGE_SECONDS, co_entries, create_warmup, db, fill_store,
+                 format_trade, funding_ledger, info, lookup_coin_ids, merged_trades_cache, parse_int, pnl_aggregates,
+                 price_history, prices, replay_params, stored_fills, subscriptions, summarize_pnl, summary_windows,
+                 trade_history)
+from co_entry import replay, stored_history
+from hl_client import AsyncInfoClient
+from ingest import INGEST_POLICY, FillIngest
+from live_pnl import LivePnlEngine
+from metrics import registry
+from price_feed import unrealized_pnl_from_mids
+from streaming import FORMATS, dumps, stream_chunks
+
+ASGI_HOST = os.getenv('ASGI_HOST', '127.0.0.1')
+ASGI_PORT = int(os.getenv('ASGI_PORT', '8080'))
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', '1'))
+
+# 與同步客戶端共用權重預算和緩存，同一進程不會超出上游限額
+ainfo = AsyncInfoClient(rate_limiter=info.rate_limiter, cache=info.cache)
+
+sio = socketio.AsyncServer(async_mode='asgi')
+
+
+class LoopEmitter:
+    """Sync `emit` for LivePnlEngine, scheduled onto the server loop from any thread."""
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+
+    def emit(self, event, data, to=None):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._emit, event, data, to)
+
+    def _emit(self, event, data, to):
+        self.loop.create_task(self.server.emit(event, data, to=to))
+
+
+emitter = LoopEmitter(sio)
+
+# block 策略會讓事件循環等自己，這裡退回 drop_oldest
+if INGEST_POLICY == 'block':
+    print("INGEST_POLICY=block is not supported by the ASGI server, using drop_oldest")
+ingest = FillIngest(sio, trade_history, format_trade, policy='drop_oldest' if INGEST_POLICY == 'block' else INGEST_POLICY,
+                    detector=co_entries)
+
+def handle_fills(address, fills):
+    ingest.put(address, fills)
+
+# 推送引擎仍用同步 info 初始化錢包，在線程中執行
+live_pnl = LivePnlEngine(info, fill_store, funding_ledger, prices, subscriptions, emitter)
+
+registry.collected('ingest_queue_depth', 'Fills waiting to be emitted', lambda: len(ingest))
+registry.collected('ingest_queue_max_depth', 'Highest queue depth seen', lambda: ingest.max_depth)
+registry.collected('ingest_enqueued_total', 'Fills accepted into the ingest queue', lambda: ingest.enqueued, 'counter')
+registry.collected('ingest_dropped_total', 'Fills dropped by the ingest queue', lambda: {
+    (reason,): count for reason, count in ingest.dropped.items()}, 'counter', ('reason',))
+registry.collected('ingest_duplicates_total', 'Fills already in the trade history', lambda: ingest.duplicates, 'counter')
+registry.collected('ingest_emitted_trades_total', 'Trades emitted to clients', lambda: ingest.emitted_trades, 'counter')
+registry.collected('ingest_batches_total', 'new_trades events emitted', lambda: ingest.emitted_batches, 'counter')
+registry.collected('live_pnl_wallets', 'Wallets with live PnL subscribers', lambda: len(live_pnl.wallets))
+
+# 收藏錢包的成交交給本模組的 ingest；/readyz 以這裡的預熱為準
+warmup = create_warmup(handle_fills)
+registry.collected('hl_info_async_inflight', 'Distinct upstream /info requests being awaited',
+                   lambda: len(ainfo._inflight))
+
+
+class JSONResponse(Response):
+    media_type = 'application/json'
+
+    def render(self, content):
+        return dumps(content)
+
+
+def error(message, status):
+    return JSONResponse({'error': message}, status)
+
+
+def int_arg(request, name, default=None):
+    # 與 Flask 路由相同：格式錯誤時拋出 ValueError，由路由返回 400
+    return parse_int(name, request.query_params.get(name), default)
+
+
+def response_format(request):
+    fmt = request.query_params.get('format')
+    if fmt is not None and fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def requested_windows(request):
+    from pnl_aggregates import parse_windows
+    value = request.query_params.get('window')
+    return None if value is None else parse_windows(value)
+
+
+def stream(fmt, rows, fields=None, key=None):
+    # 同步迭代器由 Starlette 放到線程池執行，編碼不佔事件循環
+    chunks, mimetype = stream_chunks(fmt, rows, fields, key)
+    return StreamingResponse(chunks, media_type=mimetype)
+
+
+async def request_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'index.html')) as f:
+    INDEX_HTML = f.read()
+
+
+async def index(request):
+    return HTMLResponse(INDEX_HTML)
+
+
+async def metrics(request):
+    return Response(registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def healthz(request):
+    return JSONResponse({'status': 'ok'})
+
+
+async def readyz(request):
+    status = warmup.status()
+    return JSONResponse(status, 200 if status['ready'] else 503)
+
+
+async def get_trades(request):
+    address = request.query_params.get('address')
+    try:
+        fmt = response_format(request)
+    except ValueError as e:
+        return error(str(e), 400)
+    if fmt is not None:
+        return stream(fmt, (format_trade(trade, epoch_ms=True) for trade in trade_history.trades(address)))
+    return JSONResponse([format_trade(trade) for trade in trade_history.trades(address)])
+
+
+async def get_user_state(request):
+    address = request.query_params.get('address')
+    if not address:
+        return error('No address provided', 400)
+    try:
+        return JSONResponse(await ainfo.user_state(address))
+    except Exception as e:
+        return error(str(e), 500)
+
+
+def load_merged(address, start_time, end_time):
+    from trade_merge import FILL_COLUMNS as MERGE_COLUMNS, merge_fills_by_hour
+    with STAGE_SECONDS.time('load_fills'):
+        fills = stored_fills(address, start_time, end_time, MERGE_COLUMNS)
+    with STAGE_SECONDS.time('merge_fills_by_hour'):
+        return merge_fills_by_hour(fills)
+
+
+async def get_trades_by_address(request):
+    address = request.query_params.get('address')
+    if not address:
+        return error('No address provided', 400)
+    try:
+        page = int_arg(request, 'page', 1)
+        limit = int_arg(request, 'limit', 20)
+        start_time = int_arg(request, 'start_time')
+        end_time = int_arg(request, 'end_time')
+        fmt = response_format(request)
+    except ValueError as e:
+        return error(str(e), 400)
+    from trade_merge import iter_merged, page_of_merged
+    try:
+        key = (address.lower(), start_time, end_time)
+        merged = merged_trades_cache.get(key)
+        if merged is None:
+            await fill_store.refresh_async(ainfo, address, start_time)
+            merged = await asyncio.to_thread(load_merged, address, start_time, end_time)
+            merged_trades_cache.set(key, merged)
+        total = len(merged)
+        if limit <= 0:
+            page, limit = 1, max(total, 1)
+        if fmt is not None:
+            meta = {'total': total, 'page': page, 'pages': (total + limit - 1) // limit}
+            rows = iter_merged(merged, (page - 1) * limit, page * limit, epoch_ms=True)
+            return stream(fmt, rows, meta, key='trades')
+        return JSONResponse({
+            'trades': page_of_merged(merged, page, limit),
+            'total': total,
+            'page': page,
+            'pages': (total + limit - 1) // limit
+        })
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def pnl_timeseries(request):
+    address = request.query_params.get('address')
+    if not address:
+        return error('No address provided', 400)
+    try:
+        start_time = int_arg(request, 'start_time')
+        end_time = int_arg(request, 'end_time')
+        fmt = response_format(request)
+        windows = requested_windows(request)
+    except ValueError as e:
+        return error(str(e), 400)
+    from pnl_analytics import FILL_COLUMNS
+    try:
+        # 持倉與成交同步一起等待
+        user_state, _ = await asyncio.gather(ainfo.user_state(address),
+                                             fill_store.refresh_async(ainfo, address, start_time))
+        with STAGE_SECONDS.time('load_fills'):
+            fills = await asyncio.to_thread(stored_fills, address, start_time, end_time, FILL_COLUMNS)
+        if len(fills) == 0:
+            return JSONResponse([]) if fmt is None else stream(fmt, [], key='daily_summary')
+
+        mark_prices = await prices.mids_async(ainfo)
+        unrealized_pnl = unrealized_pnl_from_mids(user_state, mark_prices)
+
+        ranged = start_time is not None or end_time is not None
+        wanted = summary_windows(windows, ranged)
+        totals = None
+        if wanted:
+            with STAGE_SECONDS.time('pnl_aggregates'):
+                totals = await pnl_aggregates().windows_async(ainfo, address, wanted, refresh=False,
+                                                              funding=bool(windows))
+        summary = await asyncio.to_thread(summarize_pnl, fills, unrealized_pnl, totals, windows, ranged,
+                                          fmt is not None)
+        if fmt is not None:
+            meta = {key: value for key, value in summary.items() if key != 'daily_summary'}
+            return stream(fmt, summary['daily_summary'], meta, key='daily_summary')
+        return JSONResponse(summary)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def leaderboard(request):
+    from leaderboard import MAX_ADDRESSES, rank, score_addresses_async
+    data = await request_json(request) or {}
+    addresses = list(dict.fromkeys(a.strip().lower() for a in data.get('addresses', []) if a.strip()))
+    if not addresses:
+        return error('No addresses provided', 400)
+    if len(addresses) > MAX_ADDRESSES:
+        return error(f'At most {MAX_ADDRESSES} addresses per request', 400)
+    results = score_addresses_async(ainfo, fill_store, addresses)
+
+    if data.get('stream') or request.query_params.get('stream'):
+        async def generate():
+            async for address, score, err in results:
+                yield json.dumps(score if err is None else {'address': address, 'error': err}) + '\n'
+        return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+    scores = []
+    errors = []
+    async for address, score, err in results:
+        if err is None:
+            scores.append(score)
+        else:
+            errors.append({'address': address, 'error': err})
+    return JSONResponse({'leaderboard': rank(scores), 'errors': errors})
+
+
+async def get_co_entries(request):
+    return JSONResponse(list(reversed(co_entries.recent)))
+
+
+async def sync_wallets(addresses, start_time):
+    from leaderboard import LEADERBOARD_CONCURRENCY
+    semaphore = asyncio.Semaphore(LEADERBOARD_CONCURRENCY)
+
+    async def sync(address):
+        async with semaphore:
+            try:
+                await fill_store.refresh_async(ainfo, address, start_time)
+            except Exception as e:
+                return {'address': address, 'error': str(e)}
+
+    return [e for e in await asyncio.gather(*(sync(address) for address in addresses)) if e]
+
+
+async def replay_co_entries(request):
+    data = await request_json(request) or {}
+    try:
+        fmt = response_format(request)
+        addresses, start_time, end_time, window_ms, min_wallets = replay_params(data)
+        histories = {address: stored_history(fill_store, address, start_time, end_time) for address in addresses}
+        signals = replay(histories, window_ms, min_wallets)
+    except (TypeError, ValueError) as e:
+        return error(str(e), 400)
+    errors = []
+    if data.get('sync'):
+        from leaderboard import MAX_ADDRESSES
+        if len(addresses) > MAX_ADDRESSES:
+            return error(f'At most {MAX_ADDRESSES} addresses per request with sync', 400)
+        errors = await sync_wallets(addresses, start_time)
+    meta = {'wallets': len(addresses), 'start_time': start_time, 'end_time': end_time,
+            'window_ms': window_ms, 'min_wallets': min_wallets, 'errors': errors}
+    if fmt is not None:
+        return stream(fmt, signals, meta, key='signals')
+    # 重放讀 SQLite，放到線程中執行
+    meta['signals'] = await asyncio.to_thread(list, signals)
+    return JSONResponse(meta)
+
+
+async def add_favorite_address(request):
+    data = await request_json(request)
+    address = data['address']
+    await db.add_favorite_async(address, data['winrate'], data['tag'],
+                                json.dumps(data['top_coins']), json.dumps(data['top_profits']))
+    subscriptions.add_wallet(address, handle_fills)
+    return JSONResponse({'success': True})
+
+
+async def get_favorite_addresses(request):
+    rows = await db.favorite_addresses_async()
+    return JSONResponse([{'address': r[0], 'tag': r[1]} for r in rows])
+
+
+async def get_total_cumulative_pnl(address, days=30):
+    from pnl_aggregates import funding_start
+    user_state, totals, mids = await asyncio.gather(
+        ainfo.user_state(address), pnl_aggregates().windows_async(ainfo, address, [(f'{days}d', days)]),
+        prices.mids_async(ainfo))
+    totals = totals[f'{days}d']
+    # 與即時推送相同，以中間價估算
+    unrealized_pnl = unrealized_pnl_from_mids(user_state, mids)
+    return {
+        "address": address.lower(),
+        "realized_pnl": totals['closed_pnl'],
+        "funding_pnl": totals['funding'],
+        "funding_by_coin": funding_ledger.by_coin(address, funding_start([('', days)])),
+        "unrealized_pnl": unrealized_pnl,
+        "total_cumulative_pnl": totals['closed_pnl'] + totals['funding'] + unrealized_pnl
+    }
+
+
+async def track_pnl(request):
+    address = request.query_params.get('address')
+    if not address:
+        return error('No address provided', 400)
+    try:
+        windows = requested_windows(request)
+    except ValueError as e:
+        return error(str(e), 400)
+    try:
+        pnl_data = live_pnl.snapshot(address)
+        if pnl_data is None:
+            pnl_data = await get_total_cumulative_pnl(address, days=30)
+        if windows:
+            pnl_data['windows'] = await pnl_aggregates().windows_async(ainfo, address, windows)
+        return JSONResponse(pnl_data)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def coin_ids(request):
+    if request.method == 'POST':
+        coins = (await request_json(request) or {}).get('coins') or []
+    else:
+        coins = [c for c in request.query_params.get('coins', '').split(',') if c.strip()]
+    body, status = lookup_coin_ids(coins)
+    return JSONResponse(body, status)
+
+
+async def coin_price_history(request):
+    coin_id = request.query_params.get('coin_id')
+    from_ts = request.query_params.get('from')
+    to_ts = request.query_params.get('to')
+    if not coin_id or not from_ts or not to_ts:
+        return error('缺少參數', 400)
+    try:
+        from_ts, to_ts = int(from_ts), int(to_ts)
+    except ValueError:
+        return error('參數格式錯誤', 400)
+    try:
+        # CoinGecko 請求很少（本地優先），仍走同步客戶端
+        points = await asyncio.to_thread(price_history.history, coin_id, from_ts, to_ts)
+    except Exception as e:
+        print(f"Error fetching price history for {coin_id}: {e}")
+        return error(str(e), 502)
+    return JSONResponse({'prices': points})
+
+
+routes = [
+    Route('/', index),
+    Route('/metrics', metrics),
+    Route('/healthz', healthz),
+    Route('/readyz', readyz),
+    Route('/api/trades', get_trades),
+    Route('/api/user_state', get_user_state),
+    Route('/api/trades_by_address', get_trades_by_address),
+    Route('/api/pnl_timeseries', pnl_timeseries),
+    Route('/api/leaderboard', leaderboard, methods=['POST']),
+    Route('/api/co_entries', get_co_entries),
+    Route('/api/co_entries/replay', replay_co_entries, methods=['POST']),
+    Route('/api/favorite_address', add_favorite_address, methods=['POST']),
+    Route('/api/favorite_addresses', get_favorite_addresses),
+    Route('/api/track_pnl', track_pnl),
+    Route('/api/coin_ids', coin_ids, methods=['GET', 'POST']),
+    Route('/api/coin_price_history', coin_price_history),
+]
+ROUTE_PATHS = {route.path for route in routes}
+
+
+class RouteTimer:
+    """ASGI middleware recording the same http_request_seconds histogram as the Flask hooks."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        route = scope['path'] if scope['path'] in ROUTE_PATHS else 'unmatched'
+
+        async def timed_send(message):
+            if message['type'] == 'http.response.start':
+                ROUTE_SECONDS.observe(time.perf_counter() - started, route, scope['method'], str(message['status']))
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+@sio.on('track_pnl')
+async def on_track_pnl(sid, data):
+    address = (data or {}).get('address')
+    if not address:
+        return
+    await sio.enter_room(sid, address.lower())
+    try:
+        snapshot = await asyncio.to_thread(live_pnl.track, address, sid)
+    except Exception as e:
+        snapshot = {'address': address.lower(), 'error': str(e)}
+    await sio.emit('pnl_update', snapshot, to=sid)
+
+
+@sio.on('untrack_pnl')
+async def on_untrack_pnl(sid, data):
+    address = (data or {}).get('address')
+    if not address:
+        return
+    await sio.leave_room(sid, address.lower())
+    # untrack 會等待進行中的初始化，不能在事件循環上阻塞
+    await asyncio.to_thread(live_pnl.untrack, address, sid)
+
+
+@sio.on('disconnect')
+async def on_disconnect(sid, *args):
+    await asyncio.to_thread(live_pnl.untrack_sid, sid)
+
+
+_background = []
+
+
+async def startup():
+    # WebSocket 訂閱、成交推送與 HTTP 處理共用這個事件循環
+    emitter.loop = asyncio.get_running_loop()
+    subscriptions.add_wallet(DEFAULT_WALLET, handle_fills)
+    _background.append(asyncio.create_task(subscriptions.run()))
+    _background.append(asyncio.create_task(ingest.run_async()))
+    _background.append(asyncio.create_task(funding_ledger.run_hourly_async(ainfo, lambda: subscriptions.addresses)))
+    # 不等預熱就開始接受連線；建表、收藏錢包訂閱和預熱在線程中完成後 /readyz 才返回 200
+    _background.append(asyncio.create_task(asyncio.to_thread(warmup.run)))
+
+
+async def shutdown():
+    await subscriptions.close()
+    for task in _background:
+        task.cancel()
+    await asyncio.gather(*_background, return_exceptions=True)
+    await ainfo.aclose()
+
+
+api = Starlette(routes=routes)
+app = socketio.ASGIApp(sio, other_asgi_app=RouteTimer(api), on_startup=startup, on_shutdown=shutdown)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API as an ASGI app with uvicorn")
+    parser.add_argument('--host', default=ASGI_HOST)
+    parser.add_argument('--port', type=int, default=ASGI_PORT)
+    parser.add_argument('--workers', type=int, default=ASGI_WORKERS,
+                        help='worker processes; each runs its own event loop and WebSocket subscriptions')
+    args = parser.parse_args()
+    uvicorn.run('asgi_app:app', host=args.host, port=args.port, workers=args.workers,
+                timeout_graceful_shutdown=5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Exercise InfoClient against a local mock of the Hyperliquid /info endpoint.
+
+    python -m benchmarks.info_coalescing --clients 50 --rounds 20 --latency 0.05
+
+Simulates many dashboard tabs polling the same wallet: every round, all
+clients request allMids and clearinghouseState at once. Reports how many
+requests reached the mock server compared with how many were made.
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hl_client import InfoClient
+
+
+class MockInfoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.05
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            MockInfoHandler.requests_seen += 1
+        time.sleep(self.latency)
+        if payload['type'] == 'allMids':
+            body = {'BTC': '65000.0', 'ETH': '3500.0'}
+        elif payload['type'] == 'clearinghouseState':
+            body = {'assetPositions': [], 'marginSummary': {'accountValue': '1000.0'}}
+        else:
+            body = []
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between polling rounds')
+    args = parser.parse_args()
+
+    MockInfoHandler.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockInfoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = InfoClient(f"http://127.0.0.1:{server.server_port}")
+    address = '0x' + '1' * 40
+
+    def poll():
+        started = time.perf_counter()
+        mids = client.submit(client.all_mids)
+        state = client.submit(client.user_state, address)
+        mids.result()
+        state.result()
+        return time.perf_counter() - started
+
+    latencies = []
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        for _ in range(args.rounds):
+            latencies.extend(pool.map(lambda _: poll(), range(args.clients)))
+            time.sleep(args.interval)
+    server.shutdown()
+
+    made = 2 * args.clients * args.rounds
+    latencies.sort()
+    print(f"requests made: {made}, reached mock: {MockInfoHandler.requests_seen}, "
+          f"coalesced: {client.coalesced_calls}, cache hits: {client.cache.hits}")
+    print(f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
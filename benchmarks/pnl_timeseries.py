@@ -0,0 +1,166 @@
+"""Compare pnl_summary with the previous per-row pandas implementation.
+
+    python -m benchmarks.pnl_timeseries --sizes 10000 100000 1000000 --legacy-max 100000
+
+Both run on the same synthetic fill history; the legacy code's stdout debug
+printing is captured so its cost is counted without flooding the terminal.
+"""
+import argparse
+import contextlib
+import io
+import random
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from pnl_analytics import pnl_summary
+
+COINS = ['BTC', 'ETH', 'SOL', 'HYPE', 'DOGE', 'ARB', 'kPEPE', 'WIF']
+DIRS = ['Open Long', 'Close Long', 'Open Short', 'Close Short']
+
+
+def generate_fills(n, days=365, fills_per_order=3, seed=11):
+    rng = random.Random(seed)
+    end = int(time.time() * 1000)
+    start = end - days * 24 * 60 * 60 * 1000
+    fills = []
+    oid = 0
+    while len(fills) < n:
+        oid += 1
+        t = rng.randint(start, end)
+        coin = rng.choice(COINS)
+        direction = rng.choice(DIRS)
+        px = rng.uniform(0.1, 70000)
+        for _ in range(min(rng.randint(1, 2 * fills_per_order - 1), n - len(fills))):
+            fills.append({
+                'coin': coin, 'px': f"{px * rng.uniform(0.999, 1.001):.4f}", 'sz': f"{rng.uniform(0.01, 5):.4f}",
+                'side': 'B' if 'Long' in direction else 'A', 'time': t, 'startPosition': '0.0', 'dir': direction,
+                'closedPnl': f"{rng.gauss(0, 50) if direction.startswith('Close') else 0.0:.4f}",
+                'hash': f"0x{oid:064x}", 'oid': oid, 'crossed': True, 'fee': f"{rng.uniform(0, 2):.4f}",
+                'tid': len(fills), 'feeToken': 'USDC',
+            })
+            t += rng.randint(0, 500)
+    fills.sort(key=lambda f: f['time'], reverse=True)
+    return fills
+
+
+def legacy_pnl_summary(fills, unrealized_pnl=0.0):
+    # 舊版 pnl_timeseries 的計算部分（不含上游請求）
+    now = datetime.now()
+    df = pd.DataFrame(fills)
+    df['date'] = df['time'].apply(lambda t: datetime.fromtimestamp(t / 1000).strftime('%Y-%m-%d'))
+    df['fee_usd'] = df['fee'].astype(float)
+    df['px'] = df['px'].astype(float)
+    df['sz'] = df['sz'].astype(float)
+    df['closedPnl'] = df['closedPnl'].astype(float)
+    df['startPosition'] = df['startPosition'].astype(float)
+    order_groups = df.groupby('oid')
+    order_summary = order_groups.agg({
+        'sz': 'sum',
+        'px': lambda x: (x * df.loc[x.index, 'sz']).sum() / df.loc[x.index, 'sz'].sum(),
+        'closedPnl': 'sum',
+        'fee_usd': 'sum',
+        'time': 'first',
+        'coin': 'first',
+        'dir': 'first',
+        'hash': 'first'
+    }).reset_index()
+    order_summary['netPnl'] = order_summary['closedPnl'] - order_summary['fee_usd']
+    print(order_summary[['oid', 'coin', 'closedPnl', 'fee_usd', 'netPnl']].head())
+    order_summary['entry_price'] = order_summary['px']
+    order_summary['stop_loss'] = order_summary['entry_price'] * 0.98
+    order_summary['take_profit'] = order_summary['entry_price'] * (1 + order_summary['netPnl'] / (order_summary['sz'] * order_summary['entry_price']))
+    order_summary['rrr'] = abs((order_summary['take_profit'] - order_summary['entry_price']) / (order_summary['entry_price'] - order_summary['stop_loss']))
+    avg_profit = order_summary[order_summary['netPnl'] > 0]['netPnl'].mean()
+    avg_loss = abs(order_summary[order_summary['netPnl'] < 0]['netPnl'].mean())
+    pl_ratio = avg_profit / avg_loss if avg_loss > 0 else None
+    winrate_decimal = len(order_summary[order_summary['netPnl'] > 0]) / len(order_summary) if len(order_summary) > 0 else 0
+    kelly = winrate_decimal - (1 - winrate_decimal) / pl_ratio if pl_ratio else None
+    df = order_summary.copy()
+    df['date'] = df['time'].apply(lambda t: datetime.utcfromtimestamp(t / 1000).strftime('%Y-%m-%d'))
+    df['dt'] = df['time'].apply(lambda t: datetime.utcfromtimestamp(t / 1000))
+    df['size_usd'] = df['sz'] * df['px']
+    total_trades = len(df)
+    winning_trades = len(df[df['netPnl'] > 0])
+    overall_winrate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
+    total_pnl = df['netPnl'].sum() + unrealized_pnl
+    cum_pnl_7d = df[df['dt'] >= now - timedelta(days=7)]['netPnl'].sum()
+    cum_pnl_30d = df[df['dt'] >= now - timedelta(days=30)]['netPnl'].sum()
+    cum_pnl_90d = df[df['dt'] >= now - timedelta(days=90)]['netPnl'].sum()
+    summary = []
+    for date, group in df.groupby('date'):
+        num_trades = len(group)
+        winrate = 100.0 * (group['netPnl'] > 0).sum() / num_trades if num_trades > 0 else 0.0
+        print(f"=== {date} trades netPnls: ===")
+        print(group['netPnl'].tolist())
+        summary.append({
+            'date': date,
+            'num_trades': num_trades,
+            'winrate': round(winrate, 2),
+            'coins_traded': sorted(group['coin'].unique()),
+            'median_size_usd': float(group['size_usd'].median()) if num_trades > 0 else 0.0,
+            'sum_netPnl': round(group['netPnl'].sum(), 2),
+            'cum_pnl_7d': cum_pnl_7d,
+            'cum_pnl_30d': cum_pnl_30d,
+            'cum_pnl_90d': cum_pnl_90d
+        })
+    return {
+        'daily_summary': summary,
+        'overall_stats': {
+            'total_pnl': total_pnl,
+            'overall_winrate': round(overall_winrate, 2),
+            'total_trades': total_trades,
+            'winning_trades': winning_trades,
+            'avg_rrr': round(order_summary['rrr'].mean(), 2),
+            'pl_ratio': round(pl_ratio, 2) if pl_ratio else None,
+            'kelly': round(kelly * 100, 2) if kelly else None
+        }
+    }
+
+
+def timed(func, *args, repeat=1):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def check(new, old):
+    # 每日彙總與總體統計應一致；浮點加總順序不同，四捨五入後允許 0.01 的誤差
+    # （累計窗口的時區處理已修正，不比較）
+    assert len(new['daily_summary']) == len(old['daily_summary']), 'daily_summary length differs'
+    for a, b in zip(new['daily_summary'], old['daily_summary']):
+        assert (a['date'], a['num_trades'], a['coins_traded']) == (b['date'], b['num_trades'], b['coins_traded']), a['date']
+        assert abs(a['winrate'] - b['winrate']) <= 0.011 and abs(a['sum_netPnl'] - b['sum_netPnl']) <= 0.011, a['date']
+    for key in ['overall_winrate', 'total_trades', 'winning_trades', 'avg_rrr', 'pl_ratio', 'kelly']:
+        a, b = new['overall_stats'][key], old['overall_stats'][key]
+        assert a == b or abs(a - b) <= 0.011, key
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max', type=int, default=1_000_000,
+                        help='skip the legacy implementation above this many fills')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'fills':>9} {'vectorized':>12} {'legacy':>12} {'speedup':>9}")
+    for n in args.sizes:
+        fills = generate_fills(n)
+        new_time, new = timed(pnl_summary, fills, repeat=args.repeat)
+        if n <= args.legacy_max:
+            old_time, old = timed(legacy_pnl_summary, fills)
+            check(new, old)
+            print(f"{n:>9} {new_time:>11.3f}s {old_time:>11.3f}s {old_time / new_time:>8.1f}x")
+        else:
+            print(f"{n:>9} {new_time:>11.3f}s {'-':>12} {'-':>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Exercise PriceHistoryService against a local fake of CoinGecko's market_chart/range.
+
+    python -m benchmarks.price_history --clients 20 --zooms 50
+
+The fake follows CoinGecko's automatic granularity (5 minutes within a day,
+hourly up to 90 days, daily beyond) with deterministic prices. Clients zoom
+around a year of history on a few coins at once; the benchmark reports how
+many chart requests reached the fake server and checks every answer against
+the fake's own series.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from price_history import DAY, PriceHistoryService, granularity_for
+
+
+def fake_price(coin_id, t):
+    return 100 + 10 * math.sin(t / 86400.0 + len(coin_id))
+
+
+def fake_series(coin_id, start, end):
+    span = end - start
+    step = 300 if span <= DAY else 3600 if span <= 90 * DAY else DAY
+    t = (start // step + 1) * step
+    points = []
+    while t <= end:
+        points.append([t * 1000, fake_price(coin_id, t)])
+        t += step
+    return points
+
+
+class FakeCoinGeckoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.1
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        coin_id = url.path.split('/')[-3]
+        query = parse_qs(url.query)
+        with self.lock:
+            FakeCoinGeckoHandler.requests_seen += 1
+        time.sleep(self.latency)
+        points = fake_series(coin_id, int(query['from'][0]), int(query['to'][0]))
+        data = json.dumps({'prices': points}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--zooms', type=int, default=50, help='chart requests per client')
+    parser.add_argument('--coins', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    FakeCoinGeckoHandler.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCoinGeckoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = os.path.join(tempfile.mkdtemp(), 'prices.db')
+    service = PriceHistoryService(path, f"http://127.0.0.1:{server.server_port}/api/v3")
+    coins = [f"coin-{i}" for i in range(args.coins)]
+    now = int(time.time())
+    spans = [DAY // 2, 7 * DAY, 30 * DAY, 60 * DAY, 180 * DAY, 365 * DAY]
+    mismatches = 0
+
+    def zoom(seed):
+        nonlocal mismatches
+        rng = random.Random(seed)
+        latencies = []
+        for _ in range(args.zooms):
+            coin_id = rng.choice(coins)
+            span = rng.choice(spans)
+            end = now - rng.randrange(0, 365 * DAY - span + 1, 3600)
+            started = time.perf_counter()
+            prices = service.history(coin_id, end - span, end)
+            latencies.append(time.perf_counter() - started)
+            step = granularity_for(span)[1]
+            # 取樣檢查：每個點都應落在步長格點上且價格與假服務一致
+            for t, px in prices[::max(1, len(prices) // 20)]:
+                if t % (step * 1000) or abs(px - fake_price(coin_id, t // 1000)) > 1e-9:
+                    mismatches += 1
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        latencies = sorted(l for ls in pool.map(zoom, range(args.clients)) for l in ls)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"chart requests: {service.requests}, reached fake CoinGecko: {FakeCoinGeckoHandler.requests_seen}, "
+          f"mismatched points: {mismatches}")
+    print(f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, total {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
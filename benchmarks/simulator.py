@@ -0,0 +1,378 @@
+"""Local stand-in for the Hyperliquid API with synthetic wallets.
+
+    python -m benchmarks.simulator --port 8765 --fills 5000 --fill-rate 200
+
+Serves POST /info (userFills, userFillsByTime, clearinghouseState, allMids,
+userFunding, meta) and CoinGecko's /coins/<id>/market_chart/range on --port,
+and the WebSocket stream (userFills, userFundings, allMids, ping) on
+--port + 1. Any address is a wallet whose history is generated from the
+address itself, so runs are reproducible. Streamed fills are appended to the
+wallet and show up in later /info answers.
+
+Point the app at it with:
+
+    HL_API_URL=http://127.0.0.1:8765 HL_WS_URL=ws://127.0.0.1:8766/ws \\
+    COINGECKO_BASE_URL=http://127.0.0.1:8765/api/v3 python app.py
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+# 與 Hyperliquid 一致的分頁上限
+FILLS_PAGE_LIMIT = 2000
+FUNDING_PAGE_LIMIT = 500
+COINS = {'BTC': 65000.0, 'ETH': 3500.0, 'SOL': 150.0, 'HYPE': 25.0, 'DOGE': 0.15, 'kPEPE': 0.012}
+
+
+class SyntheticWallet:
+    def __init__(self, address, fills_per_wallet, history_days, now_ms):
+        rng = self.rng = random.Random(address)
+        self.address = address
+        # tid 在不同錢包間不重複
+        base = int(hashlib.sha1(address.encode()).hexdigest()[:8], 16) * 10 ** 7
+        self.next_tid = base
+        self.next_oid = base
+        coins = rng.sample(sorted(COINS), 3)
+        self.coins = coins
+        self.positions = {coin: (rng.choice((-1, 1)) * rng.uniform(0.1, 5) * 1000 / COINS[coin],
+                                 COINS[coin] * rng.uniform(0.9, 1.1)) for coin in coins[:2]}
+        start = now_ms - history_days * DAY_MS
+        times = sorted(rng.randint(start, now_ms) for _ in range(fills_per_wallet))
+        self.fills = []
+        i = 0
+        while i < len(times):
+            # 一張訂單 1 到 3 筆成交
+            n = rng.randint(1, 3)
+            self._order(times[i:i + n], rng.choice(coins))
+            i += n
+        self.times = [f['time'] for f in self.fills]
+
+    def _order(self, times, coin):
+        rng = self.rng
+        self.next_oid += 1
+        closing = rng.random() < 0.5
+        long = rng.random() < 0.6
+        side = 'B' if long != closing else 'A'
+        direction = f"{'Close' if closing else 'Open'} {'Long' if long else 'Short'}"
+        for t in times:
+            px = COINS[coin] * (1 + 0.05 * math.sin(t / DAY_MS + len(coin))) * rng.uniform(0.995, 1.005)
+            sz = round(rng.uniform(100, 5000) / COINS[coin], 4)
+            self.next_tid += 1
+            self.fills.append({
+                'coin': coin, 'px': f"{px:.6g}", 'sz': str(sz), 'side': side, 'time': t,
+                'startPosition': str(round(sz * rng.uniform(0, 3), 4)), 'dir': direction,
+                'closedPnl': f"{rng.gauss(5, 40):.4f}" if closing else '0.0',
+                'hash': f"0x{self.next_tid:064x}", 'oid': self.next_oid, 'crossed': rng.random() < 0.7,
+                'fee': f"{px * sz * 0.00035:.6f}", 'tid': self.next_tid, 'feeToken': 'USDC',
+            })
+
+    def stream_fill(self, now_ms):
+        # 新成交的時間不早於已有的最後一筆
+        now_ms = max(now_ms, self.times[-1] if self.times else 0)
+        self._order([now_ms], self.rng.choice(self.coins))
+        self.times.append(now_ms)
+        return self.fills[-1]
+
+    def fills_by_time(self, start_time, end_time=None):
+        lo = bisect.bisect_left(self.times, start_time)
+        hi = len(self.times) if end_time is None else bisect.bisect_right(self.times, end_time)
+        return self.fills[lo:min(hi, lo + FILLS_PAGE_LIMIT)]
+
+    def funding(self, start_time, end_time, mids):
+        records = []
+        t = -(-start_time // HOUR_MS) * HOUR_MS
+        while t <= end_time and len(records) < FUNDING_PAGE_LIMIT:
+            hour = t // HOUR_MS
+            for coin, (szi, _) in self.positions.items():
+                rate = 0.0000125 * (1 + math.sin(hour / 7 + len(coin)))
+                records.append({'time': t, 'hash': '0x' + '0' * 64, 'delta': {
+                    'type': 'funding', 'coin': coin, 'usdc': f"{-szi * mids[coin] * rate:.6f}",
+                    'szi': f"{szi:.4f}", 'fundingRate': f"{rate:.8f}", 'nSamples': None}})
+            t += HOUR_MS
+        return records
+
+    def state(self, mids, now_ms):
+        positions = []
+        notional = 0.0
+        unrealized = 0.0
+        for coin, (szi, entry) in self.positions.items():
+            value = abs(szi) * mids[coin]
+            pnl = (mids[coin] - entry) * szi
+            notional += value
+            unrealized += pnl
+            positions.append({'type': 'oneWay', 'position': {
+                'coin': coin, 'szi': f"{szi:.4f}", 'entryPx': f"{entry:.6g}", 'positionValue': f"{value:.2f}",
+                'unrealizedPnl': f"{pnl:.2f}", 'returnOnEquity': f"{pnl / (value / 5):.4f}",
+                'leverage': {'type': 'cross', 'value': 5}, 'marginUsed': f"{value / 5:.2f}"}})
+        account = 10000.0 + unrealized
+        summary = {'accountValue': f"{account:.2f}", 'totalNtlPos': f"{notional:.2f}",
+                   'totalRawUsd': f"{account - unrealized:.2f}", 'totalMarginUsed': f"{notional / 5:.2f}"}
+        return {'assetPositions': positions, 'marginSummary': summary, 'crossMarginSummary': summary,
+                'withdrawable': f"{max(0.0, account - notional / 5):.2f}", 'time': now_ms}
+
+
+class Market:
+    """Synthetic wallets and mid prices shared by the HTTP and WebSocket servers."""
+
+    def __init__(self, fills_per_wallet=2000, history_days=120, seed=7):
+        self.fills_per_wallet = fills_per_wallet
+        self.history_days = history_days
+        self.now_ms = int(time.time() * 1000)
+        self.rng = random.Random(seed)
+        self.mids = dict(COINS)
+        self.info_requests = {}
+        self._wallets = {}
+        self._lock = threading.Lock()
+
+    def wallet(self, address):
+        address = address.lower()
+        with self._lock:
+            wallet = self._wallets.get(address)
+        if wallet is None:
+            # 在鎖外生成，大錢包不阻塞其他請求
+            wallet = SyntheticWallet(address, self.fills_per_wallet, self.history_days, self.now_ms)
+            with self._lock:
+                wallet = self._wallets.setdefault(address, wallet)
+        return wallet
+
+    def tick_mids(self):
+        with self._lock:
+            for coin in self.mids:
+                self.mids[coin] *= 1 + self.rng.gauss(0, 0.0005)
+            return {coin: f"{px:.6g}" for coin, px in self.mids.items()}
+
+    def stream_fill(self, address):
+        wallet = self.wallet(address)
+        with self._lock:
+            return wallet.stream_fill(int(time.time() * 1000))
+
+    def info(self, payload):
+        kind = payload.get('type')
+        with self._lock:
+            self.info_requests[kind] = self.info_requests.get(kind, 0) + 1
+            mids = dict(self.mids)
+        now_ms = int(time.time() * 1000)
+        if kind == 'allMids':
+            return {coin: f"{px:.6g}" for coin, px in mids.items()}
+        if kind == 'meta':
+            return {'universe': [{'name': coin, 'szDecimals': 4, 'maxLeverage': 20} for coin in COINS]}
+        user = payload.get('user')
+        if not user:
+            return None
+        wallet = self.wallet(user)
+        with self._lock:
+            if kind == 'userFills':
+                return wallet.fills[-FILLS_PAGE_LIMIT:][::-1]
+            if kind == 'userFillsByTime':
+                return wallet.fills_by_time(payload.get('startTime', 0), payload.get('endTime'))
+            if kind == 'clearinghouseState':
+                return wallet.state(mids, now_ms)
+            if kind == 'userFunding':
+                return wallet.funding(payload.get('startTime', 0), payload.get('endTime') or now_ms, mids)
+        return None
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    market = None
+    latency = 0.0
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/info':
+            return self._send(404, {'error': 'not found'})
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.latency:
+            time.sleep(self.latency)
+        body = self.market.info(payload)
+        if body is None:
+            return self._send(422, {'error': f"unsupported request {payload.get('type')!r}"})
+        self._send(200, body)
+
+    def do_GET(self):
+        # CoinGecko: /api/v3/coins/<id>/market_chart/range?from=&to=
+        # 延遲 import：price_history 經 fill_store 載入 hl_client，它們在 import 時就讀取 HL_API_URL 等環境變數
+        from benchmarks.price_history import fake_series
+
+        url = urlparse(self.path)
+        parts = url.path.rstrip('/').split('/')
+        if len(parts) < 4 or parts[-2:] != ['market_chart', 'range']:
+            return self._send(404, {'error': 'not found'})
+        query = parse_qs(url.query)
+        if self.latency:
+            time.sleep(self.latency)
+        self._send(200, {'prices': fake_series(parts[-3], int(query['from'][0]), int(query['to'][0]))})
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class SimulatorServer(ThreadingHTTPServer):
+    # 默認 listen backlog 只有 5，並發壓測時連線會被重置
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StreamServer:
+    # 每個連線記錄訂閱的 (頻道, 錢包)；成交按 fill_rate 隨機分給已訂閱的錢包
+
+    def __init__(self, market, fill_rate=100.0, mids_interval=1.0):
+        self.market = market
+        self.fill_rate = fill_rate
+        self.mids_interval = mids_interval
+        self.clients = {}
+        self.fills_sent = 0
+        self.messages_sent = 0
+
+    async def handler(self, websocket):
+        subscriptions = self.clients[websocket] = set()
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                method = message.get('method')
+                if method == 'ping':
+                    await self._send(websocket, {'channel': 'pong'})
+                    continue
+                subscription = message.get('subscription', {})
+                key = (subscription.get('type'), (subscription.get('user') or '').lower())
+                if method == 'subscribe':
+                    subscriptions.add(key)
+                    await self._send(websocket, {'channel': 'subscriptionResponse',
+                                                 'data': {'method': method, 'subscription': subscription}})
+                    if key[0] == 'userFills':
+                        fills = self.market.wallet(key[1]).fills[-100:]
+                        await self._send(websocket, {'channel': 'userFills', 'data': {
+                            'isSnapshot': True, 'user': key[1], 'fills': fills}})
+                elif method == 'unsubscribe':
+                    subscriptions.discard(key)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.pop(websocket, None)
+
+    async def produce_fills(self):
+        interval = 0.01
+        owed = 0.0
+        while True:
+            await asyncio.sleep(interval)
+            owed += self.fill_rate * interval
+            subscribed = [(websocket, user) for websocket, subscriptions in list(self.clients.items())
+                          for channel, user in subscriptions if channel == 'userFills']
+            if not subscribed or owed < 1:
+                continue
+            batches = {}
+            for _ in range(int(owed)):
+                websocket, user = random.choice(subscribed)
+                batches.setdefault((websocket, user), []).append(self.market.stream_fill(user))
+            owed -= int(owed)
+            for (websocket, user), fills in batches.items():
+                if await self._send(websocket, {'channel': 'userFills', 'data': {'user': user, 'fills': fills}}):
+                    self.fills_sent += len(fills)
+
+    async def produce_mids(self):
+        while True:
+            await asyncio.sleep(self.mids_interval)
+            mids = self.market.tick_mids()
+            for websocket, subscriptions in list(self.clients.items()):
+                if ('allMids', '') in subscriptions:
+                    await self._send(websocket, {'channel': 'allMids', 'data': {'mids': mids}})
+
+    async def _send(self, websocket, message):
+        try:
+            await websocket.send(json.dumps(message))
+        except websockets.ConnectionClosed:
+            return False
+        self.messages_sent += 1
+        return True
+
+    async def serve(self, host, port, ready=None):
+        async with websockets.serve(self.handler, host, port, max_size=None):
+            if ready is not None:
+                ready.set()
+            await asyncio.gather(self.produce_fills(), self.produce_mids())
+
+
+class Simulator:
+    """Runs the /info HTTP server and the WebSocket server on background threads."""
+
+    def __init__(self, host='127.0.0.1', port=0, fills_per_wallet=2000, fill_rate=100.0,
+                 history_days=120, latency=0.0):
+        self.market = Market(fills_per_wallet, history_days)
+        handler = type('Handler', (SimulatorHandler,), {'market': self.market, 'latency': latency})
+        self.http = SimulatorServer((host, port), handler)
+        self.host = host
+        self.ws_port = self.http.server_port + 1
+        self.stream = StreamServer(self.market, fill_rate)
+
+    @property
+    def api_url(self):
+        return f"http://{self.host}:{self.http.server_port}"
+
+    @property
+    def ws_url(self):
+        return f"ws://{self.host}:{self.ws_port}/ws"
+
+    @property
+    def coingecko_url(self):
+        return f"{self.api_url}/api/v3"
+
+    def environ(self):
+        # 讓 app.py 使用本模擬器的環境變數
+        return {'HL_API_URL': self.api_url, 'HL_WS_URL': self.ws_url, 'COINGECKO_BASE_URL': self.coingecko_url}
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        ready = threading.Event()
+        threading.Thread(target=asyncio.run, args=(self.stream.serve(self.host, self.ws_port, ready),),
+                         daemon=True).start()
+        if not ready.wait(10):
+            raise RuntimeError(f"WebSocket server did not start on port {self.ws_port}")
+        return self
+
+    def stop(self):
+        self.http.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='HTTP port; the WebSocket server uses port + 1')
+    parser.add_argument('--fills', type=int, default=2000, help='historical fills per synthetic wallet')
+    parser.add_argument('--days', type=int, default=120, help='days of history per wallet')
+    parser.add_argument('--fill-rate', type=float, default=100.0, help='streamed fills per second across subscribed wallets')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every HTTP response')
+    args = parser.parse_args()
+
+    simulator = Simulator(args.host, args.port, args.fills, args.fill_rate, args.days, args.latency).start()
+    for name, value in simulator.environ().items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"info requests: {simulator.market.info_requests}, "
+                  f"streamed fills: {simulator.stream.fills_sent}, ws clients: {len(simulator.stream.clients)}")
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
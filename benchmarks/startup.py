@@ -0,0 +1,198 @@
+"""Cold-start cost of app.py against the local Hyperliquid simulator.
+
+    python -m benchmarks.startup --runs 3
+    python -m benchmarks.startup --compare benchmarks/results/<baseline>.json
+
+Every run uses a fresh interpreter and empty local caches, like a new pod.
+It reports how long `import app` takes and which heavy modules it loads,
+then boots `python app.py` and records the time until /healthz answers
+(listening), the time until /readyz returns 200 (warm-up done), how long
+each warm-up step took, and the latency of the first request to a few routes
+for the default wallet. Medians over --runs are reported. There is no
+Postgres here, so the wallets step fails fast and only the default wallet is
+primed.
+
+Results use the benchmarks.suite format, and --compare flags metrics that
+got worse by more than --threshold. `python -m benchmarks.suite` runs this
+too unless given --skip-startup.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from benchmarks.simulator import Simulator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'psycopg2', 'websockets', 'httpx')
+DEFAULT_WALLET = "0xd5f7974e1be5b336094a18c230f39607934e367d"
+
+# 就緒後每個路由只打一次，量的是冷啟動後第一個使用者看到的延遲
+FIRST_ROUTES = [
+    ('track_pnl', f'/api/track_pnl?address={DEFAULT_WALLET}'),
+    ('pnl_timeseries', f'/api/pnl_timeseries?address={DEFAULT_WALLET}'),
+    ('trades_by_address', f'/api/trades_by_address?address={DEFAULT_WALLET}&page=1&limit=20'),
+    ('coin_ids', '/api/coin_ids?coins=BTC,ETH,SOL,kPEPE'),
+]
+
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+print(json.dumps({{'seconds': time.perf_counter() - started,
+                  'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def fresh_environ(environ, workdir):
+    env = dict(os.environ)
+    env.update(environ)
+    env.update({
+        'FILL_STORE_PATH': os.path.join(workdir, 'fills.db'),
+        'PRICE_HISTORY_PATH': os.path.join(workdir, 'prices.db'),
+        'FUNDING_LEDGER_PATH': os.path.join(workdir, 'funding.db'),
+        'FILL_ARCHIVE_PATH': os.path.join(workdir, 'fill_archive'),
+        'PYTHONUNBUFFERED': '1',
+    })
+    env.setdefault('HL_WEIGHT_PER_MINUTE', '1000000')
+    return env
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure_import(environ):
+    with tempfile.TemporaryDirectory(prefix='hl-startup-') as workdir:
+        out = subprocess.check_output([sys.executable, '-c', IMPORT_PROBE], cwd=ROOT,
+                                      env=fresh_environ(environ, workdir), text=True)
+    # app 可能在 import 時打印，只取最後一行
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def wait_for(url, deadline, ok=lambda r: r.status_code == 200):
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            if ok(response):
+                return response
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not ready in time")
+
+
+def measure_boot(environ, timeout):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix='hl-startup-') as workdir:
+        env = fresh_environ(environ, workdir)
+        env.update({'APP_HOST': '127.0.0.1', 'APP_PORT': str(port), 'FLASK_DEBUG': '0'})
+        started = time.monotonic()
+        process = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = started + timeout
+            wait_for(base_url + '/healthz', deadline)
+            listen = time.monotonic() - started
+            status = wait_for(base_url + '/readyz', deadline).json()
+            ready = time.monotonic() - started
+            first = {}
+            with requests.Session() as session:
+                for name, path in FIRST_ROUTES:
+                    t = time.perf_counter()
+                    response = session.get(base_url + path, timeout=60)
+                    response.content
+                    first[name] = (time.perf_counter() - t, response.status_code < 400)
+        finally:
+            process.terminate()
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return listen, ready, status, first
+
+
+def ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def bench_startup(environ, runs=3, timeout=120):
+    imports = [measure_import(environ) for _ in range(runs)]
+    boots = [measure_boot(environ, timeout) for _ in range(runs)]
+    steps = {}
+    for _, _, status, _ in boots:
+        for name, step in status['steps'].items():
+            steps.setdefault(name, []).append(step['seconds'] or 0.0)
+    result = {
+        'import': {'import_ms': ms(statistics.median(r['seconds'] for r in imports)),
+                   'heavy_modules': sorted({m for r in imports for m in r['heavy']})},
+        'boot': {'listen_ms': ms(statistics.median(b[0] for b in boots)),
+                 'ready_ms': ms(statistics.median(b[1] for b in boots))},
+        'warmup_steps': {name: {'step_ms': ms(statistics.median(values))} for name, values in steps.items()},
+        'first_request': {name: {'first_ms': ms(statistics.median(b[3][name][0] for b in boots)),
+                                 'errors': sum(1 for b in boots if not b[3][name][1])}
+                          for name, _ in FIRST_ROUTES},
+        'failed_steps': sorted({name for _, _, status, _ in boots
+                                for name, step in status['steps'].items() if step['error']}),
+    }
+    print(f"import app {result['import']['import_ms']} ms, heavy modules loaded: "
+          f"{', '.join(result['import']['heavy_modules']) or 'none'}")
+    print(f"listening after {result['boot']['listen_ms']} ms, ready after {result['boot']['ready_ms']} ms")
+    for name, step in result['warmup_steps'].items():
+        print(f"  warm-up {name:12} {step['step_ms']:8.1f} ms")
+    for name, stats in result['first_request'].items():
+        print(f"  first {name:18} {stats['first_ms']:8.1f} ms  errors {stats['errors']}")
+    return result
+
+
+def main():
+    # 延遲載入，避免 benchmarks.suite 與本模組互相 import
+    from benchmarks.suite import compare, git_commit, RESULTS_DIR, save
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--fills', type=int, default=5000, help='historical fills per synthetic wallet')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the simulator adds to every /info call')
+    parser.add_argument('--timeout', type=float, default=120.0, help='seconds to wait for /readyz')
+    parser.add_argument('--output', default=RESULTS_DIR, help='directory for result files')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change that counts as a regression')
+    args = parser.parse_args()
+
+    simulator = Simulator(fills_per_wallet=args.fills, latency=args.latency).start()
+    try:
+        results = {'startup': bench_startup(simulator.environ(), args.runs, args.timeout)}
+    finally:
+        simulator.stop()
+    current = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'target': 'python app.py',
+            'params': {key: value for key, value in vars(args).items() if key not in ('compare', 'output')},
+        },
+        'results': results,
+    }
+    print(f"saved {save(current, args.output)}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+"""End-to-end benchmark of app.py against the local Hyperliquid simulator.
+
+    python -m benchmarks.suite --wallets 20 --fills 5000 --requests 200 --concurrency 8
+    python -m benchmarks.suite --compare benchmarks/results/<baseline>.json
+
+Starts benchmarks/simulator.py in-process, points the app at it and serves
+app.py on a local port, then reports the p50/p99 latency and throughput of
+every route, the WebSocket ingest rate through the subscription manager and
+ingest queue, and the memory growth of TradeHistoryBook under a long stream.
+Cold-start import, boot-to-ready and first-request times come from
+benchmarks/startup.py (skip them with --skip-startup).
+The favorites routes need Postgres and are left out. The simulator has no
+rate limit, so HL_WEIGHT_PER_MINUTE is raised unless it is already set.
+
+Results are written to benchmarks/results/<time>-<commit>.json. With
+--compare the new run is checked against an earlier result file and every
+metric that got worse by more than --threshold is listed; the exit status is
+1 when there is a regression. `--compare OLD --results NEW` compares two saved
+files without running anything.
+
+To benchmark another server (e.g. asgi_app.py), start the simulator and the
+server yourself with the simulator's environment and pass
+--simulator http://127.0.0.1:8765 --target http://127.0.0.1:8000.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+import requests
+
+from benchmarks.simulator import Simulator
+from benchmarks.startup import bench_startup
+from benchmarks.trade_history import generate_fills
+from trade_history import TradeHistoryBook
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# (名稱, 方法, 路徑)；{wallet} 每次隨機換一個合成錢包
+ROUTES = [
+    ('user_state', 'GET', '/api/user_state?address={wallet}'),
+    ('trades', 'GET', '/api/trades?address={wallet}'),
+    ('trades_by_address', 'GET', '/api/trades_by_address?address={wallet}&page=1&limit=20'),
+    ('trades_by_address_ndjson', 'GET', '/api/trades_by_address?address={wallet}&limit=0&format=ndjson'),
+    ('pnl_timeseries', 'GET', '/api/pnl_timeseries?address={wallet}'),
+    ('pnl_timeseries_windows', 'GET', '/api/pnl_timeseries?address={wallet}&window=1d,7d,30d&format=ndjson'),
+    ('track_pnl', 'GET', '/api/track_pnl?address={wallet}&window=7d,30d'),
+    ('leaderboard', 'POST', '/api/leaderboard'),
+    ('coin_ids', 'GET', '/api/coin_ids?coins=BTC,ETH,SOL,kPEPE'),
+    ('coin_price_history', 'GET', '/api/coin_price_history?coin_id=bitcoin&from={start}&to={end}'),
+    ('metrics', 'GET', '/metrics'),
+]
+
+# 越大越好的指標，其餘越小越好；不在兩者中的欄位不比較
+HIGHER_IS_BETTER = {'rps', 'fills_per_s', 'emitted_per_s', 'inserts_per_s'}
+LOWER_IS_BETTER = {'p50_ms', 'p99_ms', 'errors', 'dropped', 'final_mib', 'growth_mib',
+                   'import_ms', 'listen_ms', 'ready_ms', 'step_ms', 'first_ms'}
+
+
+def latency_stats(latencies, errors, elapsed):
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p99_ms': round(float(np.percentile(ms, 99)), 2),
+        'max_ms': round(float(ms.max()), 2),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def run_requests(base_url, calls, concurrency):
+    # calls 為 (方法, 路徑, JSON body) 列表；每個工作線程一個 keep-alive session
+    local = threading.local()
+
+    def one(call):
+        method, path, body = call
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=120)
+            # 串流回應讀完才算結束
+            response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, calls))
+    elapsed = time.perf_counter() - started
+    return latency_stats([t for t, ok in results if ok], sum(1 for _, ok in results if not ok), elapsed)
+
+
+def route_calls(method, path, wallets, n, rng):
+    now = int(time.time())
+    calls = []
+    for _ in range(n):
+        body = {'addresses': rng.sample(wallets, min(10, len(wallets)))} if method == 'POST' else None
+        calls.append((method, path.format(wallet=rng.choice(wallets), start=now - 30 * 86400, end=now), body))
+    return calls
+
+
+def bench_routes(base_url, wallets, n, concurrency, seed):
+    rng = random.Random(seed)
+    # 每個錢包的第一次請求會從上游同步全部成交
+    cold = [('GET', f'/api/trades_by_address?address={wallet}&limit=20', None) for wallet in wallets]
+    results = {'cold_sync': run_requests(base_url, cold, concurrency)}
+    print_stats('cold_sync', results['cold_sync'])
+    for name, method, path in ROUTES:
+        results[name] = run_requests(base_url, route_calls(method, path, wallets, n, rng), concurrency)
+        print_stats(name, results[name])
+    return results
+
+
+def print_stats(name, stats):
+    print(f"{name:26} p50 {stats['p50_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  "
+          f"{stats['rps']:8.1f} req/s  errors {stats['errors']}")
+
+
+def bench_ws_ingest(app, simulator, wallets, duration):
+    """Fills per second through SubscriptionManager -> FillIngest -> TradeHistoryBook."""
+    for wallet in wallets:
+        app.subscriptions.add_wallet(wallet, app.handle_fills)
+    app.start_background()
+    deadline = time.monotonic() + 15
+    while app.subscriptions.stats()['subscriptions'] < len(wallets) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    # 等訂閱生效後再開始計時
+    time.sleep(1)
+    before_fills, before_ingest = app.subscriptions.fills, app.ingest.stats()
+    sent = simulator.stream.fills_sent if simulator else None
+    time.sleep(duration)
+    after_ingest = app.ingest.stats()
+    dropped = sum(after_ingest['dropped'].values()) - sum(before_ingest['dropped'].values())
+    result = {
+        'wallets': len(wallets),
+        'seconds': duration,
+        'fills_per_s': round((app.subscriptions.fills - before_fills) / duration, 1),
+        'emitted_per_s': round((after_ingest['emitted_trades'] - before_ingest['emitted_trades']) / duration, 1),
+        'dropped': dropped,
+        'max_queue_depth': after_ingest['max_depth'],
+    }
+    if simulator:
+        result['sent_per_s'] = round((simulator.stream.fills_sent - sent) / duration, 1)
+    print(f"ws ingest: {result}")
+    return result
+
+
+def bench_trade_history(fills, wallets, rounds):
+    """Memory of TradeHistoryBook after each equal slice of a long fill stream."""
+    book = TradeHistoryBook()
+    stream = generate_fills(fills, wallets)
+    per_round = fills // rounds
+    samples = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for _, (address, fill) in zip(range(per_round), stream):
+            book.add_trade(address, fill)
+        samples.append(round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 2))
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    # 前半段填滿每個錢包的上限，後半段應該不再增長
+    result = {
+        'fills': per_round * rounds,
+        'wallets': wallets,
+        'inserts_per_s': round(per_round * rounds / elapsed, 1),
+        'mib_per_round': samples,
+        'final_mib': samples[-1],
+        'growth_mib': round(samples[-1] - samples[len(samples) // 2], 2),
+    }
+    print(f"trade history: {result['final_mib']} MiB after {result['fills']} fills, "
+          f"{result['growth_mib']} MiB growth over the second half, {result['inserts_per_s']} inserts/s")
+    return result
+
+
+def serve_app(app):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # 與 python app.py 一樣先跑完預熱再計時
+    app.start_background()
+    app.warmup.ready.wait(120)
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def flatten(results, prefix=''):
+    # {'routes': {'pnl_timeseries': {'p99_ms': 1}}} -> {'routes.pnl_timeseries.p99_ms': 1}
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline, current, threshold):
+    """Print old/new values per metric and return the names that regressed."""
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    regressions = []
+    print(f"baseline {baseline['meta']['commit']} ({baseline['meta']['time']}) -> "
+          f"current {current['meta']['commit']} ({current['meta']['time']})")
+    for name in sorted(old.keys() & new.keys()):
+        metric = name.rsplit('.', 1)[-1]
+        if metric not in HIGHER_IS_BETTER and metric not in LOWER_IS_BETTER:
+            continue
+        a, b = old[name], new[name]
+        change = (b - a) / abs(a) if a else (0.0 if b == a else float('inf'))
+        worse = -change if metric in HIGHER_IS_BETTER else change
+        # errors / dropped 從 0 變多也算退步
+        regressed = worse > threshold and (a != 0 or metric in ('errors', 'dropped'))
+        if regressed:
+            regressions.append(name)
+        print(f"{'REGRESSION ' if regressed else '           '}{name:50} {a:>12} -> {b:<12} {change * 100:+.1f}%")
+    return regressions
+
+
+def save(result, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+    path = os.path.join(output_dir, f"{stamp}-{result['meta']['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def run(args):
+    simulator = None
+    if args.simulator:
+        url = urlparse(args.simulator)
+        environ = {'HL_API_URL': args.simulator, 'HL_WS_URL': f"ws://{url.hostname}:{url.port + 1}/ws",
+                   'COINGECKO_BASE_URL': f"{args.simulator}/api/v3"}
+    else:
+        simulator = Simulator(fills_per_wallet=args.fills, fill_rate=args.fill_rate, latency=args.latency).start()
+        environ = simulator.environ()
+
+    results = {}
+    if not args.skip_startup:
+        # 每次都在新進程中啟動，須在本進程 import app 之前完成
+        results['startup'] = bench_startup(environ, args.startup_runs)
+
+    # app 及其模組在 import 時讀取設定，必須先設好環境變數；本地狀態都放到臨時目錄
+    workdir = tempfile.mkdtemp(prefix='hl-bench-')
+    os.environ.update(environ)
+    os.environ.update({
+        'FILL_STORE_PATH': os.path.join(workdir, 'fills.db'),
+        'PRICE_HISTORY_PATH': os.path.join(workdir, 'prices.db'),
+        'FILL_ARCHIVE_PATH': '',
+    })
+    os.environ.setdefault('HL_WEIGHT_PER_MINUTE', '1000000')
+    import app
+
+    wallets = [f"0x{random.Random(args.seed + i).getrandbits(160):040x}" for i in range(args.wallets)]
+    server = None
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        server, base_url = serve_app(app)
+    print(f"benchmarking {base_url} against {environ['HL_API_URL']}")
+
+    if not args.skip_routes:
+        results['routes'] = bench_routes(base_url, wallets, args.requests, args.concurrency, args.seed)
+    if not args.skip_ws:
+        ws_wallets = [f"0x{random.Random(-args.seed - i).getrandbits(160):040x}" for i in range(args.ws_wallets)]
+        results['ws_ingest'] = bench_ws_ingest(app, simulator, ws_wallets, args.ws_duration)
+    results['trade_history'] = bench_trade_history(args.history_fills, args.history_wallets, args.history_rounds)
+    if server is not None:
+        server.shutdown()
+    if simulator is not None:
+        results['simulator'] = {'info_requests': dict(simulator.market.info_requests)}
+        simulator.stop()
+
+    params = {key: value for key, value in vars(args).items() if key not in ('compare', 'results', 'output')}
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'target': 'in-process app.py' if not args.target else args.target,
+            'params': params,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--wallets', type=int, default=20, help='synthetic wallets used by the route benchmarks')
+    parser.add_argument('--fills', type=int, default=5000, help='historical fills per synthetic wallet')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the simulator adds to every /info call')
+    parser.add_argument('--ws-wallets', type=int, default=500)
+    parser.add_argument('--fill-rate', type=float, default=2000.0, help='streamed fills per second from the simulator')
+    parser.add_argument('--ws-duration', type=float, default=10.0)
+    parser.add_argument('--history-fills', type=int, default=1000000)
+    parser.add_argument('--history-wallets', type=int, default=100)
+    parser.add_argument('--history-rounds', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--skip-routes', action='store_true')
+    parser.add_argument('--skip-ws', action='store_true')
+    parser.add_argument('--skip-startup', action='store_true')
+    parser.add_argument('--startup-runs', type=int, default=3, help='cold boots of app.py to take the median of')
+    parser.add_argument('--target', help='benchmark an already running server instead of app.py in-process')
+    parser.add_argument('--simulator', help='use a running benchmarks.simulator (its HTTP URL) instead of starting one')
+    parser.add_argument('--output', default=RESULTS_DIR, help='directory for result files')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--results', help='with --compare: compare this saved file instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change that counts as a regression')
+    args = parser.parse_args()
+
+    if args.results:
+        if not args.compare:
+            parser.error('--results needs --compare')
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+        print(f"saved {save(current, args.output)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
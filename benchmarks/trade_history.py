@@ -0,0 +1,102 @@
+"""Insert throughput and steady-state memory of TradeHistoryBook.
+
+    python -m benchmarks.trade_history --fills 1000000 --wallets 100
+
+Streams synthetic fills (mostly in time order, with late arrivals and
+duplicates) through the bounded per-wallet history, and through the old
+sort-on-every-insert list for comparison on a smaller sample.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from trade_history import MAX_TRADES, TradeHistoryBook
+
+
+class LegacyTradeHistory:
+    # 舊版實作：每次插入都排序並截斷，known_trades 只增不減
+
+    def __init__(self):
+        self.trades = []
+        self.known_trades = set()
+
+    def add_trade(self, trade):
+        trade_id = trade.get("tid")
+        if trade_id not in self.known_trades:
+            self.known_trades.add(trade_id)
+            self.trades.append(trade)
+            self.trades.sort(key=lambda x: x.get("time", 0), reverse=True)
+            self.trades = self.trades[:1000]
+            return True
+        return False
+
+
+def generate_fills(n, wallets, late_ratio=0.05, duplicate_ratio=0.01, seed=7):
+    rng = random.Random(seed)
+    addresses = [f"0x{i:040x}" for i in range(wallets)]
+    now = 1_700_000_000_000
+    previous = None
+    for tid in range(n):
+        if previous is not None and rng.random() < duplicate_ratio:
+            yield previous
+            continue
+        now += rng.randint(0, 50)
+        t = now - rng.randint(1, 60_000) if rng.random() < late_ratio else now
+        fill = {"coin": "BTC", "side": "B", "sz": "0.01", "px": "65000.0", "time": t, "tid": tid}
+        previous = (rng.choice(addresses), fill)
+        yield previous
+
+
+def run_book(fills):
+    book = TradeHistoryBook()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for address, fill in fills:
+        book.add_trade(address, fill)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sum(len(h) for h in book.histories.values())
+    known = sum(len(h.known_trades) for h in book.histories.values())
+    return elapsed, current, peak, retained, known
+
+
+def run_legacy(fills):
+    history = LegacyTradeHistory()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _, fill in fills:
+        history.add_trade(fill)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current, peak, len(history.trades), len(history.known_trades)
+
+
+def report(name, n, result):
+    elapsed, current, peak, retained, known = result
+    print(f"{name:<10} {n:>9} fills  {n / elapsed:>12,.0f} inserts/s  "
+          f"retained={retained:<7} known_ids={known:<8} "
+          f"mem={current / 2**20:7.1f} MiB  peak={peak / 2**20:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fills", type=int, default=1_000_000)
+    parser.add_argument("--wallets", type=int, default=100)
+    parser.add_argument("--legacy-fills", type=int, default=20_000,
+                        help="the old implementation is too slow for the full stream")
+    args = parser.parse_args()
+
+    fills = list(generate_fills(args.fills, args.wallets))
+    print(f"window={MAX_TRADES} per wallet, wallets={args.wallets}")
+    report("bounded", len(fills), run_book(fills))
+    if args.legacy_fills:
+        sample = fills[:args.legacy_fills]
+        report("bounded", len(sample), run_book(sample))
+        report("legacy", len(sample), run_legacy(sample))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Load test for SubscriptionManager against a local stand-in Hyperliquid WebSocket server.
+
+    python -m benchmarks.ws_fanin --wallets 2000 --duration 20 --drop-every 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import websockets
+
+from subscription_manager import SubscriptionManager
+
+
+class StandInServer:
+    # 只實作 userFills 訂閱、退訂和 ping，足以壓測訂閱管理器
+
+    def __init__(self, fill_rate):
+        self.fill_rate = fill_rate
+        self.clients = {}
+        self.sent = 0
+
+    async def handler(self, websocket):
+        users = self.clients[websocket] = set()
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                method = message.get("method")
+                if method == "ping":
+                    await websocket.send(json.dumps({"channel": "pong"}))
+                    continue
+                user = message.get("subscription", {}).get("user")
+                if method == "subscribe":
+                    users.add(user)
+                    await websocket.send(json.dumps({
+                        "channel": "userFills",
+                        "data": {"isSnapshot": True, "user": user, "fills": []}
+                    }))
+                elif method == "unsubscribe":
+                    users.discard(user)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.pop(websocket, None)
+
+    async def produce(self):
+        tid = 0
+        interval = 0.01
+        per_tick = max(1, int(self.fill_rate * interval))
+        while True:
+            await asyncio.sleep(interval)
+            for websocket, users in list(self.clients.items()):
+                if not users:
+                    continue
+                for user in random.sample(list(users), min(per_tick, len(users))):
+                    tid += 1
+                    fill = {"coin": "BTC", "px": "65000.0", "sz": "0.01", "side": "B", "dir": "Open Long",
+                            "time": int(time.time() * 1000), "tid": tid, "oid": tid, "closedPnl": "0.0", "fee": "0.1"}
+                    try:
+                        await websocket.send(json.dumps({"channel": "userFills", "data": {"user": user, "fills": [fill]}}))
+                        self.sent += 1
+                    except websockets.ConnectionClosed:
+                        break
+
+    async def drop_connections(self, every):
+        # 定期斷開一條連線，驗證退避重連與重新訂閱
+        while True:
+            await asyncio.sleep(every)
+            if self.clients:
+                websocket = random.choice(list(self.clients))
+                await websocket.close()
+
+
+async def main(args):
+    server = StandInServer(args.fill_rate)
+    async with websockets.serve(server.handler, "127.0.0.1", 0, max_size=None) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        tasks = [asyncio.create_task(server.produce())]
+        if args.drop_every:
+            tasks.append(asyncio.create_task(server.drop_connections(args.drop_every)))
+
+        manager = SubscriptionManager(f"ws://127.0.0.1:{port}",
+                                      max_subscriptions_per_connection=args.per_connection,
+                                      backoff_initial=0.1, backoff_max=2.0)
+        received = {}
+
+        def on_fills(address, fills):
+            received[address] = received.get(address, 0) + len(fills)
+
+        runner = asyncio.create_task(manager.run())
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        for i in range(args.wallets):
+            manager.add_wallet(f"0x{i:040x}", on_fills)
+        while sum(len(users) for users in server.clients.values()) < args.wallets:
+            await asyncio.sleep(0.01)
+        print(f"Subscribed {args.wallets} wallets in {time.perf_counter() - started:.3f}s "
+              f"over {manager.stats()['connections']} connections")
+
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        elapsed = time.perf_counter() - started
+        stats = manager.stats()
+        print(f"Server sent {server.sent} fills, manager routed {stats['fills']} "
+              f"({stats['fills'] / elapsed:.0f} fills/s) to {len(received)} wallets")
+        print(f"Reconnects: {stats['reconnects']}, connected: {stats['connected']}/{stats['connections']}")
+
+        await manager.close()
+        runner.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wallets", type=int, default=1000)
+    parser.add_argument("--per-connection", type=int, default=500)
+    parser.add_argument("--fill-rate", type=int, default=5000, help="fills per second per connection")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--drop-every", type=float, default=0, help="seconds between forced disconnects")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,209 @@
+import argparse
+import os
+import time
+from collections import OrderedDict, deque
+from heapq import merge
+
+from fill_store import FillStore
+
+# 窗口內至少這麼多個不同錢包在同一幣種、同一方向開倉才發出訊號
+CO_ENTRY_MIN_WALLETS = int(os.getenv('CO_ENTRY_MIN_WALLETS', '3'))
+CO_ENTRY_WINDOW_MS = int(os.getenv('CO_ENTRY_WINDOW_MINUTES', '10')) * 60 * 1000
+# 只看開倉成交；平倉和反手不算進場
+ENTRY_DIRS = ('Open Long', 'Open Short')
+# /api/co_entries 返回的最近訊號數
+RECENT_SIGNALS = 100
+DAY_MS = 24 * 60 * 60 * 1000
+# 重放沒有指定起點時回看的天數
+REPLAY_DAYS = 7
+
+
+class EntryWindow:
+    """Wallets that opened one (coin, dir) within the window, least recently active first."""
+
+    __slots__ = ('wallets', 'signalled_at')
+
+    def __init__(self):
+        # address -> [首筆開倉時間, 最後開倉時間, 開倉名義價值]
+        self.wallets = OrderedDict()
+        # 目前這一波聚集上次發出訊號的時間，None 表示還沒發過
+        self.signalled_at = None
+
+    def expire(self, cutoff, min_wallets):
+        wallets = self.wallets
+        while wallets:
+            entry = next(iter(wallets.values()))
+            if entry[1] >= cutoff:
+                break
+            wallets.popitem(last=False)
+        # 錢包數跌回門檻以下，這一波聚集結束
+        if len(wallets) < min_wallets:
+            self.signalled_at = None
+
+
+class CoEntryDetector:
+    """Spots several wallets opening the same coin in the same direction close together.
+
+    Fills are fed one at a time in roughly time order, live from the ingest
+    queue or replayed from stored history. Each (coin, dir) keeps the wallets
+    whose last opening fill is inside the window, so memory depends on the
+    window, not on how long the detector runs. Time is taken from the fills
+    themselves, which makes a replay produce the same signals the live feed
+    did. A signal is returned when a new wallet brings a (coin, dir) to
+    `min_wallets` distinct wallets; while it stays at or above that, new
+    wallets trigger another signal at most once per window.
+    """
+
+    def __init__(self, window_ms=CO_ENTRY_WINDOW_MS, min_wallets=CO_ENTRY_MIN_WALLETS, recent=RECENT_SIGNALS):
+        if min_wallets < 2:
+            raise ValueError('min_wallets must be at least 2')
+        if window_ms <= 0:
+            raise ValueError('window must be positive')
+        self.window_ms = window_ms
+        self.min_wallets = min_wallets
+        self.windows = {}
+        self.recent = deque(maxlen=recent)
+        self.signals = 0
+        self.late = 0
+        # 見過的最晚成交時間
+        self.watermark = 0
+        self._swept = 0
+
+    def add(self, address, fill):
+        """Feed one fill; returns a signal dict or None."""
+        direction = fill.get('dir')
+        if direction not in ENTRY_DIRS:
+            return None
+        t = int(fill['time'])
+        if t > self.watermark:
+            self.watermark = t
+        cutoff = self.watermark - self.window_ms
+        if t < cutoff:
+            self.late += 1
+            return None
+        # 沒有新成交的 (幣種, 方向) 也要定期過期，每過一個窗口清掃一次
+        if self.watermark - self._swept >= self.window_ms:
+            self._sweep(cutoff)
+
+        key = (fill['coin'], direction)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = EntryWindow()
+        else:
+            window.expire(cutoff, self.min_wallets)
+        address = address.lower()
+        size_usd = float(fill.get('px', 0)) * float(fill.get('sz', 0))
+        entry = window.wallets.get(address)
+        if entry is None:
+            window.wallets[address] = [t, t, size_usd]
+        else:
+            entry[0] = min(entry[0], t)
+            entry[1] = max(entry[1], t)
+            entry[2] += size_usd
+            window.wallets.move_to_end(address)
+
+        if entry is not None or len(window.wallets) < self.min_wallets:
+            return None
+        if window.signalled_at is not None and t - window.signalled_at < self.window_ms:
+            return None
+        window.signalled_at = t
+        signal = self._signal(key, window, address, t)
+        self.signals += 1
+        self.recent.append(signal)
+        return signal
+
+    def add_many(self, address, fills):
+        signals = []
+        for fill in fills:
+            signal = self.add(address, fill)
+            if signal is not None:
+                signals.append(signal)
+        return signals
+
+    def _signal(self, key, window, address, t):
+        wallets = sorted(({'address': a, 'first_time': e[0], 'last_time': e[1], 'size_usd': round(e[2], 2)}
+                          for a, e in window.wallets.items()), key=lambda w: w['first_time'])
+        return {
+            'coin': key[0],
+            'dir': key[1],
+            'time': t,
+            'trigger': address,
+            'wallet_count': len(wallets),
+            'first_time': wallets[0]['first_time'],
+            'window_ms': self.window_ms,
+            'size_usd': round(sum(w['size_usd'] for w in wallets), 2),
+            'wallets': wallets,
+        }
+
+    def _sweep(self, cutoff):
+        for key in list(self.windows):
+            window = self.windows[key]
+            window.expire(cutoff, self.min_wallets)
+            if not window.wallets:
+                del self.windows[key]
+        self._swept = self.watermark
+
+
+def replay(histories, window_ms=CO_ENTRY_WINDOW_MS, min_wallets=CO_ENTRY_MIN_WALLETS):
+    """Yield the signals a live detector would have raised over stored fills.
+
+    `histories` maps address -> fills in ascending time order (e.g. from
+    `stored_history`); the wallets are merged lazily by time.
+    """
+    # 參數錯誤在調用時就拋出，而不是等到迭代
+    detector = CoEntryDetector(window_ms, min_wallets, recent=0)
+    return _replay(detector, histories)
+
+
+def _replay(detector, histories):
+    streams = [_timed(address, fills) for address, fills in histories.items()]
+    for _, address, fill in merge(*streams, key=lambda item: item[0]):
+        signal = detector.add(address, fill)
+        if signal is not None:
+            yield signal
+
+
+def _timed(address, fills):
+    for fill in fills:
+        yield fill['time'], address, fill
+
+
+def stored_history(fill_store, address, start_time, end_time=None, chunk_ms=DAY_MS):
+    """Fills of one wallet from the fill store, oldest first, read one day at a time."""
+    end_time = int(time.time() * 1000) if end_time is None else end_time
+    t = start_time
+    while t <= end_time:
+        upper = min(t + chunk_ms - 1, end_time)
+        # query 是新的在前
+        yield from reversed(fill_store.query(address, t, upper))
+        t = upper + 1
+
+
+def describe(signal):
+    opened = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(signal['first_time'] / 1000))
+    return (f"{opened} {signal['coin']} {signal['dir']}: {signal['wallet_count']} wallets, "
+            f"${signal['size_usd']:,.0f} -> {', '.join(w['address'] for w in signal['wallets'])}")
+
+
+def main():
+    # 用本地 fills.db 中已存的成交重放
+    parser = argparse.ArgumentParser(description="Replay co-entry signals over fills stored in the local fill store")
+    parser.add_argument('addresses', nargs='*', help='wallets to include; defaults to every wallet in the store')
+    parser.add_argument('--days', type=float, default=REPLAY_DAYS)
+    parser.add_argument('--window-minutes', type=float, default=CO_ENTRY_WINDOW_MS / 60000)
+    parser.add_argument('--min-wallets', type=int, default=CO_ENTRY_MIN_WALLETS)
+    args = parser.parse_args()
+
+    store = FillStore()
+    addresses = args.addresses or store.addresses()
+    start_time = int((time.time() - args.days * 86400) * 1000)
+    histories = {address: stored_history(store, address, start_time) for address in addresses}
+    count = 0
+    for signal in replay(histories, int(args.window_minutes * 60000), args.min_wallets):
+        count += 1
+        print(describe(signal))
+    print(f"{count} signals from {len(addresses)} wallets")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import csv
+import os
+import pickle
+import re
+
+TOKEN_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'token_list.csv')
+COIN_INDEX_CACHE = os.getenv('COIN_INDEX_CACHE', os.path.splitext(TOKEN_LIST_PATH)[0] + '.pickle')
+# 排序規則改變時加一，讓舊的 pickle 失效
+INDEX_VERSION = 1
+
+# 人工確認過的對應，優先於 CSV 排序（原本前端 coinIdMap 的內容，加上 Hyperliquid 上常見的同名幣）
+OVERRIDES = {
+    'ETH': 'ethereum',
+    'BTC': 'bitcoin',
+    'ARB': 'arbitrum',
+    'OP': 'optimism',
+    'SOL': 'solana',
+    'BNB': 'binancecoin',
+    'DOGE': 'dogecoin',
+    'AVAX': 'avalanche-2',
+    'LINK': 'chainlink',
+    'MATIC': 'matic-network',
+    'XRP': 'ripple',
+    'ADA': 'cardano',
+    'LTC': 'litecoin',
+    'TRX': 'tron',
+    'PEPE': 'pepe',
+    'WIF': 'dogwifcoin',
+    'DYDX': 'dydx-chain',
+    'APT': 'aptos',
+    'FET': 'fetch-ai',
+    'ZK': 'zksync',
+    'ATOM': 'cosmos',
+    'LDO': 'lido-dao',
+    'STRK': 'starknet',
+    'CFX': 'conflux-token',
+    'BERA': 'bera',
+    'DOT': 'polkadot',
+    'W': 'wormhole',
+    'POPCAT': 'popcat',
+    'SUI': 'sui',
+    'JUP': 'jupiter-exchange-solana',
+    'ENA': 'ethena',
+    'MKR': 'maker',
+    'FARTCOIN': 'fartcoin',
+    'HYPE': 'hyperliquid',
+    'PURR': 'purr-2',
+    'TAO': 'bittensor',
+    'UNI': 'uniswap',
+    'TRUMP': 'official-trump',
+    'ACE': 'endurance',
+    'AI': 'sleepless-ai',
+    'ALT': 'altlayer',
+    'APE': 'apecoin',
+    'BANANA': 'banana-gun',
+    'BSV': 'bitcoin-cash-sv',
+    'CYBER': 'cyberconnect',
+    'GOAT': 'goatseus-maximus',
+    'IO': 'io',
+    'LAYER': 'solayer',
+    'MEME': 'memecoin-2',
+    'MNT': 'mantle',
+    'MOVE': 'movement',
+    'PENGU': 'pudgy-penguins',
+    'PNUT': 'peanut-the-squirrel',
+    'POL': 'polygon-ecosystem-token',
+    'S': 'sonic-3',
+    'STX': 'blockstack',
+    'TON': 'the-open-network',
+    'DOGS': 'dogs-2',
+}
+
+# 跨鏈橋、包裝、錨定版本排在原生幣之後
+_DERIVATIVE = re.compile(r'bridged|wrapped|binance-peg|wormhole|osmosis-all|-iou\b|-old\b|-on-')
+_NUMBERED = re.compile(r'-\d+$')
+
+
+def _slug(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def _rank_key(coin_id, name):
+    return (bool(_DERIVATIVE.search(coin_id)), bool(_NUMBERED.search(coin_id)),
+            coin_id != _slug(name), len(coin_id), coin_id)
+
+
+def normalize_symbol(coin):
+    """Map a Hyperliquid coin name to a CoinGecko symbol: `kPEPE` -> `pepe`, `PURR/USDC` -> `purr`."""
+    coin = coin.strip().split('/')[0]
+    if len(coin) > 1 and coin[0] == 'k' and coin[1:].isupper():
+        coin = coin[1:]
+    return coin.lower()
+
+
+def price_multiplier(coin):
+    # Hyperliquid 的 k 前綴代表 1000 枚
+    coin = coin.strip()
+    return 1000 if len(coin) > 1 and coin[0] == 'k' and coin[1:].isupper() else 1
+
+
+class CoinIndex:
+    """Symbol to CoinGecko ids, most likely id first, built once from token_list.csv."""
+
+    def __init__(self, ids_by_symbol):
+        self._ids = ids_by_symbol
+
+    def __len__(self):
+        return len(self._ids)
+
+    @classmethod
+    def from_csv(cls, path=TOKEN_LIST_PATH):
+        rows = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) < 3 or not row[1]:
+                    continue
+                coin_id, symbol, name = row[0], row[1].lower(), row[2]
+                rows.setdefault(symbol, []).append((_rank_key(coin_id, name), coin_id))
+        return cls({symbol: tuple(coin_id for _, coin_id in sorted(ids)) for symbol, ids in rows.items()})
+
+    @classmethod
+    def load(cls, path=TOKEN_LIST_PATH, cache_path=COIN_INDEX_CACHE):
+        # CSV 沒變就直接讀 pickle，省掉解析和排序
+        mtime = os.path.getmtime(path)
+        try:
+            with open(cache_path, 'rb') as f:
+                version, cached_mtime, ids_by_symbol = pickle.load(f)
+            if version == INDEX_VERSION and cached_mtime == mtime:
+                return cls(ids_by_symbol)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+        index = cls.from_csv(path)
+        try:
+            with open(cache_path, 'wb') as f:
+                pickle.dump((INDEX_VERSION, mtime, index._ids), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Error writing coin index cache: {e}")
+        return index
+
+    def candidates(self, coin):
+        symbol = normalize_symbol(coin)
+        ids = self._ids.get(symbol, ())
+        override = OVERRIDES.get(symbol.upper())
+        if override is None:
+            return ids
+        return (override,) + tuple(i for i in ids if i != override)
+
+    def resolve(self, coin):
+        ids = self.candidates(coin)
+        return ids[0] if ids else None
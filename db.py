@@ -0,0 +1,196 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from metrics import registry
+
+# track_wallets.py 也用這裡的配置，所以在此加載 .env
+load_dotenv()
+
+DB_NAME = os.getenv('DB_NAME', 'wallet_tracker')
+DB_USER = os.getenv('DB_USER', 'postgres')
+DB_PASSWORD = os.getenv('DB_PASSWORD', '')
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_PORT = os.getenv('DB_PORT', '5432')
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS favorite_addresses (
+        id SERIAL PRIMARY KEY,
+        address VARCHAR(255) NOT NULL,
+        winrate NUMERIC,
+        tag VARCHAR(255),
+        top_coins JSON,
+        top_profits JSON
+    )""",
+    """CREATE TABLE IF NOT EXISTS wallet_snapshots (
+        id SERIAL PRIMARY KEY,
+        wallet_address VARCHAR(255) NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        realized_pnl NUMERIC,
+        unrealized_pnl NUMERIC,
+        account_value NUMERIC,
+        roe NUMERIC
+    )""",
+    'CREATE INDEX IF NOT EXISTS favorite_addresses_tag_idx ON favorite_addresses (tag)',
+    'CREATE INDEX IF NOT EXISTS wallet_snapshots_wallet_time_idx ON wallet_snapshots (wallet_address, timestamp)',
+]
+
+# 每條連線第一次用到時 PREPARE，之後只發 EXECUTE
+STATEMENTS = {
+    'insert_favorite': ('INSERT INTO favorite_addresses (address, winrate, tag, top_coins, top_profits) '
+                        'VALUES ($1, $2, $3, $4, $5)'),
+    'favorites_by_tag': 'SELECT address, tag FROM favorite_addresses ORDER BY tag',
+    'favorite_address_list': 'SELECT DISTINCT address FROM favorite_addresses',
+}
+
+
+DB_QUERY_SECONDS = registry.histogram('db_query_seconds', 'Postgres statement latency, including waiting for a connection',
+                                      ('statement',))
+
+
+def _connection_class():
+    # psycopg2 在第一次連線時才載入，import 本模組不需要它
+    from psycopg2.extensions import connection
+
+    class _Connection(connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+
+    return _Connection
+
+
+class Database:
+    """Shared Postgres access for the web app and the snapshot collector.
+
+    Connections come from a bounded, lazily opened pool, so the TLS and auth
+    handshake is paid once per pooled connection instead of once per request;
+    callers wait for a free connection when all of them are in use. The
+    `*_async` variants run the same calls on a small thread pool and can be
+    awaited from an event loop.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.connect_kwargs = connect_kwargs or dict(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+                                                     host=DB_HOST, port=DB_PORT)
+        self.waits = 0
+        self._pool = None
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._executor = ThreadPoolExecutor(max_workers=maxconn, thread_name_prefix='db')
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool
+                    self._pool = ThreadedConnectionPool(self.minconn, self.maxconn,
+                                                        connection_factory=_connection_class(), **self.connect_kwargs)
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        # ThreadedConnectionPool 滿了會直接拋錯，這裡改為排隊等待
+        if not self._slots.acquire(blocking=False):
+            self.waits += 1
+            self._slots.acquire()
+        try:
+            conn = self.pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        self._in_use += 1
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self._in_use -= 1
+            self.pool.putconn(conn, close=broken or conn.closed)
+            self._slots.release()
+
+    def execute(self, name, params=(), fetch=False):
+        with DB_QUERY_SECONDS.time(name), self.connection() as conn:
+            with conn.cursor() as cur:
+                if name not in conn.prepared:
+                    cur.execute(f'PREPARE {name} AS {STATEMENTS[name]}')
+                    conn.prepared.add(name)
+                if params:
+                    cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+                else:
+                    cur.execute(f'EXECUTE {name}')
+                return cur.fetchall() if fetch else None
+
+    def ensure_schema(self):
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                for statement in SCHEMA:
+                    cur.execute(statement)
+
+    def add_favorite(self, address, winrate, tag, top_coins, top_profits):
+        self.execute('insert_favorite', (address, winrate, tag, top_coins, top_profits))
+
+    def favorite_addresses(self):
+        return self.execute('favorites_by_tag', fetch=True)
+
+    def favorite_address_list(self):
+        return [address for (address,) in self.execute('favorite_address_list', fetch=True)]
+
+    def insert_snapshots(self, rows):
+        from psycopg2.extras import execute_values
+
+        # 整批快照在同一個事務內寫入
+        with DB_QUERY_SECONDS.time('insert_snapshots'), self.connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """INSERT INTO wallet_snapshots
+                    (wallet_address, timestamp, realized_pnl, unrealized_pnl, account_value, roe)
+                    VALUES %s""",
+                    rows,
+                    page_size=1000
+                )
+
+    async def run_async(self, func, *args):
+        return await asyncio.wrap_future(self._executor.submit(func, *args))
+
+    async def add_favorite_async(self, *args):
+        return await self.run_async(self.add_favorite, *args)
+
+    async def favorite_addresses_async(self):
+        return await self.run_async(self.favorite_addresses)
+
+    async def favorite_address_list_async(self):
+        return await self.run_async(self.favorite_address_list)
+
+    async def insert_snapshots_async(self, rows):
+        return await self.run_async(self.insert_snapshots, rows)
+
+    def stats(self):
+        return {
+            'max_connections': self.maxconn,
+            'in_use': self._in_use,
+            'open': 0 if self._pool is None else len(self._pool._pool) + len(self._pool._used),
+            'waits': self.waits,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+        self._executor.shutdown(wait=False)
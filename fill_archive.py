@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from fill_store import FillStore, KeyedLocks
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# 設為空字串可停用歸檔
+FILL_ARCHIVE_PATH = os.getenv('FILL_ARCHIVE_PATH', 'fill_archive')
+
+# 歸檔欄位與型別；數值欄位在寫入時從字串轉為 float
+ARCHIVE_FIELDS = [
+    ('time', 'int64'),
+    ('tid', 'int64'),
+    ('oid', 'int64'),
+    ('coin', 'string'),
+    ('side', 'string'),
+    ('dir', 'string'),
+    ('px', 'float64'),
+    ('sz', 'float64'),
+    ('closedPnl', 'float64'),
+    ('fee', 'float64'),
+    ('startPosition', 'float64'),
+    ('feeToken', 'string'),
+    ('hash', 'string'),
+    ('crossed', 'bool_'),
+]
+ROW_GROUP_SIZE = 64 * 1024
+
+
+def archive_available():
+    return pa is not None and bool(FILL_ARCHIVE_PATH)
+
+
+def month_of(ms):
+    return str(np.datetime64(int(ms), 'ms').astype('datetime64[M]'))
+
+
+def _month_range(month):
+    start = np.datetime64(month, 'M')
+    return int(start.astype('datetime64[ms]').astype(np.int64)), \
+        int((start + 1).astype('datetime64[ms]').astype(np.int64)) - 1
+
+
+def _months_between(start_ms, end_ms):
+    start = np.datetime64(month_of(start_ms), 'M')
+    end = np.datetime64(month_of(end_ms), 'M')
+    return [str(m) for m in np.arange(start, end + 1)]
+
+
+def _temp_path(directory, prefix):
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix='.tmp', dir=directory)
+    os.close(fd)
+    return path
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class FillArchive:
+    """Columnar per-wallet fill archive, one Parquet file per month.
+
+    Layout is `<root>/<address>/month=YYYY-MM/fills.parquet`, each file sorted
+    by time. Reads with a time range only open the months it overlaps and use
+    row-group statistics on `time` for the rest, and only the requested columns
+    are decoded. The archive is filled from the SQLite fill store: `sync`
+    rewrites just the months whose contents may have changed since last time.
+    """
+
+    def __init__(self, root=FILL_ARCHIVE_PATH):
+        if pa is None:
+            raise ImportError('pyarrow is required for the fill archive')
+        self.root = root
+        self.schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in ARCHIVE_FIELDS])
+        self._partitioning = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+        self._locks = KeyedLocks()
+        os.makedirs(root, exist_ok=True)
+
+    def sync(self, fill_store, address):
+        address = address.lower()
+        with self._locks.get(address):
+            bounds = fill_store.time_bounds(address)
+            if bounds is None:
+                return 0
+            state = self._state(address)
+            lo, hi, count = bounds
+            if state is None:
+                months = _months_between(lo, hi)
+            elif count == state['count']:
+                return 0
+            else:
+                # 新成交只會落在舊的最晚月份及之後，回補只會落在舊的最早月份及之前
+                months = _months_between(state['max_time'], hi)
+                if lo < state['min_time']:
+                    months += _months_between(lo, state['min_time'])
+            months = list(dict.fromkeys(months))
+            for month in months:
+                self._write_month(fill_store, address, month)
+            self._save_state(address, {'min_time': lo, 'max_time': hi, 'count': count})
+            return len(months)
+
+    def table(self, address, start_time=None, end_time=None, columns=None):
+        """Fills of `address` in the range as a pyarrow Table, newest first like FillStore.query."""
+        path = self._address_dir(address)
+        names = columns or [name for name, _ in ARCHIVE_FIELDS]
+        if not os.path.isdir(path):
+            return self.schema.empty_table().select(names)
+        dataset = ds.dataset(path, schema=self.schema.append(pa.field('month', pa.string())), format='parquet',
+                             partitioning=self._partitioning)
+        condition = None
+        # 先按月份分區剪枝，再用 time 過濾
+        if start_time is not None:
+            condition = (ds.field('month') >= month_of(start_time)) & (ds.field('time') >= start_time)
+        if end_time is not None:
+            upper = (ds.field('month') <= month_of(end_time)) & (ds.field('time') <= end_time)
+            condition = upper if condition is None else condition & upper
+        read_columns = list(dict.fromkeys(names + ['time', 'tid']))
+        table = dataset.to_table(columns=read_columns, filter=condition)
+        table = table.sort_by([('time', 'descending'), ('tid', 'descending')])
+        return table.select(names)
+
+    def frame(self, address, start_time=None, end_time=None, columns=None):
+        return self.table(address, start_time, end_time, columns).to_pandas()
+
+    def arrays(self, address, start_time=None, end_time=None, columns=None):
+        # 單一 chunk、無 null 的數值欄位可直接零拷貝成 numpy
+        table = self.table(address, start_time, end_time, columns).combine_chunks()
+        return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+
+    def _address_dir(self, address):
+        return os.path.join(self.root, address.lower())
+
+    def _state(self, address):
+        try:
+            with open(os.path.join(self._address_dir(address), '_state.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self, address, state):
+        path = os.path.join(self._address_dir(address), '_state.json')
+        tmp = _temp_path(os.path.dirname(path), '._state.')
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, path)
+        except BaseException:
+            _discard(tmp)
+            raise
+
+    def _write_month(self, fill_store, address, month):
+        start, end = _month_range(month)
+        fills = fill_store.query(address, start, end)
+        directory = os.path.join(self._address_dir(address), f'month={month}')
+        path = os.path.join(directory, 'fills.parquet')
+        if not fills:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        names = [name for name, _ in ARCHIVE_FIELDS]
+        df = pd.DataFrame.from_records(fills[::-1], columns=names)
+        for name, kind in ARCHIVE_FIELDS:
+            if kind == 'float64':
+                df[name] = pd.to_numeric(df[name])
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        os.makedirs(directory, exist_ok=True)
+        # 先寫臨時檔再替換，讀取方不會看到寫了一半的檔案（. 開頭的檔案不會被掃描）；
+        # 臨時檔名唯一，多個 worker 進程同時歸檔同一錢包也不會寫到同一個檔案
+        tmp = _temp_path(directory, '.fills.')
+        try:
+            pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE)
+            os.replace(tmp, path)
+        except BaseException:
+            _discard(tmp)
+            raise
+
+
+def main():
+    from hl_client import InfoClient
+
+    parser = argparse.ArgumentParser(description="Archive wallet fills as monthly Parquet files for offline analysis")
+    parser.add_argument('addresses', nargs='+')
+    parser.add_argument('--start-time', type=int, help='backfill fills from this epoch ms')
+    args = parser.parse_args()
+
+    info = InfoClient()
+    fill_store = FillStore()
+    archive = FillArchive()
+    for address in args.addresses:
+        fill_store.refresh(info, address, args.start_time)
+        months = archive.sync(fill_store, address)
+        print(f"{address}: rewrote {months} month(s), {archive.table(address, columns=['time']).num_rows} fills archived")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+
+from hl_client import run_plan, run_plan_async
+
+# Hyperliquid returns at most this many fills per userFills / userFillsByTime call
+FILLS_PAGE_LIMIT = 2000
+
+FILL_STORE_PATH = os.getenv('FILL_STORE_PATH', 'fills.db')
+
+
+class FillStore:
+    """Per-address cache of fills keyed by tid.
+
+    Fills are immutable once written, so each wallet only needs to fetch what is
+    newer than its high-water mark. `synced_from` records how far back the stored
+    history is complete; older ranges are backfilled on demand.
+    """
+
+    def __init__(self, path=FILL_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS fills (
+                address TEXT NOT NULL,
+                tid INTEGER NOT NULL,
+                time INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (address, tid)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS fills_address_time ON fills (address, time);
+            CREATE TABLE IF NOT EXISTS fill_sync (
+                address TEXT PRIMARY KEY,
+                synced_from INTEGER NOT NULL,
+                high_water INTEGER NOT NULL
+            );
+        ''')
+        # 同一地址同時只允許一個請求去上游同步
+        self._address_locks = KeyedLocks()
+        self._async_locks = AsyncKeyedLocks()
+
+    def get_fills(self, info, address, start_time=None, end_time=None):
+        self.refresh(info, address, start_time)
+        return self.query(address, start_time, end_time)
+
+    def refresh(self, info, address, start_time=None):
+        address = address.lower()
+        with self._address_locks.get(address):
+            self.sync(info, address, start_time)
+
+    async def refresh_async(self, info, address, start_time=None):
+        """refresh with an AsyncInfoClient; upstream pages are awaited instead of blocking a thread."""
+        address = address.lower()
+        async with self._async_locks.get(address):
+            await run_plan_async(self.sync_plan(address, start_time), info)
+
+    def sync(self, info, address, start_time=None):
+        run_plan(self.sync_plan(address, start_time), info)
+
+    def sync_plan(self, address, start_time=None):
+        # 生成器：yield 要發出的 info 調用，由 run_plan / run_plan_async 執行並送回結果
+        address = address.lower()
+        state = self._sync_state(address)
+        if state is None:
+            fills = yield 'user_fills', (address,)
+            # 少於一頁代表已經拿到完整歷史
+            synced_from = 0 if len(fills) < FILLS_PAGE_LIMIT else min(f['time'] for f in fills)
+            high_water = max((f['time'] for f in fills), default=0)
+            self._save(address, fills, synced_from, high_water)
+            state = (synced_from, high_water)
+        else:
+            synced_from, high_water = state
+            fills = yield from self._fetch_range(address, high_water)
+            if fills:
+                high_water = max(high_water, max(f['time'] for f in fills))
+            self._save(address, fills, synced_from, high_water)
+            state = (synced_from, high_water)
+
+        synced_from, high_water = state
+        if start_time is not None and start_time < synced_from:
+            fills = yield from self._fetch_range(address, start_time, synced_from)
+            self._save(address, fills, start_time, high_water)
+
+    def query(self, address, start_time=None, end_time=None):
+        sql = 'SELECT data FROM fills WHERE address = ?'
+        params = [address.lower()]
+        if start_time is not None:
+            sql += ' AND time >= ?'
+            params.append(start_time)
+        if end_time is not None:
+            sql += ' AND time <= ?'
+            params.append(end_time)
+        # 與 user_fills 一致：新的在前
+        sql += ' ORDER BY time DESC, tid DESC'
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def addresses(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute('SELECT address FROM fill_sync ORDER BY address')]
+
+    def high_water(self, address):
+        state = self._sync_state(address.lower())
+        return state[1] if state else None
+
+    def synced_from(self, address):
+        # 回補舊成交後會變小
+        state = self._sync_state(address.lower())
+        return state[0] if state else None
+
+    def time_bounds(self, address):
+        # 已存成交的 (最早時間, 最晚時間, 筆數)，沒有成交時為 None
+        with self._lock:
+            row = self._conn.execute('SELECT MIN(time), MAX(time), COUNT(*) FROM fills WHERE address = ?',
+                                     (address.lower(),)).fetchone()
+        return None if row[0] is None else row
+
+    def _fetch_range(self, address, start_time, end_time=None):
+        # userFillsByTime 按時間升序分頁，用最後一筆的時間作為下一頁的起點
+        fills = []
+        while True:
+            page = yield 'user_fills_by_time', (address, start_time, end_time)
+            fills.extend(page)
+            if len(page) < FILLS_PAGE_LIMIT:
+                return fills
+            next_start = max(f['time'] for f in page)
+            if next_start <= start_time:
+                return fills
+            start_time = next_start
+
+    def _sync_state(self, address):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT synced_from, high_water FROM fill_sync WHERE address = ?', (address,)
+            ).fetchone()
+
+    def _save(self, address, fills, synced_from, high_water):
+        rows = [(address, f['tid'], f['time'], json.dumps(f)) for f in fills]
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO fills (address, tid, time, data) VALUES (?, ?, ?, ?)', rows)
+            self._conn.execute(
+                'INSERT INTO fill_sync (address, synced_from, high_water) VALUES (?, ?, ?) '
+                'ON CONFLICT(address) DO UPDATE SET synced_from = MIN(synced_from, excluded.synced_from), '
+                'high_water = MAX(high_water, excluded.high_water)',
+                (address, synced_from, high_water)
+            )
+
+
+class KeyedLocks:
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        with self._guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+
+class AsyncKeyedLocks:
+    # 事件循環內使用，等待時不阻塞其他協程
+    def __init__(self):
+        self._locks = {}
+
+    def get(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fill_store import AsyncKeyedLocks, KeyedLocks
+from hl_client import run_plan, run_plan_async
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# Hyperliquid returns at most this many records per userFunding call
+FUNDING_PAGE_LIMIT = 500
+
+FUNDING_LEDGER_PATH = os.getenv('FUNDING_LEDGER_PATH', 'funding.db')
+# 新錢包回溯這麼多天，更早的範圍按需回補
+FUNDING_HISTORY_MS = int(os.getenv('FUNDING_HISTORY_DAYS', '90')) * DAY_MS
+# 資金費整點結算，整點後等這麼久再去上游拿，避免記錄還沒出現
+FUNDING_SETTLE_MS = 60 * 1000
+# 記憶體中最多保留這麼多個錢包的累計和
+FUNDING_LEDGER_WALLETS = int(os.getenv('FUNDING_LEDGER_WALLETS', '256'))
+FUNDING_WORKERS = 8
+FUNDING_CONCURRENCY = 32
+
+
+def settled_hour(t):
+    # t 時已結算完成的最後一個整點
+    return (t - FUNDING_SETTLE_MS) // HOUR_MS
+
+
+class FundingSums:
+    """Cumulative funding of one wallet, overall and per coin.
+
+    Any [start, end] total is the difference of two cumulative sums found by
+    binary search on the record times.
+    """
+
+    def __init__(self, rows):
+        # rows 為按時間排序的 (time, coin, usdc)；numpy 只在第一次讀取合計時載入
+        import numpy as np
+
+        times = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        coins = np.array([r[1] for r in rows], dtype=object)
+        usdc = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+        self.times = times
+        self.cum = np.concatenate([[0.0], np.cumsum(usdc)])
+        self.coins = {}
+        if len(times):
+            names, index = np.unique(coins, return_inverse=True)
+            for i, coin in enumerate(names):
+                mask = index == i
+                self.coins[str(coin)] = (times[mask], np.concatenate([[0.0], np.cumsum(usdc[mask])]))
+
+    @staticmethod
+    def _between(times, cum, start_time, end_time):
+        lo = 0 if start_time is None else times.searchsorted(start_time, 'left')
+        hi = len(times) if end_time is None else times.searchsorted(end_time, 'right')
+        return float(cum[hi] - cum[lo]) if hi > lo else 0.0
+
+    def total(self, start_time=None, end_time=None):
+        return self._between(self.times, self.cum, start_time, end_time)
+
+    def by_coin(self, start_time=None, end_time=None):
+        result = {}
+        for coin, (times, cum) in self.coins.items():
+            amount = self._between(times, cum, start_time, end_time)
+            if amount:
+                result[coin] = amount
+        return result
+
+
+class FundingLedger:
+    """Per-address funding payments kept in SQLite, fetched past a high-water mark.
+
+    Funding is paid hourly and old records never change, so a wallet is fetched
+    at most once per settled hour, and only from its last stored record on.
+    Each record is stored as (time, coin, usdc, szi, rate). Totals for any
+    window come from per-wallet cumulative sums kept in memory.
+    """
+
+    def __init__(self, path=FUNDING_LEDGER_PATH, maxsize=FUNDING_LEDGER_WALLETS):
+        self.path = path
+        self.maxsize = maxsize
+        self.upstream_calls = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS funding (
+                address TEXT NOT NULL,
+                time INTEGER NOT NULL,
+                coin TEXT NOT NULL,
+                usdc REAL NOT NULL,
+                szi REAL,
+                rate REAL,
+                PRIMARY KEY (address, time, coin)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS funding_sync (
+                address TEXT PRIMARY KEY,
+                synced_from INTEGER NOT NULL,
+                high_water INTEGER NOT NULL
+            );
+        ''')
+        # address -> 上次向上游確認的時間；重啟後第一次讀取會再確認一次
+        self._checked = {}
+        self._sums = OrderedDict()
+        # address -> 失效次數；建好的彙總只在期間沒有失效時才放進緩存
+        self._versions = {}
+        self._address_locks = KeyedLocks()
+        self._async_locks = AsyncKeyedLocks()
+
+    def __len__(self):
+        return len(self._sums)
+
+    def refresh(self, info, address, start_time=None):
+        address = address.lower()
+        with self._address_locks.get(address):
+            run_plan(self.sync_plan(address, start_time), info)
+
+    async def refresh_async(self, info, address, start_time=None):
+        """refresh with an AsyncInfoClient."""
+        address = address.lower()
+        async with self._async_locks.get(address):
+            await run_plan_async(self.sync_plan(address, start_time), info)
+
+    def refresh_many(self, info, addresses, workers=FUNDING_WORKERS):
+        """Refresh every address concurrently; returns the failures as [{'address', 'error'}]."""
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='funding') as pool:
+            futures = {pool.submit(self.refresh, info, address): address for address in addresses}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append({'address': futures[future], 'error': str(e)})
+        self.batches += 1
+        return errors
+
+    async def refresh_many_async(self, info, addresses, concurrency=FUNDING_CONCURRENCY):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def refresh(address):
+            async with semaphore:
+                try:
+                    await self.refresh_async(info, address)
+                except Exception as e:
+                    return {'address': address, 'error': str(e)}
+
+        errors = [e for e in await asyncio.gather(*(refresh(address) for address in addresses)) if e]
+        self.batches += 1
+        return errors
+
+    def run_hourly(self, info, watchlist):
+        """Refresh `watchlist()` in one batch shortly after every funding hour; runs forever."""
+        while True:
+            time.sleep(self._until_next_hour())
+            addresses = watchlist()
+            errors = self.refresh_many(info, addresses)
+            for e in errors:
+                print(f"Error refreshing funding for {e['address']}: {e['error']}")
+
+    async def run_hourly_async(self, info, watchlist):
+        while True:
+            await asyncio.sleep(self._until_next_hour())
+            for e in await self.refresh_many_async(info, watchlist()):
+                print(f"Error refreshing funding for {e['address']}: {e['error']}")
+
+    def start(self, info, watchlist):
+        thread = threading.Thread(target=self.run_hourly, args=(info, watchlist), name='funding-hourly', daemon=True)
+        thread.start()
+        return thread
+
+    def sync_plan(self, address, start_time=None, now_ms=None):
+        # 生成器：yield 要發出的 info 調用，由 run_plan / run_plan_async 執行並送回結果
+        address = address.lower()
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        state = self._sync_state(address)
+        checked = self._checked.get(address)
+        due = checked is None or settled_hour(checked) < settled_hour(now_ms)
+        backfill = state is not None and start_time is not None and start_time < state[0]
+        if state is not None and not due and not backfill:
+            return
+        changed = False
+        if state is None:
+            synced_from = now_ms - FUNDING_HISTORY_MS
+            if start_time is not None:
+                synced_from = min(synced_from, start_time)
+            records = yield from self._fetch_range(address, synced_from)
+            high_water = max((r['time'] for r in records), default=synced_from)
+            changed |= self._save(address, records, synced_from, high_water)
+        else:
+            synced_from, high_water = state
+            if due:
+                # 從最後一筆的時間開始拿，同一整點的其他幣種靠主鍵去重
+                records = yield from self._fetch_range(address, high_water)
+                high_water = max((r['time'] for r in records), default=high_water)
+                changed |= self._save(address, records, synced_from, high_water)
+            if backfill:
+                records = yield from self._fetch_range(address, start_time, synced_from)
+                changed |= self._save(address, records, start_time, high_water)
+        self._checked[address] = now_ms
+        if changed:
+            with self._lock:
+                self._sums.pop(address, None)
+                self._versions[address] = self._versions.get(address, 0) + 1
+
+    def total(self, address, start_time=None, end_time=None):
+        """Funding paid to the wallet (negative when paid out) in [start_time, end_time], local data only."""
+        return self.sums(address).total(start_time, end_time)
+
+    def by_coin(self, address, start_time=None, end_time=None):
+        return self.sums(address).by_coin(start_time, end_time)
+
+    def sums(self, address):
+        address = address.lower()
+        with self._lock:
+            sums = self._sums.get(address)
+            if sums is not None:
+                self._sums.move_to_end(address)
+                return sums
+            version = self._versions.get(address, 0)
+            rows = self._conn.execute('SELECT time, coin, usdc FROM funding WHERE address = ? ORDER BY time, coin',
+                                      (address,)).fetchall()
+        sums = FundingSums(rows)
+        with self._lock:
+            if self._versions.get(address, 0) != version:
+                # 建構期間有新資金費寫入，這份已過時，只給本次呼叫用
+                return sums
+            self._sums[address] = sums
+            while len(self._sums) > self.maxsize:
+                self._sums.popitem(last=False)
+        return sums
+
+    def query(self, address, start_time=None, end_time=None):
+        """(time, coin, usdc) rows in time order."""
+        sql = 'SELECT time, coin, usdc FROM funding WHERE address = ?'
+        params = [address.lower()]
+        if start_time is not None:
+            sql += ' AND time >= ?'
+            params.append(start_time)
+        if end_time is not None:
+            sql += ' AND time <= ?'
+            params.append(end_time)
+        sql += ' ORDER BY time, coin'
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def high_water(self, address):
+        state = self._sync_state(address.lower())
+        return state[1] if state else None
+
+    def _until_next_hour(self):
+        now_ms = int(time.time() * 1000)
+        return ((settled_hour(now_ms) + 1) * HOUR_MS + FUNDING_SETTLE_MS - now_ms) / 1000
+
+    def _fetch_range(self, address, start_time, end_time=None):
+        # userFunding 按時間升序分頁，用最後一筆的時間作為下一頁的起點
+        records = []
+        while True:
+            page = yield 'user_funding_history', (address, start_time, end_time)
+            self.upstream_calls += 1
+            records.extend(page)
+            if len(page) < FUNDING_PAGE_LIMIT:
+                return records
+            next_start = max(r['time'] for r in page)
+            if next_start <= start_time:
+                return records
+            start_time = next_start
+
+    def _sync_state(self, address):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT synced_from, high_water FROM funding_sync WHERE address = ?', (address,)
+            ).fetchone()
+
+    def _save(self, address, records, synced_from, high_water):
+        rows = []
+        for r in records:
+            delta = r.get('delta', {})
+            if 'usdc' not in delta:
+                continue
+            rows.append((address, r['time'], delta.get('coin', ''), float(delta['usdc']),
+                         float(delta['szi']) if delta.get('szi') is not None else None,
+                         float(delta['fundingRate']) if delta.get('fundingRate') is not None else None))
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany('INSERT OR IGNORE INTO funding (address, time, coin, usdc, szi, rate) '
+                                   'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            inserted = self._conn.total_changes > before
+            self._conn.execute(
+                'INSERT INTO funding_sync (address, synced_from, high_water) VALUES (?, ?, ?) '
+                'ON CONFLICT(address) DO UPDATE SET synced_from = MIN(synced_from, excluded.synced_from), '
+                'high_water = MAX(high_water, excluded.high_water)',
+                (address, synced_from, high_water)
+            )
+        return inserted
+
+
+def main():
+    from hl_client import InfoClient
+
+    parser = argparse.ArgumentParser(description="Fetch funding payments for a watchlist into the funding ledger")
+    parser.add_argument('addresses', nargs='*')
+    parser.add_argument('--wallets-file', help="file with one wallet address per line")
+    parser.add_argument('--days', type=int, default=30, help="print totals over the last N days")
+    parser.add_argument('--hourly', action='store_true', help="keep running and refresh after every funding hour")
+    args = parser.parse_args()
+
+    addresses = list(args.addresses)
+    if args.wallets_file:
+        with open(args.wallets_file) as f:
+            addresses += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    info = InfoClient()
+    ledger = FundingLedger()
+    start_time = int(time.time() * 1000) - args.days * DAY_MS
+    for address in addresses:
+        ledger.refresh(info, address, start_time)
+        print(f"{address}: {ledger.total(address, start_time):.2f} USDC over {args.days}d "
+              f"{ledger.by_coin(address, start_time)}")
+    if args.hourly:
+        ledger.run_hourly(info, lambda: addresses)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import TTLCache
+from metrics import registry
+
+HL_API_URL = os.getenv('HL_API_URL', 'https://api.hyperliquid.xyz')
+
+# 各類請求的緩存秒數，未列出的不緩存（成交由 fill_store 負責）
+CACHE_TTLS = {
+    'allMids': 1.0,
+    'clearinghouseState': 2.0,
+    'meta': 300.0,
+}
+
+# Hyperliquid 按 IP 限制每分鐘 1200 權重；輕量查詢權重 2，其餘 20
+HL_WEIGHT_PER_MINUTE = int(os.getenv('HL_WEIGHT_PER_MINUTE', '1200'))
+REQUEST_WEIGHTS = {
+    'allMids': 2,
+    'clearinghouseState': 2,
+}
+DEFAULT_REQUEST_WEIGHT = 20
+
+_MISSING = object()
+
+INFO_CALLS = registry.counter('hl_info_calls_total', 'Info calls by request type and where the answer came from',
+                              ('type', 'source'))
+INFO_UPSTREAM_SECONDS = registry.histogram('hl_info_upstream_seconds', 'Latency of upstream /info requests',
+                                           ('type', 'outcome'))
+RATE_LIMIT_WAIT_SECONDS = registry.counter('hl_rate_limit_wait_seconds_total', 'Time spent waiting for request weight')
+
+
+class RateLimiter:
+    """Token bucket shared by every upstream request of the process."""
+
+    def __init__(self, per_minute=HL_WEIGHT_PER_MINUTE):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.waited = 0.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, weight):
+        while True:
+            wait = self._reserve(weight)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, weight):
+        while True:
+            wait = self._reserve(weight)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def _reserve(self, weight):
+        # 拿到額度返回 0，否則返回需要等待的秒數
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= weight:
+                self._tokens -= weight
+                return 0
+            wait = (weight - self._tokens) / self.rate
+            self.waited += wait
+            RATE_LIMIT_WAIT_SECONDS.inc(amount=wait)
+            return wait
+
+
+def run_plan(plan, info):
+    """Drive a generator that yields `(info method name, args)` and is sent each result."""
+    result = None
+    while True:
+        try:
+            name, args = plan.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = getattr(info, name)(*args)
+
+
+def _step(plan, value):
+    # StopIteration 不能穿過 Future，改成返回值
+    try:
+        return False, plan.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+async def run_plan_async(plan, info):
+    """Like run_plan with an AsyncInfoClient.
+
+    Each step of the plan (SQLite, pandas) runs on a worker thread, while the
+    upstream calls between steps are awaited on the event loop, so no thread
+    is held while waiting for Hyperliquid.
+    """
+    result = None
+    while True:
+        done, value = await asyncio.to_thread(_step, plan, result)
+        if done:
+            return value
+        name, args = value
+        result = await getattr(info, name)(*args)
+
+
+class _InfoRequests:
+    # /info 讀取方法；post 是協程時這些方法返回協程
+    def meta(self):
+        return self.post({'type': 'meta'})
+
+    def all_mids(self):
+        return self.post({'type': 'allMids'})
+
+    def user_state(self, address):
+        return self.post({'type': 'clearinghouseState', 'user': address})
+
+    def user_fills(self, address):
+        return self.post({'type': 'userFills', 'user': address})
+
+    def user_fills_by_time(self, address, start_time, end_time=None):
+        payload = {'type': 'userFillsByTime', 'user': address, 'startTime': start_time}
+        if end_time is not None:
+            payload['endTime'] = end_time
+        return self.post(payload)
+
+    def user_funding_history(self, user, startTime, endTime=None):
+        payload = {'type': 'userFunding', 'user': user, 'startTime': startTime}
+        if endTime is not None:
+            payload['endTime'] = endTime
+        return self.post(payload)
+
+
+class InfoClient(_InfoRequests):
+    """Process-wide client for the Hyperliquid /info endpoint.
+
+    Drop-in for the SDK's `Info` read methods used by this app. One pooled
+    keep-alive session is shared by every request; identical requests that are
+    in flight at the same time share a single upstream call, and cheap,
+    frequently polled endpoints are cached for a short TTL. Upstream calls draw
+    from a shared weight budget so batch jobs cannot exceed the API rate limit.
+    """
+
+    def __init__(self, base_url=HL_API_URL, pool_size=32, timeout=10, cache_ttls=None, max_workers=16,
+                 rate_limiter=None):
+        self.base_url = base_url.rstrip('/')
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.timeout = timeout
+        self.cache_ttls = CACHE_TTLS if cache_ttls is None else cache_ttls
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = TTLCache(maxsize=4096)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hl-info')
+
+    def post(self, payload):
+        key = json.dumps(payload, sort_keys=True)
+        kind = payload.get('type')
+        ttl = self.cache_ttls.get(kind)
+        if ttl:
+            cached = self.cache.get(key, _MISSING)
+            if cached is not _MISSING:
+                INFO_CALLS.inc(kind, 'cache')
+                return cached
+
+        # 相同請求正在進行中就等待它的結果，不再重複打上游
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced_calls += 1
+        if not leader:
+            INFO_CALLS.inc(kind, 'coalesced')
+            return future.result()
+        INFO_CALLS.inc(kind, 'upstream')
+
+        try:
+            result = self._request(payload)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            if ttl:
+                self.cache.set(key, result, ttl)
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def submit(self, func, *args):
+        # 併發發出互不依賴的請求
+        return self._executor.submit(func, *args)
+
+    def _request(self, payload):
+        self.rate_limiter.acquire(REQUEST_WEIGHTS.get(payload.get('type'), DEFAULT_REQUEST_WEIGHT))
+        with self._lock:
+            self.upstream_calls += 1
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = self.session.post(self.base_url + '/info', json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+            outcome = 'ok'
+            return result
+        finally:
+            INFO_UPSTREAM_SECONDS.observe(time.perf_counter() - started, payload.get('type'), outcome)
+
+
+class AsyncInfoClient(_InfoRequests):
+    """Coroutine counterpart of InfoClient for the ASGI server.
+
+    Same read methods, cache TTLs, request coalescing and weight budget, but
+    upstream calls are awaited on an httpx connection pool, so a slow /info
+    response holds no thread. Create and use it inside one event loop.
+    """
+
+    def __init__(self, base_url=HL_API_URL, pool_size=100, timeout=10, cache_ttls=None, rate_limiter=None,
+                 cache=None):
+        # httpx 只有 ASGI 模式用到，在這裡才載入，import app 時不載入
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('httpx is required for the async info client') from None
+        self.base_url = base_url.rstrip('/')
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.cache_ttls = CACHE_TTLS if cache_ttls is None else cache_ttls
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self.client = httpx.AsyncClient(
+            timeout=timeout, headers={'Content-Type': 'application/json'},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        self.cache = TTLCache(maxsize=4096) if cache is None else cache
+        self._inflight = {}
+
+    async def post(self, payload):
+        key = json.dumps(payload, sort_keys=True)
+        kind = payload.get('type')
+        ttl = self.cache_ttls.get(kind)
+        if ttl:
+            cached = self.cache.get(key, _MISSING)
+            if cached is not _MISSING:
+                INFO_CALLS.inc(kind, 'cache')
+                return cached
+
+        # 上游請求放在獨立任務裡，發起的請求被取消也不影響其他等待者
+        task = self._inflight.get(key)
+        if task is None:
+            INFO_CALLS.inc(kind, 'upstream')
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch(key, payload, ttl))
+        else:
+            self.coalesced_calls += 1
+            INFO_CALLS.inc(kind, 'coalesced')
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, payload, ttl):
+        try:
+            result = await self._request(payload)
+            if ttl:
+                self.cache.set(key, result, ttl)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _request(self, payload):
+        await self.rate_limiter.acquire_async(REQUEST_WEIGHTS.get(payload.get('type'), DEFAULT_REQUEST_WEIGHT))
+        self.upstream_calls += 1
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await self.client.post(self.base_url + '/info', json=payload)
+            response.raise_for_status()
+            result = response.json()
+            outcome = 'ok'
+            return result
+        finally:
+            INFO_UPSTREAM_SECONDS.observe(time.perf_counter() - started, payload.get('type'), outcome)
+
+    async def aclose(self):
+        await self.client.aclose()
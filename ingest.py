@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '10000'))
+INGEST_FLUSH_MS = int(os.getenv('INGEST_FLUSH_MS', '50'))
+# drop_oldest：丟掉最舊的成交；drop_newest：丟掉新到的成交；block：讓 WebSocket 循環等待空位
+INGEST_POLICY = os.getenv('INGEST_POLICY', 'drop_oldest')
+POLICIES = ('drop_oldest', 'drop_newest', 'block')
+# block 策略每次 put 合計最多等這麼久（不是每筆成交），之後仍然丟棄
+BLOCK_TIMEOUT = 1.0
+MAX_BATCH = 1000
+
+
+class FillIngest:
+    """Bounded queue between the WebSocket loop and Socket.IO clients.
+
+    The WebSocket handler only appends raw fills. A background task wakes up
+    every flush interval, drains the queue, deduplicates the fills into the
+    trade history, formats the new ones and emits them as a single
+    `new_trades` event per batch. New fills are also fed to the optional
+    co-entry detector, whose signals are emitted as `co_entry` events. When
+    the queue is full the configured policy decides which fills are dropped,
+    or holds the producer back.
+    """
+
+    def __init__(self, socketio, trade_history, formatter, maxsize=INGEST_QUEUE_SIZE,
+                 flush_interval=INGEST_FLUSH_MS / 1000, policy=INGEST_POLICY, max_batch=MAX_BATCH, detector=None):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        self.socketio = socketio
+        self.trade_history = trade_history
+        self.formatter = formatter
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.max_batch = max_batch
+        self.detector = detector
+        self.enqueued = 0
+        self.dropped = {'queue_full': 0, 'block_timeout': 0}
+        self.duplicates = 0
+        self.emitted_trades = 0
+        self.emitted_batches = 0
+        self.max_depth = 0
+        self._queue = deque()
+        self._not_full = threading.Condition()
+        self._task = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, address, fills):
+        queue = self._queue
+        # 整條消息共用一個截止時間，滿隊列時 WebSocket 循環最多停 BLOCK_TIMEOUT 秒
+        deadline = time.monotonic() + BLOCK_TIMEOUT
+        with self._not_full:
+            for fill in fills:
+                if len(queue) >= self.maxsize:
+                    if self.policy == 'drop_newest':
+                        self.dropped['queue_full'] += 1
+                        continue
+                    if self.policy == 'drop_oldest':
+                        queue.popleft()
+                        self.dropped['queue_full'] += 1
+                    elif not self._not_full.wait_for(lambda: len(queue) < self.maxsize,
+                                                     max(0.0, deadline - time.monotonic())):
+                        self.dropped['block_timeout'] += 1
+                        continue
+                queue.append((address, fill))
+                self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(queue))
+
+    def start(self):
+        if self._task is None:
+            self._task = self.socketio.start_background_task(self._run)
+        return self._task
+
+    def flush(self):
+        trades, signals, count = self._drain()
+        if trades:
+            self.socketio.emit('new_trades', trades)
+            self._emitted(trades)
+        for signal in signals:
+            self.socketio.emit('co_entry', signal)
+        return count
+
+    async def flush_async(self):
+        # socketio 為 python-socketio 的 AsyncServer
+        trades, signals, count = self._drain()
+        if trades:
+            await self.socketio.emit('new_trades', trades)
+            self._emitted(trades)
+        for signal in signals:
+            await self.socketio.emit('co_entry', signal)
+        return count
+
+    def _drain(self):
+        queue = self._queue
+        with self._not_full:
+            items = [queue.popleft() for _ in range(min(len(queue), self.max_batch))]
+            self._not_full.notify_all()
+        trades = []
+        signals = []
+        for address, fill in items:
+            record = self.trade_history.add_trade(address, fill)
+            if record:
+                trade = self.formatter(record)
+                trade['address'] = address
+                trades.append(trade)
+                # 去重後的成交才送進偵測器，重連補發的不會重複計入
+                signal = self.detector.add(address, fill) if self.detector is not None else None
+                if signal is not None:
+                    signals.append(signal)
+            else:
+                self.duplicates += 1
+        return trades, signals, len(items)
+
+    def _emitted(self, trades):
+        self.emitted_trades += len(trades)
+        self.emitted_batches += 1
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                # 積壓超過一批時連續清空，不等下一個週期
+                while self.flush() == self.max_batch:
+                    pass
+            except Exception as e:
+                print(f"Error flushing fills: {e}")
+            self.socketio.sleep(max(0.0, self.flush_interval - (time.monotonic() - started)))
+
+    async def run_async(self):
+        # 與 WebSocket 訂閱共用同一個事件循環；此模式下不能用 block 策略
+        while True:
+            started = time.monotonic()
+            try:
+                while await self.flush_async() == self.max_batch:
+                    pass
+            except Exception as e:
+                print(f"Error flushing fills: {e}")
+            await asyncio.sleep(max(0.0, self.flush_interval - (time.monotonic() - started)))
+
+    def stats(self):
+        return {
+            'depth': len(self._queue),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'dropped': dict(self.dropped),
+            'duplicates': self.duplicates,
+            'emitted_trades': self.emitted_trades,
+            'emitted_batches': self.emitted_batches,
+        }
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pnl_analytics import DAY_MS, wallet_score
+
+# 同時評分的錢包數；上游速率另由 InfoClient 的權重預算控制
+LEADERBOARD_WORKERS = 8
+# 非同步模式下等待上游不佔線程，可以同時評分更多錢包
+LEADERBOARD_CONCURRENCY = 32
+MAX_ADDRESSES = 1000
+# 評分只看最近 90 天的成交
+SCORE_WINDOW_MS = 90 * DAY_MS
+
+
+def score_address(info, fill_store, address, now_ms):
+    # 成交走本地緩存，持倉查詢與之併發
+    user_state_future = info.submit(info.user_state, address)
+    fills = fill_store.get_fills(info, address, now_ms - SCORE_WINDOW_MS)
+    score = wallet_score(fills, now_ms)
+    return _with_account(score, address, user_state_future.result())
+
+
+async def score_address_async(info, fill_store, address, now_ms):
+    # info 為 AsyncInfoClient；成交同步與持倉查詢一起等待
+    start_time = now_ms - SCORE_WINDOW_MS
+    user_state, _ = await asyncio.gather(info.user_state(address), fill_store.refresh_async(info, address, start_time))
+    fills = await asyncio.to_thread(fill_store.query, address, start_time)
+    score = await asyncio.to_thread(wallet_score, fills, now_ms)
+    return _with_account(score, address, user_state)
+
+
+def _with_account(score, address, user_state):
+    margin = user_state.get('marginSummary', {})
+    account_value = float(margin.get('accountValue', 0))
+    score['address'] = address
+    score['account_value'] = account_value
+    score['roe_30d'] = score['pnl_30d'] / account_value if account_value else None
+    score['roe_90d'] = score['pnl_90d'] / account_value if account_value else None
+    return score
+
+
+def score_addresses(info, fill_store, addresses, workers=LEADERBOARD_WORKERS):
+    """Yield `(address, score, error)` for each wallet as soon as it finishes."""
+    now_ms = int(time.time() * 1000)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='leaderboard')
+    finished = False
+    try:
+        futures = {pool.submit(score_address, info, fill_store, address, now_ms): address for address in addresses}
+        for future in as_completed(futures):
+            address = futures[future]
+            try:
+                yield address, future.result(), None
+            except Exception as e:
+                yield address, None, str(e)
+        finished = True
+    finally:
+        # 客戶端中途斷開時生成器被關閉：取消還在排隊的錢包，不等它們跑完也不再佔用上游額度
+        pool.shutdown(wait=finished, cancel_futures=not finished)
+
+
+async def score_addresses_async(info, fill_store, addresses, concurrency=LEADERBOARD_CONCURRENCY):
+    """Async generator version of score_addresses for the ASGI server."""
+    now_ms = int(time.time() * 1000)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def score(address):
+        async with semaphore:
+            try:
+                return address, await score_address_async(info, fill_store, address, now_ms), None
+            except Exception as e:
+                return address, None, str(e)
+
+    tasks = [asyncio.ensure_future(score(address)) for address in addresses]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # 提前關閉時取消其餘評分
+        for task in tasks:
+            task.cancel()
+
+
+def rank(scores):
+    # 按 30 天 ROE 倒序，沒有帳戶價值的排在最後
+    return sorted(scores, key=lambda s: (s['roe_30d'] is None, -(s['roe_30d'] or 0)))
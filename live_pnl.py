@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import deque
+
+from fill_store import KeyedLocks
+from price_feed import unrealized_pnl_from_mids
+
+# 與 /api/track_pnl 相同的 30 天窗口
+WINDOW_MS = 30 * 24 * 60 * 60 * 1000
+# 未實現盈虧變動小於這個值時不推送
+MIN_CHANGE = 0.01
+
+
+class WalletPnl:
+    """Running 30-day realized and funding PnL of one wallet plus its open positions.
+
+    `snapshot()` has the same keys as the REST `/api/track_pnl` response, and
+    unrealized PnL is estimated from mid prices on both paths.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.realized_pnl = 0.0
+        self.funding_pnl = 0.0
+        self.unrealized_pnl = 0.0
+        # coin -> [資金費合計, 事件數]，事件數歸零時移除，與賬本的 by_coin 一致
+        self.funding_by_coin = {}
+        self.user_state = {}
+        self.last_pushed = None
+        # (time, key, realized, funding)，按時間排序，用於窗口過期
+        self.events = deque()
+        self.seen = set()
+
+    def add(self, t, key, realized=0.0, funding=0.0):
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        self.events.append((t, key, realized, funding))
+        self.realized_pnl += realized
+        self.funding_pnl += funding
+        if key[0] == 'funding':
+            entry = self.funding_by_coin.setdefault(key[2], [0.0, 0])
+            entry[0] += funding
+            entry[1] += 1
+        return True
+
+    def expire(self, cutoff):
+        events = self.events
+        while events and events[0][0] < cutoff:
+            _, key, realized, funding = events.popleft()
+            self.seen.discard(key)
+            self.realized_pnl -= realized
+            self.funding_pnl -= funding
+            if key[0] == 'funding':
+                entry = self.funding_by_coin[key[2]]
+                entry[0] -= funding
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.funding_by_coin[key[2]]
+
+    def snapshot(self):
+        return {
+            "address": self.address,
+            "realized_pnl": self.realized_pnl,
+            "funding_pnl": self.funding_pnl,
+            "funding_by_coin": {coin: amount for coin, (amount, _) in self.funding_by_coin.items() if amount},
+            "unrealized_pnl": self.unrealized_pnl,
+            "total_cumulative_pnl": self.realized_pnl + self.funding_pnl + self.unrealized_pnl
+        }
+
+
+class LivePnlEngine:
+    """Incremental PnL for wallets with live subscribers, pushed over Socket.IO.
+
+    A wallet is seeded once from the fill store and funding ledger when its
+    first subscriber arrives; after that it is updated only from streamed fills,
+    funding events and mid prices, and updates are emitted to the room named
+    after the address. Any number of subscribers share one engine entry.
+    """
+
+    def __init__(self, info, fill_store, funding_ledger, prices, subscriptions, socketio, window_ms=WINDOW_MS):
+        self.info = info
+        self.fill_store = fill_store
+        self.funding_ledger = funding_ledger
+        self.prices = prices
+        self.subscriptions = subscriptions
+        self.socketio = socketio
+        self.window_ms = window_ms
+        self.wallets = {}
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._seed_locks = KeyedLocks()
+        # 價格服務的 allMids 處理器先註冊，這裡讀到的已是最新價格
+        subscriptions.add_feed({"type": "allMids"}, self.on_mids)
+
+    def track(self, address, sid):
+        address = address.lower()
+        with self._lock:
+            subscribers = self._subscribers.setdefault(address, set())
+            subscribers.add(sid)
+        # 同一錢包只初始化一次，其他訂閱者等待並共用結果
+        with self._seed_locks.get(address):
+            wallet = self.wallets.get(address)
+            if wallet is None:
+                wallet = self._seed(address)
+        return wallet.snapshot()
+
+    def untrack(self, address, sid):
+        address = address.lower()
+        # 等正在進行的初始化結束，避免它把錢包放回已無人訂閱的表裡
+        with self._seed_locks.get(address):
+            with self._lock:
+                subscribers = self._subscribers.get(address)
+                if subscribers is None:
+                    return
+                subscribers.discard(sid)
+                if subscribers:
+                    return
+                del self._subscribers[address]
+                wallet = self.wallets.pop(address, None)
+            if wallet is not None:
+                self._unsubscribe(address)
+
+    def untrack_sid(self, sid):
+        with self._lock:
+            addresses = [a for a, subscribers in self._subscribers.items() if sid in subscribers]
+        for address in addresses:
+            self.untrack(address, sid)
+
+    def snapshot(self, address):
+        wallet = self.wallets.get(address.lower())
+        return wallet.snapshot() if wallet else None
+
+    def _seed(self, address):
+        wallet = WalletPnl(address)
+        # 先訂閱再拉歷史，之間到達的事件靠 key 去重
+        self.subscriptions.add_wallet(address, self.on_fills)
+        self.subscriptions.add_wallet(address, self.on_fundings, channel="userFundings")
+        try:
+            end_time = int(time.time() * 1000)
+            start_time = end_time - self.window_ms
+            user_state_future = self.info.submit(self.info.user_state, address)
+            funding_future = self.info.submit(self.funding_ledger.refresh, self.info, address, start_time)
+            fills = self.fill_store.get_fills(self.info, address, start_time, end_time)
+            events = [(f['time'], ('fill', f['tid']), float(f.get('closedPnl', 0)), 0.0) for f in fills]
+            funding_future.result()
+            for t, coin, usdc in self.funding_ledger.query(address, start_time, end_time):
+                events.append((t, ('funding', t, coin), 0.0, usdc))
+            events.sort(key=lambda e: e[0])
+            for event in events:
+                wallet.add(*event)
+            wallet.user_state = user_state_future.result()
+            wallet.unrealized_pnl = unrealized_pnl_from_mids(wallet.user_state, self.prices.mids())
+        except Exception:
+            self._unsubscribe(address)
+            raise
+        wallet.last_pushed = wallet.snapshot()
+        with self._lock:
+            # 初始化期間訂閱者可能已全部離開，此時不發布，退掉剛加的訂閱
+            if self._subscribers.get(address):
+                self.wallets[address] = wallet
+                return wallet
+        self._unsubscribe(address)
+        return wallet
+
+    def _unsubscribe(self, address):
+        self.subscriptions.remove_wallet(address, self.on_fills)
+        self.subscriptions.remove_wallet(address, self.on_fundings, channel="userFundings")
+
+    def on_fills(self, address, fills):
+        wallet = self.wallets.get(address)
+        if wallet is None:
+            return
+        changed = False
+        for fill in fills:
+            changed |= wallet.add(fill.get('time', 0), ('fill', fill.get('tid')), float(fill.get('closedPnl', 0)))
+        if changed:
+            # 成交會改變持倉，在背景刷新 user_state，不阻塞 WebSocket 循環
+            self.info.submit(self._refresh_positions, wallet)
+            self._push(wallet)
+
+    def on_fundings(self, address, fundings):
+        wallet = self.wallets.get(address)
+        if wallet is None:
+            return
+        changed = False
+        for funding in fundings:
+            changed |= wallet.add(funding.get('time', 0), ('funding', funding.get('time'), funding.get('coin')),
+                                  funding=float(funding.get('usdc', 0)))
+        if changed:
+            self._push(wallet)
+
+    def on_mids(self, data):
+        cutoff = int(time.time() * 1000) - self.window_ms
+        mids = self.prices.table
+        for wallet in list(self.wallets.values()):
+            wallet.expire(cutoff)
+            wallet.unrealized_pnl = unrealized_pnl_from_mids(wallet.user_state, mids)
+            self._push(wallet, MIN_CHANGE)
+
+    def _refresh_positions(self, wallet):
+        wallet.user_state = self.info.user_state(wallet.address)
+        wallet.unrealized_pnl = unrealized_pnl_from_mids(wallet.user_state, self.prices.table)
+        self._push(wallet)
+
+    def _push(self, wallet, min_change=0.0):
+        snapshot = wallet.snapshot()
+        last = wallet.last_pushed
+        if last is not None and abs(snapshot['total_cumulative_pnl'] - last['total_cumulative_pnl']) <= min_change \
+                and snapshot['realized_pnl'] == last['realized_pnl']:
+            return
+        wallet.last_pushed = snapshot
+        self.socketio.emit('pnl_update', snapshot, to=wallet.address)
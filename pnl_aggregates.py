@@ -0,0 +1,266 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from fill_store import AsyncKeyedLocks, KeyedLocks
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+FIELDS = ('net_pnl', 'closed_pnl', 'fees', 'trades', 'wins')
+# 窗口合計的欄位；funding 取自資金費賬本
+WINDOW_FIELDS = ('net_pnl', 'closed_pnl', 'fees', 'funding', 'trades', 'wins')
+# 記憶體中最多保留這麼多個錢包，超過時淘汰最久未用的
+PNL_AGGREGATE_WALLETS = int(os.getenv('PNL_AGGREGATE_WALLETS', '256'))
+# 最後一筆成交超過這麼久的訂單不再追蹤，之後的成交算作新訂單
+ORDER_TRACK_MS = DAY_MS
+
+
+def parse_windows(value):
+    """'1d,7d,30d' -> [('1d', 1), ('7d', 7), ('30d', 30)]"""
+    windows = []
+    for part in value.split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if not (part.endswith('d') and part[:-1].isdigit() and int(part[:-1]) > 0):
+            raise ValueError(f"invalid window {part!r}, expected a number of days such as 7d")
+        windows.append((part, int(part[:-1])))
+    if not windows:
+        raise ValueError('window must list at least one window such as 7d')
+    return list(dict.fromkeys(windows))
+
+
+def funding_start(windows, now_ms=None):
+    # 最長窗口的起點（毫秒），用來確定資金費需要回溯多遠
+    today = (int(time.time() * 1000) if now_ms is None else now_ms) // DAY_MS
+    return (today - max(days for _, days in windows) + 1) * DAY_MS
+
+
+class DailyBuckets:
+    """Per-UTC-day sums of FIELDS with running prefix sums.
+
+    Adding to the latest day keeps the prefix sums current in O(1); adding to
+    an older day marks them stale and they are rebuilt on the next read. A
+    trailing window total is the difference of two prefix sums.
+    """
+
+    def __init__(self, first_day):
+        self.first_day = first_day
+        self.values = {name: np.zeros(0) for name in FIELDS}
+        self.prefix = {name: np.zeros(0) for name in FIELDS}
+        self._stale = False
+
+    def __len__(self):
+        return len(self.values['net_pnl'])
+
+    def add(self, day, name, amount):
+        self._cover(day, day)
+        i = day - self.first_day
+        self.values[name][i] += amount
+        if i == len(self) - 1 and not self._stale:
+            self.prefix[name][i] += amount
+        else:
+            self._stale = True
+
+    def add_many(self, name, days, amounts):
+        if len(days) == 0:
+            return
+        self._cover(int(days.min()), int(days.max()))
+        self.values[name] += np.bincount(days - self.first_day, weights=amounts, minlength=len(self))
+        self._stale = True
+
+    def total(self, name, days, today):
+        if self._stale:
+            for field in FIELDS:
+                self.prefix[field] = np.cumsum(self.values[field])
+            self._stale = False
+        end = min(today - self.first_day, len(self) - 1)
+        # 窗口是包含今天在內的最近 days 個 UTC 日，start 是窗口前一天
+        start = today - days - self.first_day
+        if end < 0 or start >= end:
+            return 0.0
+        prefix = self.prefix[name]
+        return float(prefix[end] - (prefix[start] if start >= 0 else 0.0))
+
+    def _cover(self, lo, hi):
+        n = len(self)
+        if not n:
+            self.first_day = lo
+        before = max(0, self.first_day - lo)
+        after = max(0, hi - self.first_day + 1 - n)
+        if not before and not after:
+            return
+        for name in FIELDS:
+            last = self.prefix[name][-1] if n else 0.0
+            self.values[name] = np.concatenate([np.zeros(before), self.values[name], np.zeros(after)])
+            self.prefix[name] = np.concatenate([np.zeros(before), self.prefix[name], np.full(after, last)])
+        self.first_day -= before
+        if before:
+            self._stale = True
+
+
+class WalletAggregate:
+    def __init__(self, address, synced_from):
+        self.address = address
+        self.synced_from = synced_from
+        self.buckets = DailyBuckets(int(time.time() * 1000) // DAY_MS)
+        # 已計入的最晚成交時間，以及該毫秒內已計入的 tid
+        self.fill_time = -1
+        self.fill_edge = set()
+        # oid -> [首筆成交日, 淨盈虧, 最後成交時間]
+        self.orders = {}
+
+    def add_fill(self, fill):
+        t, tid = fill['time'], fill['tid']
+        if t < self.fill_time or (t == self.fill_time and tid in self.fill_edge):
+            return False
+        if t > self.fill_time:
+            self.fill_time, self.fill_edge = t, set()
+        self.fill_edge.add(tid)
+        day = t // DAY_MS
+        closed_pnl = float(fill.get('closedPnl', 0))
+        fee = float(fill.get('fee', 0))
+        buckets = self.buckets
+        buckets.add(day, 'closed_pnl', closed_pnl)
+        buckets.add(day, 'fees', fee)
+        buckets.add(day, 'net_pnl', closed_pnl - fee)
+        order = self.orders.get(fill.get('oid'))
+        if order is None:
+            order = self.orders[fill.get('oid')] = [day, 0.0, t]
+            buckets.add(day, 'trades', 1)
+        # 訂單的盈虧正負翻轉時，調整它首筆成交那天的盈利單數
+        was_win = order[1] > 0
+        order[1] += closed_pnl - fee
+        order[2] = t
+        if (order[1] > 0) != was_win:
+            buckets.add(order[0], 'wins', -1 if was_win else 1)
+        return True
+
+    def seed_fills(self, fills):
+        # 首次載入走向量化：按日 bincount，訂單按 oid 分組
+        if not fills:
+            return
+        df = pd.DataFrame.from_records(fills, columns=['oid', 'tid', 'time', 'closedPnl', 'fee'])
+        times = df['time'].to_numpy(dtype=np.int64)
+        days = times // DAY_MS
+        closed_pnl = pd.to_numeric(df['closedPnl']).to_numpy(dtype=np.float64)
+        fee = pd.to_numeric(df['fee']).to_numpy(dtype=np.float64)
+        buckets = self.buckets
+        buckets.add_many('closed_pnl', days, closed_pnl)
+        buckets.add_many('fees', days, fee)
+        buckets.add_many('net_pnl', days, closed_pnl - fee)
+
+        df['net'] = closed_pnl - fee
+        orders = df.groupby('oid', sort=False).agg(first=('time', 'min'), last=('time', 'max'), net=('net', 'sum'))
+        order_days = orders['first'].to_numpy(dtype=np.int64) // DAY_MS
+        net = orders['net'].to_numpy()
+        buckets.add_many('trades', order_days, np.ones(len(orders)))
+        buckets.add_many('wins', order_days, (net > 0).astype(np.float64))
+
+        self.fill_time = int(times.max())
+        self.fill_edge = set(df['tid'].to_numpy()[times == self.fill_time].tolist())
+        recent = orders[orders['last'] >= self.fill_time - ORDER_TRACK_MS]
+        self.orders = {oid: [int(first) // DAY_MS, float(n), int(last)]
+                       for oid, first, last, n in zip(recent.index, recent['first'], recent['last'], recent['net'])}
+
+    def prune_orders(self):
+        cutoff = self.fill_time - ORDER_TRACK_MS
+        for oid in [oid for oid, order in self.orders.items() if order[2] < cutoff]:
+            del self.orders[oid]
+
+    def windows(self, windows, funding, now_ms=None):
+        # funding(start_ms) 返回從 start_ms 起的資金費合計；為 None 時不輸出 funding
+        today = (int(time.time() * 1000) if now_ms is None else now_ms) // DAY_MS
+        result = {}
+        for label, days in windows:
+            totals = {name: funding((today - days + 1) * DAY_MS) if name == 'funding'
+                      else self.buckets.total(name, days, today)
+                      for name in WINDOW_FIELDS if name != 'funding' or funding is not None}
+            trades, wins = int(round(totals['trades'])), int(round(totals['wins']))
+            totals.update(trades=trades, wins=wins,
+                          winrate=round(100.0 * wins / trades, 2) if trades else None)
+            result[label] = totals
+        return result
+
+
+class PnlAggregates:
+    """Per-wallet daily PnL buckets, kept in memory and caught up incrementally.
+
+    A wallet is built once from every stored fill. Later reads only fold in
+    fills past its high-water mark in the fill store, so a windowed total costs
+    the same however long the wallet's history is. A backfill of older fills
+    rebuilds the wallet. Funding totals come from the funding ledger.
+    """
+
+    def __init__(self, info, fill_store, funding_ledger, maxsize=PNL_AGGREGATE_WALLETS):
+        self.info = info
+        self.fill_store = fill_store
+        self.funding_ledger = funding_ledger
+        self.maxsize = maxsize
+        self.seeds = 0
+        self._wallets = OrderedDict()
+        self._lock = threading.Lock()
+        self._address_locks = KeyedLocks()
+        self._async_locks = AsyncKeyedLocks()
+
+    def __len__(self):
+        return len(self._wallets)
+
+    def windows(self, address, windows, now_ms=None, refresh=True, funding=True):
+        """Totals per window label for the most recent N UTC days, today included.
+
+        With `funding=False` the funding ledger is not touched and the totals
+        have no `funding` key.
+        """
+        address = address.lower()
+        if refresh:
+            self.fill_store.refresh(self.info, address)
+        if funding:
+            # 資金費每個結算整點最多向上游請求一次，其餘時候只讀本地
+            self.funding_ledger.refresh(self.info, address, funding_start(windows, now_ms))
+        with self._address_locks.get(address):
+            return self._windows(address, windows, now_ms, funding)
+
+    async def windows_async(self, info, address, windows, now_ms=None, refresh=True, funding=True):
+        # info 為 AsyncInfoClient
+        address = address.lower()
+        if refresh:
+            await self.fill_store.refresh_async(info, address)
+        if funding:
+            await self.funding_ledger.refresh_async(info, address, funding_start(windows, now_ms))
+        async with self._async_locks.get(address):
+            return await asyncio.to_thread(self._windows, address, windows, now_ms, funding)
+
+    def _windows(self, address, windows, now_ms, funding=True):
+        with self._lock:
+            wallet = self._wallets.get(address)
+            if wallet is not None:
+                self._wallets.move_to_end(address)
+        synced_from = self.fill_store.synced_from(address)
+        if wallet is None or (synced_from is not None and synced_from < wallet.synced_from):
+            wallet = self._seed(address, synced_from)
+        else:
+            self._catch_up(wallet)
+        funding_total = (lambda start: self.funding_ledger.total(address, start)) if funding else None
+        return wallet.windows(windows, funding_total, now_ms)
+
+    def _seed(self, address, synced_from):
+        wallet = WalletAggregate(address, synced_from if synced_from is not None else 0)
+        wallet.seed_fills(self.fill_store.query(address))
+        self.seeds += 1
+        with self._lock:
+            self._wallets[address] = wallet
+            while len(self._wallets) > self.maxsize:
+                self._wallets.popitem(last=False)
+        return wallet
+
+    def _catch_up(self, wallet):
+        # query 是新的在前，倒過來按時間順序計入
+        for fill in reversed(self.fill_store.query(wallet.address, wallet.fill_time)):
+            wallet.add_fill(fill)
+        wallet.prune_orders()
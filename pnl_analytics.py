@@ -0,0 +1,155 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+FILL_COLUMNS = ['oid', 'time', 'coin', 'dir', 'hash', 'px', 'sz', 'closedPnl', 'fee']
+
+
+def summarize_orders(fills):
+    """Aggregate fills into one row per order (oid) using array reductions.
+
+    Columns: oid, time, coin, dir, hash, sz, px (size-weighted), closedPnl,
+    fee_usd, netPnl. `time`/`coin`/`dir`/`hash` come from the order's first fill.
+    `fills` is a list of fill dicts or a DataFrame with FILL_COLUMNS (e.g. from
+    the fill archive).
+    """
+    df = fills if isinstance(fills, pd.DataFrame) else pd.DataFrame.from_records(fills, columns=FILL_COLUMNS)
+    codes, oids = pd.factorize(df['oid'])
+    n = len(oids)
+    sz = pd.to_numeric(df['sz']).to_numpy(dtype=np.float64)
+    px = pd.to_numeric(df['px']).to_numpy(dtype=np.float64)
+    closed_pnl = np.bincount(codes, weights=pd.to_numeric(df['closedPnl']).to_numpy(dtype=np.float64), minlength=n)
+    fee = np.bincount(codes, weights=pd.to_numeric(df['fee']).to_numpy(dtype=np.float64), minlength=n)
+    sz_sum = np.bincount(codes, weights=sz, minlength=n)
+    # 加權平均價格 = sum(px * sz) / sum(sz)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        px_avg = np.bincount(codes, weights=px * sz, minlength=n) / sz_sum
+    # factorize 按首次出現編號，unique 的 return_index 即每個訂單第一筆成交
+    first = np.unique(codes, return_index=True)[1]
+    return pd.DataFrame({
+        'oid': oids,
+        'time': df['time'].to_numpy(dtype=np.int64)[first],
+        'coin': df['coin'].to_numpy()[first],
+        'dir': df['dir'].to_numpy()[first],
+        'hash': df['hash'].to_numpy()[first],
+        'sz': sz_sum,
+        'px': px_avg,
+        'closedPnl': closed_pnl,
+        'fee_usd': fee,
+        'netPnl': closed_pnl - fee,
+    })
+
+
+def strategy_stats(net):
+    # 返回 (盈利單數, 勝率, P/L Ratio, Kelly)
+    wins = net > 0
+    losses = net < 0
+    winning_trades = int(wins.sum())
+    avg_profit = net[wins].mean() if winning_trades else None
+    avg_loss = abs(net[losses].mean()) if losses.any() else 0
+    pl_ratio = float(avg_profit / avg_loss) if avg_profit is not None and avg_loss > 0 else None
+    winrate_decimal = winning_trades / len(net) if len(net) else 0
+    kelly = winrate_decimal - (1 - winrate_decimal) / pl_ratio if pl_ratio else None
+    return winning_trades, winrate_decimal, pl_ratio, kelly
+
+
+def wallet_score(fills, now_ms=None):
+    """Compact per-wallet stats for ranking many wallets at once."""
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    if len(fills) == 0:
+        return {'total_trades': 0, 'winrate': None, 'pl_ratio': None, 'kelly': None,
+                'pnl_7d': 0.0, 'pnl_30d': 0.0, 'pnl_90d': 0.0, 'cumulative_pnl': 0.0}
+    orders = summarize_orders(fills)
+    net = orders['netPnl'].to_numpy()
+    order_time = orders['time'].to_numpy()
+    _, winrate_decimal, pl_ratio, kelly = strategy_stats(net)
+    return {
+        'total_trades': len(orders),
+        'winrate': round(winrate_decimal * 100, 2),
+        'pl_ratio': round(pl_ratio, 2) if pl_ratio else None,
+        'kelly': round(kelly * 100, 2) if kelly else None,
+        'pnl_7d': float(net[order_time >= now_ms - 7 * DAY_MS].sum()),
+        'pnl_30d': float(net[order_time >= now_ms - 30 * DAY_MS].sum()),
+        'pnl_90d': float(net[order_time >= now_ms - 90 * DAY_MS].sum()),
+        'cumulative_pnl': float(net.sum()),
+    }
+
+
+def pnl_summary(fills, unrealized_pnl=0.0, now_ms=None, epoch_ms=False, windows=None):
+    """Daily summary and overall strategy stats for /api/pnl_timeseries.
+
+    With `epoch_ms` each day's `date` is its UTC start in epoch ms instead of `YYYY-MM-DD`.
+    `windows` maps '7d'/'30d'/'90d' to precomputed net PnL (e.g. from PnlAggregates);
+    without it the cumulative windows are summed from `fills`.
+    """
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    orders = summarize_orders(fills)
+    net = orders['netPnl'].to_numpy()
+    sz = orders['sz'].to_numpy()
+    px = orders['px'].to_numpy()
+    order_time = orders['time'].to_numpy()
+
+    # RRR：假設每筆交易的止損點是進場價格的 2%
+    with np.errstate(divide='ignore', invalid='ignore'):
+        take_profit = px * (1 + net / (sz * px))
+        rrr = np.abs((take_profit - px) / (px - px * 0.98))
+
+    wins = net > 0
+    total_trades = len(orders)
+    winning_trades, winrate_decimal, pl_ratio, kelly = strategy_stats(net)
+    overall_winrate = winrate_decimal * 100
+
+    if windows is not None:
+        cum_pnl_7d, cum_pnl_30d, cum_pnl_90d = windows['7d'], windows['30d'], windows['90d']
+    else:
+        cum_pnl_7d = float(net[order_time >= now_ms - 7 * DAY_MS].sum())
+        cum_pnl_30d = float(net[order_time >= now_ms - 30 * DAY_MS].sum())
+        cum_pnl_90d = float(net[order_time >= now_ms - 90 * DAY_MS].sum())
+
+    # 按 UTC 日期彙總，一次 groupby
+    orders['day'] = order_time // DAY_MS
+    orders['win'] = wins
+    orders['size_usd'] = sz * px
+    daily = orders.groupby('day').agg(
+        num_trades=('netPnl', 'size'),
+        wins=('win', 'sum'),
+        median_size_usd=('size_usd', 'median'),
+        sum_netPnl=('netPnl', 'sum'),
+    )
+    coins = orders[['day', 'coin']].drop_duplicates().sort_values(['day', 'coin']).groupby('day')['coin'].agg(list)
+    day_start = daily.index.to_numpy() * DAY_MS
+    dates = day_start.tolist() if epoch_ms else pd.to_datetime(day_start, unit='ms').strftime('%Y-%m-%d')
+
+    summary = []
+    for date, num_trades, day_wins, median_size_usd, sum_net, coins_traded in zip(
+            dates, daily['num_trades'].tolist(), daily['wins'].tolist(), daily['median_size_usd'].tolist(),
+            daily['sum_netPnl'].tolist(), coins.tolist()):
+        summary.append({
+            'date': date,
+            'num_trades': num_trades,
+            'winrate': round(100.0 * day_wins / num_trades, 2),
+            'coins_traded': coins_traded,
+            'median_size_usd': median_size_usd,
+            'sum_netPnl': round(sum_net, 2),
+            'cum_pnl_7d': cum_pnl_7d,
+            'cum_pnl_30d': cum_pnl_30d,
+            'cum_pnl_90d': cum_pnl_90d
+        })
+
+    return {
+        'daily_summary': summary,
+        'overall_stats': {
+            'total_pnl': float(net.sum()) + unrealized_pnl,
+            'overall_winrate': round(overall_winrate, 2),
+            'total_trades': total_trades,
+            'winning_trades': winning_trades,
+            'avg_rrr': round(float(pd.Series(rrr).mean()), 2),
+            'pl_ratio': round(pl_ratio, 2) if pl_ratio else None,
+            'kelly': round(kelly * 100, 2) if kelly else None
+        }
+    }
@@ -0,0 +1,99 @@
+import time
+from array import array
+
+# allMids 推送間隔約一秒，超過這個秒數沒更新就回退到 REST
+STALE_AFTER = 5.0
+
+
+class MidPriceTable:
+    """Coin-indexed mid prices kept in a flat float array.
+
+    Each coin gets a fixed slot the first time it is seen, so updates from the
+    allMids stream overwrite floats in place and lookups are one dict hit plus
+    one array read.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._prices = array('d')
+        self.updated_at = 0.0
+
+    def __len__(self):
+        return len(self._prices)
+
+    def __contains__(self, coin):
+        return coin in self._index
+
+    def __getitem__(self, coin):
+        return self._prices[self._index[coin]]
+
+    def get(self, coin, default=None):
+        i = self._index.get(coin)
+        return default if i is None else self._prices[i]
+
+    def update(self, mids):
+        index = self._index
+        prices = self._prices
+        for coin, px in mids.items():
+            i = index.get(coin)
+            if i is None:
+                # 先寫入數組再登記索引，讀取方不會讀到未寫入的槽位
+                prices.append(float(px))
+                index[coin] = len(prices) - 1
+            else:
+                prices[i] = float(px)
+        self.updated_at = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.updated_at
+
+    def as_dict(self):
+        prices = self._prices
+        return {coin: prices[i] for coin, i in self._index.items()}
+
+
+class MidPriceService:
+    """Mid prices fed by the allMids WebSocket stream, with REST as a fallback."""
+
+    def __init__(self, info, stale_after=STALE_AFTER):
+        self.info = info
+        self.stale_after = stale_after
+        self.table = MidPriceTable()
+        self.rest_fallbacks = 0
+
+    def attach(self, manager):
+        manager.add_feed({"type": "allMids"}, self.on_mids)
+
+    def on_mids(self, data):
+        self.table.update(data.get("mids", {}))
+
+    def mids(self):
+        if self.table.age() > self.stale_after:
+            self.rest_fallbacks += 1
+            self.table.update(self.info.all_mids())
+        return self.table
+
+    async def mids_async(self, info):
+        # info 為 AsyncInfoClient
+        if self.table.age() > self.stale_after:
+            self.rest_fallbacks += 1
+            self.table.update(await info.all_mids())
+        return self.table
+
+    def mid(self, coin, default=None):
+        return self.mids().get(coin, default)
+
+
+def unrealized_pnl_from_mids(user_state, mark_prices):
+    # 以中間價估算未實現盈虧：(市價 - 開倉價) * szi，szi 帶方向（空單為負）
+    unrealized_pnl = 0.0
+    for asset_position in user_state.get('assetPositions', []):
+        position = asset_position.get('position', {})
+        mark_price = mark_prices.get(position.get('coin'))
+        if mark_price is None:
+            continue
+        size = float(position.get('szi', 0))
+        entry_price = float(position.get('entryPx') or 0)
+        if size != 0 and entry_price != 0:
+            unrealized_pnl += (mark_price - entry_price) * size
+    return unrealized_pnl
@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+import requests
+
+from fill_store import KeyedLocks
+
+COINGECKO_BASE_URL = os.getenv('COINGECKO_BASE_URL', 'https://api.coingecko.com/api/v3')
+PRICE_HISTORY_PATH = os.getenv('PRICE_HISTORY_PATH', 'prices.db')
+
+DAY = 24 * 60 * 60
+# CoinGecko market_chart/range 按區間長度自動決定粒度：
+# 1 天內 5 分鐘，1 到 90 天每小時，超過 90 天每天
+# (名稱, 步長秒數, 取得該粒度所需的最短區間, 單次請求最長區間)
+GRANULARITIES = [
+    ('5m', 300, 0, DAY),
+    ('1h', 3600, DAY + 1, 90 * DAY),
+    ('1d', DAY, 90 * DAY + 1, None),
+]
+# 最近一個步長內的價格還會變，這段只緩存這麼多秒
+LIVE_TTL = 60
+
+
+def granularity_for(span):
+    for granularity in GRANULARITIES:
+        if granularity[3] is None or span <= granularity[3]:
+            return granularity
+
+
+def _subtract(intervals, start, end):
+    gaps = []
+    for lo, hi in intervals:
+        if hi < start:
+            continue
+        if lo > end:
+            break
+        if lo > start:
+            gaps.append((start, lo))
+        start = max(start, hi)
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+
+def _add(intervals, start, end):
+    merged = []
+    for lo, hi in sorted(intervals + [(start, end)]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+class PriceSeries:
+    """Price points of one (coin_id, granularity) in parallel arrays, plus the ranges already fetched."""
+
+    __slots__ = ('times', 'prices', 'covered', 'live_from', 'live_checked')
+
+    def __init__(self, times=None, prices=None, covered=()):
+        self.times = times if times is not None else array('q')
+        self.prices = prices if prices is not None else array('d')
+        self.covered = [tuple(c) for c in covered]
+        self.live_from = None
+        self.live_checked = 0.0
+
+    def gaps(self, start, end):
+        if self.live_from is not None:
+            if time.monotonic() - self.live_checked > LIVE_TTL:
+                # 過期後把最新一段當作未取得，下次重新拉
+                self.covered = [(lo, min(hi, self.live_from)) for lo, hi in self.covered if lo < self.live_from]
+                self.live_from = None
+            else:
+                end = min(end, self.live_from)
+        return _subtract(self.covered, start, end)
+
+    def add(self, points, step, start, end, now):
+        # 對齊到步長，同一格保留最後一個價格
+        step_ms = step * 1000
+        merged = dict(zip(self.times, self.prices))
+        for t, px in points:
+            merged[int(t) // step_ms * step_ms] = float(px)
+        times = sorted(merged)
+        self.times = array('q', times)
+        self.prices = array('d', (merged[t] for t in times))
+        self.covered = _add(self.covered, start, min(end, now))
+        if end >= now - step:
+            self.live_from = max(start, now - step)
+            self.live_checked = time.monotonic()
+
+    def persisted_covered(self):
+        if self.live_from is None:
+            return self.covered
+        return [(lo, min(hi, self.live_from)) for lo, hi in self.covered if lo < self.live_from]
+
+    def range(self, start, end):
+        i = bisect_left(self.times, start * 1000)
+        j = bisect_right(self.times, end * 1000)
+        return [[t, px] for t, px in zip(self.times[i:j], self.prices[i:j])]
+
+
+class PriceHistoryService:
+    """Local-first CoinGecko price history for /api/coin_price_history.
+
+    Series are kept per (coin_id, granularity) in memory and in SQLite. A
+    request is answered from storage and only the ranges that were never
+    fetched go upstream, padded so CoinGecko returns the same granularity and
+    merged into as few calls as possible. Requests for the same series wait on
+    one lock, so concurrent chart loads share the upstream calls.
+    """
+
+    def __init__(self, path=PRICE_HISTORY_PATH, base_url=COINGECKO_BASE_URL, api_key=None, timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers.update({'x-cg-demo-api-key': api_key})
+        self.upstream_calls = 0
+        self.requests = 0
+        self._series = {}
+        self._series_locks = KeyedLocks()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS price_series (
+            coin_id TEXT NOT NULL,
+            granularity TEXT NOT NULL,
+            times BLOB NOT NULL,
+            prices BLOB NOT NULL,
+            covered TEXT NOT NULL,
+            PRIMARY KEY (coin_id, granularity)
+        )''')
+        self._conn.commit()
+
+    def history(self, coin_id, start, end):
+        """Return `[[time_ms, price], ...]` for `start`..`end` (unix seconds)."""
+        self.requests += 1
+        name, step, min_span, max_span = granularity_for(end - start)
+        key = (coin_id, name)
+        with self._series_locks.get(key):
+            series = self._load(key)
+            windows = self._windows(series.gaps(start, end), min_span, max_span)
+            for window_start, window_end in windows:
+                points = self._fetch(coin_id, window_start, window_end)
+                series.add(points, step, window_start, window_end, int(time.time()))
+            if windows:
+                self._save(key, series)
+            return series.range(start, end)
+
+    def _windows(self, gaps, min_span, max_span):
+        # 補足最短區間以維持粒度，重疊的缺口合併成一次請求
+        windows = []
+        for start, end in gaps:
+            if end - start < min_span:
+                start = end - min_span
+            while windows and start <= windows[-1][1]:
+                start = min(start, windows.pop()[0])
+            windows.append((start, end))
+        if max_span is None:
+            return windows
+        split = []
+        for start, end in windows:
+            while end - start > max_span:
+                split.append((start, start + max_span))
+                start += max_span
+            # 切剩的尾段也要補足最短區間，否則上游會返回更細的粒度
+            split.append((min(start, end - min_span), end))
+        return split
+
+    def _fetch(self, coin_id, start, end):
+        self.upstream_calls += 1
+        resp = self.session.get(f"{self.base_url}/coins/{coin_id}/market_chart/range",
+                                params={'vs_currency': 'usd', 'from': start, 'to': end}, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json().get('prices', [])
+
+    def _load(self, key):
+        series = self._series.get(key)
+        if series is not None:
+            return series
+        with self._db_lock:
+            row = self._conn.execute('SELECT times, prices, covered FROM price_series WHERE coin_id = ? AND granularity = ?',
+                                     key).fetchone()
+        series = PriceSeries()
+        if row is not None:
+            series.times.frombytes(row[0])
+            series.prices.frombytes(row[1])
+            series.covered = [tuple(c) for c in json.loads(row[2])]
+        self._series[key] = series
+        return series
+
+    def _save(self, key, series):
+        with self._db_lock:
+            self._conn.execute('INSERT OR REPLACE INTO price_series VALUES (?, ?, ?, ?, ?)',
+                               (*key, series.times.tobytes(), series.prices.tobytes(),
+                                json.dumps(series.persisted_covered())))
+            self._conn.commit()
@@ -0,0 +1,68 @@
+import json
+
+from flask import Response, stream_with_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ?format= 可選值；不帶參數時維持原本的 jsonify 輸出
+FORMATS = ('json', 'ndjson')
+# 攢夠這麼多行再寫出一塊
+CHUNK_ROWS = 500
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def _chunks(parts):
+    chunk = []
+    for part in parts:
+        chunk.append(part)
+        if len(chunk) >= CHUNK_ROWS:
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        yield b''.join(chunk)
+
+
+def ndjson_chunks(rows, meta=None):
+    """One JSON object per line; response-level fields come first as `{"meta": ...}`."""
+    if meta is not None:
+        yield dumps({'meta': meta}) + b'\n'
+    yield from _chunks(dumps(row) + b'\n' for row in rows)
+
+
+def json_chunks(rows, fields=None, key=None):
+    """`rows` as a JSON array, or as `key` of an object that also holds `fields`."""
+    if key is None:
+        yield b'['
+    else:
+        head = dumps(fields or {})[:-1]
+        yield head + (b',' if len(head) > 1 else b'') + dumps(key) + b':['
+    yield from _chunks((b',' if i else b'') + dumps(row) for i, row in enumerate(rows))
+    yield b']' if key is None else b']}'
+
+
+def stream_chunks(fmt, rows, fields=None, key=None):
+    # 返回 (bytes 迭代器, mimetype)，Flask 與 ASGI 兩種服務共用
+    if fmt == 'ndjson':
+        return ndjson_chunks(rows, fields), 'application/x-ndjson'
+    return json_chunks(rows, fields, key), 'application/json'
+
+
+def ndjson_response(rows, meta=None):
+    return Response(stream_with_context(ndjson_chunks(rows, meta)), mimetype='application/x-ndjson')
+
+
+def json_response(rows, fields=None, key=None):
+    return Response(stream_with_context(json_chunks(rows, fields, key)), mimetype='application/json')
+
+
+def stream_response(fmt, rows, fields=None, key=None):
+    chunks, mimetype = stream_chunks(fmt, rows, fields, key)
+    return Response(stream_with_context(chunks), mimetype=mimetype)
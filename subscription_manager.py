@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import random
+from threading import Thread
+
+# Hyperliquid WebSocket endpoint（壓測時指向 benchmarks/simulator.py）
+WS_URL = os.getenv('HL_WS_URL', "wss://api.hyperliquid.xyz/ws")
+
+# 每條連線最多承載的訂閱數，超過就開新連線
+MAX_SUBSCRIPTIONS_PER_CONNECTION = 1000
+# Hyperliquid 會關閉 60 秒沒有訊息的連線
+PING_INTERVAL = 50
+
+# 按錢包訂閱的頻道，以及訊息 data 中承載事件列表的欄位
+WALLET_CHANNELS = {
+    "userFills": "fills",
+    "userFundings": "fundings",
+}
+
+
+class SubscriptionManager:
+    """Multiplexes many wallet subscriptions onto a small pool of WebSocket connections.
+
+    Wallet channels (`userFills`, `userFundings`) are used because their messages
+    carry the `user` field, so events from a shared connection can be routed to
+    per-wallet handlers, called as `handler(address, events)`; handlers may be
+    coroutines. Non-wallet feeds such as `allMids` are added with `add_feed` and
+    their handlers receive the message's `data`.
+    """
+
+    def __init__(self, url=WS_URL, max_subscriptions_per_connection=MAX_SUBSCRIPTIONS_PER_CONNECTION,
+                 backoff_initial=1.0, backoff_max=60.0, include_snapshots=False):
+        self.url = url
+        self.max_subscriptions_per_connection = max_subscriptions_per_connection
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.include_snapshots = include_snapshots
+        self.loop = None
+        self.messages = 0
+        self.fills = 0
+        self.messages_by_channel = {}
+        # 已排程但還沒跑完的協程處理器數
+        self.pending_handlers = 0
+        self._handlers = {}
+        self._owner = {}
+        self._feeds = {}
+        self._connections = []
+        self._closing = False
+
+    @property
+    def addresses(self):
+        # 其他線程也會讀取；list() 在 GIL 下一次複製鍵，不會遇到迭代中字典被修改
+        return sorted({address for _, address in list(self._handlers)})
+
+    def add_wallet(self, address, handler, channel="userFills"):
+        self._call(self._add_wallet, (channel, address.lower()), handler)
+
+    def remove_wallet(self, address, handler=None, channel="userFills"):
+        self._call(self._remove_wallet, (channel, address.lower()), handler)
+
+    def add_feed(self, subscription, handler):
+        self._call(self._add_feed, subscription, handler)
+
+    def start(self):
+        # 在獨立線程跑事件循環，供 Flask 使用
+        thread = Thread(target=asyncio.run, args=(self.run(),))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        for key in list(self._handlers):
+            if key not in self._owner:
+                self._place(key)
+        for subscription, _ in self._feeds.values():
+            self._connection().add_feed(subscription)
+        while not self._closing:
+            await asyncio.sleep(1)
+
+    async def close(self):
+        self._closing = True
+        for connection in self._connections:
+            connection.task.cancel()
+        await asyncio.gather(*(c.task for c in self._connections), return_exceptions=True)
+
+    def stats(self):
+        return {
+            'connections': len(self._connections),
+            'connected': sum(1 for c in self._connections if c.websocket is not None),
+            'subscriptions': len(self._owner),
+            'messages': self.messages,
+            'fills': self.fills,
+            'reconnects': sum(c.reconnects for c in self._connections),
+            'pending_handlers': self.pending_handlers,
+        }
+
+    def _call(self, func, *args):
+        # 允許從其他線程（例如 Flask 請求）增減訂閱
+        if self.loop is None:
+            func(*args)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def _add_wallet(self, key, handler):
+        handlers = self._handlers.setdefault(key, [])
+        if handler not in handlers:
+            handlers.append(handler)
+        if self.loop is not None and key not in self._owner:
+            self._place(key)
+
+    def _remove_wallet(self, key, handler=None):
+        handlers = self._handlers.get(key)
+        if handlers is None:
+            return
+        if handler is not None and handler in handlers:
+            handlers.remove(handler)
+        if handler is None or not handlers:
+            del self._handlers[key]
+            connection = self._owner.pop(key, None)
+            if connection is not None:
+                connection.remove(key)
+
+    def _add_feed(self, subscription, handler):
+        channel = subscription["type"]
+        if channel in self._feeds:
+            self._feeds[channel][1].append(handler)
+            return
+        self._feeds[channel] = (subscription, [handler])
+        if self.loop is not None:
+            self._connection().add_feed(subscription)
+
+    def _place(self, key):
+        connection = self._connection()
+        self._owner[key] = connection
+        connection.add(key)
+
+    def _connection(self):
+        # 放到負載最低且還有空位的連線上
+        candidates = [c for c in self._connections if len(c.keys) < self.max_subscriptions_per_connection]
+        if candidates:
+            return min(candidates, key=lambda c: len(c.keys))
+        connection = _Connection(self, len(self._connections))
+        self._connections.append(connection)
+        connection.task = self.loop.create_task(connection.run())
+        return connection
+
+    def _dispatch(self, message):
+        self.messages += 1
+        channel = message.get("channel")
+        self.messages_by_channel[channel] = self.messages_by_channel.get(channel, 0) + 1
+        data = message.get("data", {})
+        if channel in self._feeds:
+            for handler in list(self._feeds[channel][1]):
+                try:
+                    handler(data)
+                except Exception as e:
+                    print(f"Handler error for {channel}: {e}")
+            return
+        field = WALLET_CHANNELS.get(channel)
+        if field is None:
+            return
+        if data.get("isSnapshot") and not self.include_snapshots:
+            return
+        address = data.get("user", "").lower()
+        events = data.get(field, [])
+        if channel == "userFills":
+            self.fills += len(events)
+        for handler in list(self._handlers.get((channel, address), ())):
+            try:
+                result = handler(address, events)
+                if asyncio.iscoroutine(result):
+                    self.pending_handlers += 1
+                    self.loop.create_task(result).add_done_callback(self._handler_done)
+            except Exception as e:
+                print(f"Handler error for {address}: {e}")
+
+    def _handler_done(self, task):
+        self.pending_handlers -= 1
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Handler error: {task.exception()}")
+
+
+class _Connection:
+    def __init__(self, manager, index):
+        self.manager = manager
+        self.index = index
+        self.keys = set()
+        self.feeds = []
+        self.websocket = None
+        self.task = None
+        self.reconnects = 0
+
+    def add(self, key):
+        self.keys.add(key)
+        if self.websocket is not None:
+            self.manager.loop.create_task(self._send("subscribe", _wallet_subscription(key)))
+
+    def remove(self, key):
+        self.keys.discard(key)
+        if self.websocket is not None:
+            self.manager.loop.create_task(self._send("unsubscribe", _wallet_subscription(key)))
+
+    def add_feed(self, subscription):
+        self.feeds.append(subscription)
+        if self.websocket is not None:
+            self.manager.loop.create_task(self._send("subscribe", subscription))
+
+    async def run(self):
+        # websockets 只在真正連線時載入
+        import websockets
+
+        manager = self.manager
+        delay = manager.backoff_initial
+        while not manager._closing:
+            try:
+                async with websockets.connect(manager.url, max_size=None, ping_interval=None) as websocket:
+                    self.websocket = websocket
+                    # 重連後重新訂閱所有錢包和行情
+                    for subscription in list(self.feeds):
+                        await self._send("subscribe", subscription)
+                    for key in list(self.keys):
+                        await self._send("subscribe", _wallet_subscription(key))
+                    delay = manager.backoff_initial
+                    pinger = asyncio.create_task(self._ping())
+                    try:
+                        async for raw in websocket:
+                            manager._dispatch(json.loads(raw))
+                    finally:
+                        pinger.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Connection {self.index} error: {e}")
+            finally:
+                self.websocket = None
+            if manager._closing:
+                break
+            self.reconnects += 1
+            # 指數退避加隨機抖動，避免所有連線同時重連
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, manager.backoff_max)
+
+    async def _send(self, method, subscription):
+        websocket = self.websocket
+        if websocket is None:
+            return
+        try:
+            await websocket.send(json.dumps({"method": method, "subscription": subscription}))
+        except Exception as e:
+            print(f"Connection {self.index} failed to {method} {subscription}: {e}")
+
+    async def _ping(self):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            try:
+                await self.websocket.send(json.dumps({"method": "ping"}))
+            except Exception:
+                return
+
+
+def _wallet_subscription(key):
+    channel, address = key
+    return {"type": channel, "user": address}
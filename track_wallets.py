@@ -1,49 +1,88 @@
-import psycopg2
-import requests
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-# CONFIG
-DB_CONN = "dbname=wallet_tracker user=postgres password="" host=localhost"
+from db import Database
+from fill_store import FillStore
+from hl_client import InfoClient
+from pnl_analytics import wallet_score
+
+# CONFIG (DB_* 環境變量見 db.py)
 WALLETS = [
     # Add your wallet addresses here
     "0x6c92461130429ed99fe6c7c453410bb70ff26e6e",
     "0x55999a9124b976d05a7fd98d414e185d95e9e940",
     "0xf47249e6a3d1326439316f23081810094be53bfc"
 ]
-API_BASE = "http://127.0.0.1:8080"  # Your Flask API base
+WORKERS = 16
+# 計算已實現盈虧只需要最近 30 天的成交
+REALIZED_WINDOW_MS = 30 * 24 * 60 * 60 * 1000
 
-def fetch_wallet_state(address):
-    # Get user state (for unrealized PnL and account value)
-    resp = requests.get(f"{API_BASE}/api/user_state?address={address}")
-    data = resp.json()
+def fetch_wallet_state(info, fill_store, address, now_ms):
+    # Get user state (for unrealized PnL and account value) while fills load from the local store
+    user_state_future = info.submit(info.user_state, address)
+    fills = fill_store.get_fills(info, address, now_ms - REALIZED_WINDOW_MS)
+    # Realized PnL net of fees over the last 30d
+    realized_pnl = wallet_score(fills, now_ms)['pnl_30d']
+    data = user_state_future.result()
     margin = data.get("marginSummary", {})
     unrealized_pnl = sum(float(pos["position"].get("unrealizedPnl", 0)) for pos in data.get("assetPositions", []))
     account_value = float(margin.get("accountValue", 0))
-    # Get realized PnL (sum of closed positions, e.g. last 30d)
-    resp2 = requests.get(f"{API_BASE}/api/pnl_timeseries?address={address}")
-    pnl_data = resp2.json()
-    realized_pnl = sum(day.get("cum_pnl_30d", 0) for day in pnl_data[-1:]) if pnl_data else 0
     # Compute ROE
     roe = (realized_pnl + unrealized_pnl) / account_value if account_value else 0
     return realized_pnl, unrealized_pnl, account_value, roe
 
-def store_snapshot(conn, address, realized_pnl, unrealized_pnl, account_value, roe):
-    with conn.cursor() as cur:
-        cur.execute(
-            """INSERT INTO wallet_snapshots
-            (wallet_address, timestamp, realized_pnl, unrealized_pnl, account_value, roe)
-            VALUES (%s, %s, %s, %s, %s, %s)""",
-            (address, datetime.utcnow(), realized_pnl, unrealized_pnl, account_value, roe)
-        )
-    conn.commit()
+def collect_snapshots(info, fill_store, db, wallets, workers=WORKERS):
+    now_ms = int(time.time() * 1000)
+    timestamp = datetime.utcnow()
+
+    def fetch(address):
+        try:
+            return address, fetch_wallet_state(info, fill_store, address, now_ms)
+        except Exception as e:
+            print(f"Error fetching {address}: {e}")
+            return address, None
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for address, state in pool.map(fetch, wallets):
+            if state is not None:
+                rows.append((address, timestamp, *state))
+    if rows:
+        db.insert_snapshots(rows)
+    return len(rows)
+
+def load_wallets(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
 
 def main():
-    conn = psycopg2.connect(DB_CONN)
-    for address in WALLETS:
-        realized_pnl, unrealized_pnl, account_value, roe = fetch_wallet_state(address)
-        store_snapshot(conn, address, realized_pnl, unrealized_pnl, account_value, roe)
-        print(f"Stored snapshot for {address} at {datetime.utcnow()}")
-    conn.close()
+    parser = argparse.ArgumentParser(description="Store PnL snapshots for a watchlist of wallets")
+    parser.add_argument("--wallets-file", help="file with one wallet address per line (default: WALLETS)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--interval", type=float, default=0, help="seconds between runs; 0 runs once")
+    args = parser.parse_args()
+
+    wallets = load_wallets(args.wallets_file) if args.wallets_file else WALLETS
+    info = InfoClient()
+    fill_store = FillStore()
+    db = Database(minconn=1, maxconn=1)
+    db.ensure_schema()
+    try:
+        next_run = time.monotonic()
+        while True:
+            started = time.monotonic()
+            stored = collect_snapshots(info, fill_store, db, wallets, args.workers)
+            print(f"Stored {stored}/{len(wallets)} snapshots at {datetime.utcnow()} "
+                  f"in {time.monotonic() - started:.1f}s")
+            if not args.interval:
+                break
+            # 固定間隔排程，不受單次耗時影響
+            next_run += args.interval
+            time.sleep(max(0, next_run - time.monotonic()))
+    finally:
+        db.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
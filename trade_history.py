@@ -0,0 +1,104 @@
+import threading
+from bisect import bisect_right
+from collections import deque
+from heapq import merge
+from itertools import islice
+from operator import attrgetter
+
+# 每個錢包保留的最近成交數
+MAX_TRADES = 1000
+
+
+def trade_id(fill):
+    # Hyperliquid 的成交以 tid 唯一標識
+    return fill.get("tid", fill.get("id"))
+
+
+_record_time = attrgetter("time")
+
+
+class TradeRecord:
+    __slots__ = ("time", "tid", "coin", "side", "sz", "px")
+
+    def __init__(self, fill):
+        self.time = fill.get("time", 0)
+        self.tid = trade_id(fill)
+        self.coin = fill.get("coin", "Unknown")
+        self.side = fill.get("side", "Unknown")
+        self.sz = fill.get("sz", 0)
+        self.px = fill.get("px", 0)
+
+
+class TradeHistory:
+    """Most recent trades of one wallet, oldest first, bounded to `maxlen`.
+
+    Fills almost always arrive in time order, so inserts are an append; late
+    fills are placed with a binary search. Trade ids leave `known_trades`
+    together with their record, so memory stays flat over long uptimes.
+    `add_trade` returns the stored record, or False for duplicates and fills
+    older than the window.
+    """
+
+    def __init__(self, maxlen=MAX_TRADES):
+        self.maxlen = maxlen
+        self.known_trades = set()
+        self._records = deque()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add_trade(self, trade):
+        record = TradeRecord(trade)
+        if record.tid in self.known_trades:
+            return False
+        records = self._records
+        if len(records) >= self.maxlen and record.time < records[0].time:
+            # 比窗口內最舊的還舊，直接丟棄
+            return False
+        if not records or record.time >= records[-1].time:
+            records.append(record)
+        else:
+            records.insert(bisect_right(records, record.time, key=_record_time), record)
+        self.known_trades.add(record.tid)
+        if len(records) > self.maxlen:
+            self.known_trades.discard(records.popleft().tid)
+        return record
+
+    @property
+    def trades(self):
+        # 新的在前
+        return list(reversed(self._records))
+
+    def newest(self):
+        return reversed(self._records)
+
+
+class TradeHistoryBook:
+    """One bounded TradeHistory per wallet.
+
+    The ingest thread adds trades while request threads read them, so both go
+    through a lock; readers copy the deques under it and merge the copies.
+    """
+
+    def __init__(self, maxlen=MAX_TRADES):
+        self.maxlen = maxlen
+        self.histories = {}
+        self._lock = threading.Lock()
+
+    def add_trade(self, address, trade):
+        address = address.lower()
+        with self._lock:
+            history = self.histories.get(address)
+            if history is None:
+                history = self.histories[address] = TradeHistory(self.maxlen)
+            return history.add_trade(trade)
+
+    def trades(self, address=None, limit=MAX_TRADES):
+        with self._lock:
+            if address is not None:
+                history = self.histories.get(address.lower())
+                return list(islice(history.newest(), limit)) if history else []
+            snapshots = [h.trades for h in self.histories.values()]
+        # 合併所有錢包，按時間倒序；在鎖外合併，不阻塞寫入
+        newest = merge(*snapshots, key=_record_time, reverse=True)
+        return list(islice(newest, limit))
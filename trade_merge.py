@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+HOUR_MS = 60 * 60 * 1000
+
+FILL_COLUMNS = ['coin', 'dir', 'time', 'sz', 'px', 'closedPnl']
+MERGED_COLUMNS = ['coin', 'action', 'hour', 'sz', 'px', 'closedPnl', 'count', 'last_time']
+
+
+def merge_fills_by_hour(fills):
+    """Merge fills into (coin, dir, hour) buckets, newest bucket first.
+
+    `fills` is a list of fill dicts or a DataFrame with FILL_COLUMNS. Returns a
+    DataFrame with MERGED_COLUMNS; `px` is the size-weighted average price.
+    """
+    if len(fills) == 0:
+        return pd.DataFrame(columns=MERGED_COLUMNS)
+    raw = fills if isinstance(fills, pd.DataFrame) else pd.DataFrame.from_records(fills, columns=FILL_COLUMNS)
+    t = raw['time'].fillna(0).to_numpy(dtype=np.int64)
+    sz = pd.to_numeric(raw['sz']).fillna(0).to_numpy(dtype=np.float64)
+    px = pd.to_numeric(raw['px']).fillna(0).to_numpy(dtype=np.float64)
+    abs_sz = np.abs(sz)
+    frame = pd.DataFrame({
+        'coin': raw['coin'].fillna('Unknown'),
+        'action': raw['dir'].fillna(''),
+        # 向下取整到小時
+        'hour': t - t % HOUR_MS,
+        'sz': sz,
+        'closedPnl': pd.to_numeric(raw['closedPnl']).fillna(0).to_numpy(dtype=np.float64),
+        'px_sum': px * abs_sz,
+        'px_weight': abs_sz,
+        'time': t,
+    })
+    merged = frame.groupby(['coin', 'action', 'hour'], sort=False).agg(
+        sz=('sz', 'sum'),
+        closedPnl=('closedPnl', 'sum'),
+        px_sum=('px_sum', 'sum'),
+        px_weight=('px_weight', 'sum'),
+        count=('time', 'size'),
+        last_time=('time', 'max'),
+    ).reset_index()
+    weight = merged['px_weight'].to_numpy()
+    merged['px'] = np.divide(merged['px_sum'].to_numpy(), weight, out=np.zeros_like(weight), where=weight != 0)
+    # 用 last_time 倒序排序
+    merged = merged.sort_values('last_time', ascending=False, kind='stable', ignore_index=True)
+    return merged[MERGED_COLUMNS]
+
+
+def iter_merged(merged, start=0, stop=None, epoch_ms=False, chunk=1000):
+    """Yield merged rows as dicts, formatting `chunk` rows at a time.
+
+    With `epoch_ms` the timestamp is the bucket's hour in epoch ms and is left
+    for the client to format.
+    """
+    stop = len(merged) if stop is None else min(stop, len(merged))
+    for offset in range(start, stop, chunk):
+        rows = merged.iloc[offset:min(offset + chunk, stop)]
+        columns = [rows[c].tolist() for c in MERGED_COLUMNS]
+        for coin, action, hour, sz, px, closed_pnl, count, last_time in zip(*columns):
+            yield {
+                'timestamp': hour if epoch_ms else datetime.fromtimestamp(hour / 1000).strftime('%Y-%m-%d %H:00:00'),
+                'coin': coin,
+                'action': action,
+                'sz': sz,
+                'px': px,
+                'closedPnl': closed_pnl,
+                'count': count,
+                'last_time': last_time
+            }
+
+
+def page_of_merged(merged, page, limit):
+    # 只格式化當前頁的資料
+    return list(iter_merged(merged, (page - 1) * limit, page * limit))
@@ -1,9 +1,10 @@
 import asyncio
-import json
-import websockets
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from co_entry import CoEntryDetector, describe
+from subscription_manager import SubscriptionManager
+from trade_history import TradeHistory
 
 # Load environment variables
 load_dotenv()
@@ -12,31 +13,18 @@ load_dotenv()
 WS_URL = "wss://api.hyperliquid.xyz/ws"
 
 class WalletTracker:
-    def __init__(self, wallet_address):
+    def __init__(self, wallet_address, detector=None):
         self.wallet_address = wallet_address
-        self.known_trades = set()
+        self.history = TradeHistory()
+        # 所有錢包共用一個偵測器
+        self.detector = detector
 
-    async def connect_and_subscribe(self):
-        async with websockets.connect(WS_URL) as websocket:
-            # Subscribe to user events
-            subscribe_message = {
-                "method": "subscribe",
-                "params": {
-                    "type": "user_events",
-                    "user": self.wallet_address
-                }
-            }
-            
-            await websocket.send(json.dumps(subscribe_message))
-            print(f"Tracking wallet: {self.wallet_address}")
-            
-            while True:
-                try:
-                    response = await websocket.recv()
-                    await self.process_message(json.loads(response))
-                except Exception as e:
-                    print(f"Error: {e}")
-                    break
+    def track(self, manager):
+        manager.add_wallet(self.wallet_address, self.handle_fills)
+        print(f"Tracking wallet: {self.wallet_address}")
+
+    async def handle_fills(self, address, fills):
+        await self.process_message({"data": {"fills": fills}})
 
     async def process_message(self, message):
         if "data" not in message:
@@ -47,17 +35,19 @@ class WalletTracker:
         # Process different types of events
         if "fills" in data:
             for fill in data["fills"]:
-                trade_id = fill.get("id")
-                if trade_id not in self.known_trades:
-                    self.known_trades.add(trade_id)
+                if self.history.add_trade(fill):
                     await self.process_trade(fill)
+                    if self.detector is not None:
+                        signal = self.detector.add(self.wallet_address, fill)
+                        if signal is not None:
+                            print(f"\nCo-entry: {describe(signal)}")
 
     async def process_trade(self, trade):
         timestamp = datetime.fromtimestamp(trade.get("time", 0) / 1000)
         coin = trade.get("coin", "Unknown")
         side = trade.get("side", "Unknown")
-        size = trade.get("size", 0)
-        price = trade.get("price", 0)
+        size = trade.get("sz", 0)
+        price = trade.get("px", 0)
         
         print(f"\nNew Trade Detected:")
         print(f"Time: {timestamp}")
@@ -68,13 +58,16 @@ class WalletTracker:
         print("-" * 50)
 
 async def main():
-    # Get wallet address from environment variable or use default
-    wallet_address = 0xd5f7974e1be5b336094a18c230f39607934e367d
-    if not wallet_address:
-        wallet_address = input("Enter the wallet address to track: ")
+    # Get wallet addresses from environment variable (comma separated) or prompt
+    wallet_addresses = [a.strip() for a in os.getenv("WALLET_ADDRESSES", "").split(",") if a.strip()]
+    if not wallet_addresses:
+        wallet_addresses = [input("Enter the wallet address to track: ")]
     
-    tracker = WalletTracker(wallet_address)
-    await tracker.connect_and_subscribe()
+    manager = SubscriptionManager(WS_URL)
+    detector = CoEntryDetector()
+    for wallet_address in wallet_addresses:
+        WalletTracker(wallet_address, detector).track(manager)
+    await manager.run()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
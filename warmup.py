@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 同時執行的預熱步驟數
+WARMUP_WORKERS = int(os.getenv('WARMUP_WORKERS', '8'))
+
+_UNSET = object()
+
+
+class Lazy:
+    """A value built by `factory` on its first call, once, from any thread.
+
+    app.py keeps components whose modules import pandas, numpy or pyarrow
+    behind one of these, so importing the app does not load them; the warm-up
+    phase or the first route that needs the component builds it.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = _UNSET
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        value = self._value
+        if value is _UNSET:
+            with self._lock:
+                if self._value is _UNSET:
+                    self._value = self.factory()
+                value = self._value
+        return value
+
+    @property
+    def loaded(self):
+        return self._value is not _UNSET
+
+    def peek(self, default=None):
+        # 不觸發建構，給 /metrics 用
+        return default if self._value is _UNSET else self._value
+
+
+class WarmUp:
+    """Named start-up steps run concurrently in the background, plus a readiness flag.
+
+    The server listens as soon as it starts and /readyz answers 503 until every
+    step has finished. A failed step is reported in `status()` but does not
+    hold readiness back, so an unreachable dependency only degrades the routes
+    that use it.
+    """
+
+    def __init__(self, workers=WARMUP_WORKERS):
+        self.workers = workers
+        self.steps = []
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+        self.ready = threading.Event()
+        self._thread = None
+
+    def add(self, name, func, *args):
+        self.steps.append((name, func, args))
+
+    def run(self):
+        self.started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='warmup') as pool:
+            for name, func, args in self.steps:
+                pool.submit(self._run_step, name, func, args)
+        self.finished_at = time.monotonic()
+        self.ready.set()
+        failed = [name for name, result in self.results.items() if result['error']]
+        print(f"Warm-up finished in {self.finished_at - self.started_at:.2f}s"
+              + (f", failed steps: {', '.join(failed)}" if failed else ""))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def status(self):
+        if self.started_at is None:
+            seconds = None
+        else:
+            seconds = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+        return {
+            'ready': self.ready.is_set(),
+            'seconds': seconds,
+            'steps': {name: self.results.get(name, {'seconds': None, 'error': None}) for name, _, _ in self.steps},
+        }
+
+    def _run_step(self, name, func, args):
+        started = time.monotonic()
+        error = None
+        try:
+            func(*args)
+        except Exception as e:
+            error = str(e)
+            print(f"Warm-up step {name} failed: {e}")
+        self.results[name] = {'seconds': round(time.monotonic() - started, 3), 'error': error}